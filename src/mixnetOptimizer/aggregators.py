@@ -0,0 +1,90 @@
+"""
+Incremental aggregators of the observer. Every update takes constant time and memory does not grow
+with the number of events, so the observer keeps up with the event rate of large mixnets.
+"""
+
+# Mean of the latest values of a fixed set of keys, e.g. the current entropy of each node. Keys that
+# have not reported yet count as 0.
+class RunningMean:
+
+    # keys - all the keys that contribute to the mean.
+    def __init__(self, keys : list):
+        self.__values = dict([(key, 0.) for key in keys])
+        self.__total  = 0.
+
+    # Replace the value of a key.
+    def update(self, key, value : float):
+        self.__total       += value - self.__values[key]
+        self.__values[key]  = value
+
+    @property
+    def mean(self,) -> float:
+        return self.__total / len(self.__values) if self.__values else 0.
+
+# Histogram of latencies in the spirit of HdrHistogram. Values are recorded in microseconds into
+# log-linear buckets: each power of 2 is split into the same number of linear sub-buckets, so every
+# recorded value is kept with a bounded relative error (below 1 / 2^(subBucketBits - 1)), whatever
+# its magnitude. The count, the mean, the minimum and the maximum are exact.
+class LatencyHistogram:
+
+    # subBucketBits - the number of linear sub-buckets of each power of 2 is 2^(subBucketBits - 1).
+    #                 7 keeps the relative error below 1.6%.
+    def __init__(self, subBucketBits : int = 7):
+        self.__subBits = subBucketBits
+        self.__half    = 1 << (subBucketBits - 1)
+        self.__counts  = []
+
+        self.count = 0
+        self.total = 0.
+        self.min   = float('inf')
+        self.max   = 0.
+
+    # Record a single latency in seconds.
+    def record(self, latency : float):
+        bucket = self.__bucket(max(0, int(latency * 1e6)))
+
+        if bucket >= len(self.__counts):
+            self.__counts += [0] * (bucket + 1 - len(self.__counts))
+
+        self.__counts[bucket] += 1
+
+        self.count += 1
+        self.total += latency
+        self.min    = min(self.min, latency)
+        self.max    = max(self.max, latency)
+
+    @property
+    def mean(self,) -> float:
+        return self.total / self.count if self.count > 0 else 0.
+
+    # The latency in seconds below which the given fraction of the recorded latencies falls.
+    # quantile - between 0 and 1, e.g. 0.99 for p99.
+    def percentile(self, quantile : float) -> float:
+        if self.count == 0:
+            return 0.
+
+        rank       = max(1, int(quantile * self.count + 0.5))
+        cumulative = 0
+
+        for bucket, count in enumerate(self.__counts):
+            cumulative += count
+
+            if cumulative >= rank:
+                return min(self.__upperBound(bucket) / 1e6, self.max)
+
+        return self.max
+
+    # Values below 2^subBits map to themselves. Larger values keep their subBits most significant
+    # bits, which lie in [half, 2 * half), shifted by shift bits; such buckets start right after the
+    # ones of the smaller shift.
+    def __bucket(self, value : int) -> int:
+        shift = max(0, value.bit_length() - self.__subBits)
+
+        return (value >> shift) + shift * self.__half
+
+    # The largest value in microseconds that falls into the bucket.
+    def __upperBound(self, bucket : int) -> int:
+        shift = max(0, (bucket - self.__half) // self.__half)
+        sub   = bucket - shift * self.__half
+
+        return ((sub + 1) << shift) - 1
@@ -0,0 +1,209 @@
+from json      import dump
+from numpy     import r_
+from numpy     import inf
+from numpy     import full
+from numpy     import diff
+from numpy     import dtype
+from numpy     import empty
+from numpy     import array
+from numpy     import memmap
+from numpy     import unique
+from numpy     import lexsort
+from numpy     import maximum
+from numpy     import minimum
+from numpy     import ndarray
+from numpy     import bincount
+from numpy     import fromiter
+from numpy     import frombuffer
+from numpy     import percentile
+from numpy     import flatnonzero
+from numpy     import concatenate
+from eventlog  import RECORD
+from eventlog  import ENTITY_KINDS
+from eventlog  import encodeEntity
+from eventlog  import decodeEntity
+from constants import TYPE_TO_ID
+from constants import ID_TO_TYPE
+from constants import ANALYZER_CHUNK
+
+"""
+Offline analysis of the packet logs. A log is loaded into a single structured array, the binary
+event log is memory-mapped as it is, the text log is parsed in chunks of lines. Packets are joined by
+their message ID and split, all the statistics are then computed with vectorized operations.
+"""
+
+# The records of the binary event log (eventlog.RECORD) as a NumPy structured type. The text log is
+# converted to the same type.
+LOG_DTYPE = dtype({ 'names'    : ['time', 'sender', 'receiver', 'msgId', 'split', 'type'],
+                    'formats'  : ['<f8', '<u4', '<u4', 'V12', '<u4', 'u1'],
+                    'offsets'  : [0, 8, 12, 16, 28, 32],
+                    'itemsize' : RECORD.size })
+
+# Identifies a packet: all the log records of a packet share its message ID and split.
+PACKET_DTYPE = dtype([('msgId', 'V12'), ('split', '<u4')])
+
+USER     = ENTITY_KINDS.index('u')
+MIX      = ENTITY_KINDS.index('m')
+PROVIDER = ENTITY_KINDS.index('p')
+
+"""
+PRIVATE
+"""
+
+# Convert parsed lines of the text log to records.
+def __toRecords(lines : list) -> ndarray:
+    records = empty(len(lines), dtype=LOG_DTYPE)
+
+    if not lines:
+        return records
+
+    times, senders, receivers, msgIds, splits, types = zip(*lines)
+
+    records['time'    ] = fromiter(map(float, times), dtype='<f8', count=len(lines))
+    records['sender'  ] = fromiter(map(encodeEntity, senders), dtype='<u4', count=len(lines))
+    records['receiver'] = fromiter(map(encodeEntity, receivers), dtype='<u4', count=len(lines))
+    records['msgId'   ] = frombuffer(bytes.fromhex(''.join(msgIds)), dtype='V12')
+    records['split'   ] = fromiter(map(int, splits), dtype='<u4', count=len(lines))
+    records['type'    ] = fromiter([TYPE_TO_ID[ofType] for ofType in types], dtype='u1', count=len(lines))
+
+    return records
+
+def __loadText(path : str, chunk : int) -> ndarray:
+    chunks = []
+    lines  = []
+
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+
+            # Only the packet records, the logging prefix (e.g. INFO:root:) is dropped.
+            fields = line[line.rfind(':', 0, line.find(' ')) + 1:].split()
+
+            if len(fields) != 6:
+                continue
+
+            lines += [fields]
+
+            if len(lines) == chunk:
+                chunks += [__toRecords(lines)]
+                lines   = []
+
+    chunks += [__toRecords(lines)]
+
+    return concatenate(chunks)
+
+# Summary statistics of an array of values.
+def __describe(values : ndarray) -> dict:
+    if len(values) == 0:
+        return { 'count' : 0 }
+
+    p50, p95, p99 = percentile(values, [50, 95, 99])
+
+    return { 'count' : int(len(values)),
+             'mean'  : float(values.mean()),
+             'p50'   : float(p50),
+             'p95'   : float(p95),
+             'p99'   : float(p99),
+             'max'   : float(values.max()) }
+
+"""
+PUBLIC
+"""
+
+# Load a packet log. Binary event logs (.bin) are memory-mapped, text logs are parsed in chunks.
+# chunk - the number of lines of a text log converted at once.
+def loadLog(path : str, chunk : int = ANALYZER_CHUNK) -> ndarray:
+    if path.endswith('.bin'):
+        records = memmap(path, dtype='u1', mode='r')
+
+        # A record cut off at the end of the file, e.g. by a crash, is skipped.
+        return records[:len(records) - len(records) % RECORD.size].view(LOG_DTYPE)
+
+    return __loadText(path, chunk)
+
+# Compute the summary of a run from its log records.
+# return - dictionary with:
+#              - records, duration - the number of records and the seconds between the first and
+#                the last one.
+#              - volumes - the number of records of each message type.
+#              - packets - per message type, the statistics of the time between the first and the
+#                last record of a packet.
+#              - hops - the statistics of the time a packet spends in a mix and in a provider, the
+#                time between the records of two consecutive hops.
+#              - messages - the number of LEGIT messages sent and delivered, with all their splits,
+#                and the statistics of their E2E latency.
+#              - throughput - the packets sent per second by each node.
+def analyze(records : ndarray) -> dict:
+    summary = { 'records' : int(len(records)) }
+
+    if len(records) == 0:
+        return summary
+
+    times     = array(records['time'])
+    senders   = array(records['sender'])
+    receivers = array(records['receiver'])
+    types     = array(records['type'])
+    duration  = float(times.max() - times.min())
+
+    summary['duration'] = duration
+    summary['volumes' ] = dict([(ID_TO_TYPE[idx], int(count)) for idx, count in enumerate(bincount(types, minlength=len(ID_TO_TYPE)))])
+
+    # Join the records of each packet and order them by time.
+    keys            = empty(len(records), dtype=PACKET_DTYPE)
+    keys['msgId']   = records['msgId']
+    keys['split']   = records['split']
+    _, packet       = unique(keys, return_inverse=True)
+    order           = lexsort((times, packet))
+    times           = times[order]
+    packet          = packet[order]
+    senders         = senders[order]
+    receivers       = receivers[order]
+    types           = types[order]
+
+    # Per-hop delay - the time between two consecutive records of the same packet, the second one
+    # logged by the node that held the packet.
+    samePacket      = packet[1:] == packet[:-1]
+    hopDelays       = diff(times)[samePacket]
+    hopKinds        = senders[1:][samePacket] >> 24
+    summary['hops'] = { 'mix'      : __describe(hopDelays[hopKinds == MIX]),
+                        'provider' : __describe(hopDelays[hopKinds == PROVIDER]) }
+
+    # First and last record of each packet.
+    firsts      = flatnonzero(r_[True, ~samePacket])
+    lasts       = r_[firsts[1:] - 1, len(times) - 1]
+    packetTimes = times[lasts] - times[firsts]
+    packetTypes = types[firsts]
+
+    summary['packets'] = dict([(ID_TO_TYPE[idx], __describe(packetTimes[packetTypes == idx])) for idx in ID_TO_TYPE])
+
+    # A LEGIT packet is delivered when its last record is from a provider to a user.
+    legit     = packetTypes == TYPE_TO_ID['LEGIT']
+    delivered = (senders[lasts] >> 24 == PROVIDER) & (receivers[lasts] >> 24 == USER)
+
+    # Join the LEGIT packets of each message. A message is delivered once all of its splits are.
+    _, message = unique(keys[order][firsts][legit]['msgId'], return_inverse=True)
+    numMsgs    = int(message.max()) + 1 if len(message) > 0 else 0
+    sent       = full(numMsgs, inf)
+    received   = full(numMsgs, -inf)
+
+    minimum.at(sent, message, times[firsts][legit])
+    maximum.at(received, message, times[lasts][legit])
+
+    complete            = bincount(message, weights=(~delivered[legit]).astype(float), minlength=numMsgs) == 0
+    summary['messages'] = { 'sent'      : numMsgs,
+                            'delivered' : int(complete.sum()),
+                            'latency'   : __describe((received - sent)[complete]) }
+
+    # Packets sent by each node per second.
+    nodes, counts         = unique(senders[senders >> 24 != USER], return_counts=True)
+    summary['throughput'] = dict([(decodeEntity(int(node)), float(count) / max(duration, 1e-9)) for node, count in zip(nodes, counts)])
+
+    return summary
+
+# Analyze a packet log and write the summary to a JSON file.
+def summarize(path : str, output : str) -> dict:
+    summary = analyze(loadLog(path))
+
+    with open(output, 'w', encoding='utf-8') as file:
+        dump(summary, file, indent=4)
+
+    return summary
@@ -0,0 +1,21 @@
+from argparse import ArgumentParser
+from analysis import summarize
+
+"""
+Summarizes the packet log of a run: E2E latencies, per-hop delays, traffic volumes per type and the 
+throughput of the nodes.
+"""
+
+if __name__ == "__main__":
+    
+    # Get command line arguments.
+    parser = ArgumentParser()
+
+    parser.add_argument('--log',    type=str, default="../../logs/logs.log")
+    parser.add_argument('--output', type=str, default="../../logs/summary.json")
+
+    args   = parser.parse_args()
+    log    = args.log
+    output = args.output
+
+    summarize(log, output)
@@ -0,0 +1,444 @@
+from pki                    import CompiledPKI
+from time                   import time
+from util                   import unwrapPacket
+from util                   import updateEntropy
+from util                   import generateMessage
+from queue                  import SimpleQueue
+from decoys                 import DecoyPool
+from typing                 import Callable
+from asyncio                import run
+from asyncio                import Event
+from asyncio                import sleep
+from asyncio                import gather
+from asyncio                import StreamReader
+from asyncio                import StreamWriter
+from asyncio                import wait_for
+from asyncio                import create_task
+from asyncio                import start_server
+from asyncio                import get_running_loop
+from asyncio                import wrap_future
+from asyncio                import IncompleteReadError
+from asyncio                import TimeoutError as WaitTimeout
+from replay                 import ReplayCache
+from eventlog               import logEvent
+from constants              import REPLAY_EPOCH
+from constants              import REPLAY_CAPACITY
+from constants              import NODE_PORT_BASE
+from constants              import LEGIT_LAG
+from parameters             import ParameterStore
+from randomness             import workerStream
+from processing             import ProcessingPool
+from collections            import deque
+from connections            import FRAME_HEADER
+from connections            import AsyncConnectionPool
+from concurrent.futures     import ThreadPoolExecutor
+from petlib.bn              import Bn
+from sphinxmix.SphinxParams import SphinxParams
+from sphinxmix.SphinxClient import Dest_flag
+from sphinxmix.SphinxClient import Relay_flag
+
+"""
+asyncio simulation engine. All the nodes and clients run as coroutines of a single event loop instead
+of a thread per client and two per node. Clients and mixes wake up exactly at their timers, nodes
+serve their connections with asyncio streams and the CPU heavy Sphinx work is offloaded to an
+executor. Nodes and clients keep the semantics and the logging format of the threaded Node and
+Client.
+"""
+
+# Event loop shared by the asyncio nodes and clients. Holds the current mixnet parameters, the
+# executor for the Sphinx work and the pooled connections to the nodes.
+class AsyncMixnet:
+
+    # parameters - store of the mixnet parameters shared with the optimizer. Parameter updates are
+    #              applied to all the coroutines at once, its shutdown event terminates the mixnet.
+    # workers    - the number of threads of the executor that does the Sphinx work.
+    def __init__(self, parameters : ParameterStore, workers : int = 4):
+        self.lambdas     = parameters.current.lambdas
+        self.executor    = ThreadPoolExecutor(max_workers=workers)
+        self.connections = AsyncConnectionPool()
+
+        self.__version    = parameters.current.version
+        self.__parameters = parameters
+        self.__numWorkers = 0
+
+    # Run the nodes and clients until the optimizer terminates the mixnet.
+    def run(self, nodes : list, clients : list):
+        self.__numWorkers = len(nodes) + len(clients)
+
+        run(self.__main(nodes, clients))
+
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # Run a CPU heavy function in the executor.
+    async def offload(self, function : Callable, *args):
+        return await get_running_loop().run_in_executor(self.executor, function, *args)
+
+    async def __main(self, nodes : list, clients : list):
+        for node in nodes:
+            await node.listen()
+
+        tasks = [create_task(worker.start()) for worker in nodes + clients]
+
+        await self.__commands()
+
+        # Gracefully shut down all the coroutines.
+        for task in tasks:
+            task.cancel()
+
+        await gather(*tasks, return_exceptions=True)
+
+        for node in nodes:
+            node.close()
+
+        self.connections.close()
+
+    # Follow the optimizer's parameter updates until the shutdown. A single coroutine updates the
+    # parameters for all the workers of the event loop. It sleeps until the optimizer publishes, the
+    # store wakes it up from the optimizer's thread.
+    async def __commands(self,):
+        loop    = get_running_loop()
+        changed = Event()
+        notify  = lambda : loop.call_soon_threadsafe(changed.set)
+
+        self.__parameters.subscribe(notify)
+
+        try:
+            while not self.__parameters.shutdown.is_set():
+                current = self.__parameters.current
+
+                if self.__version != current.version:
+                    self.lambdas   = current.lambdas
+                    self.__version = current.version
+
+                    self.__parameters.acknowledge(current.version, self.__numWorkers)
+
+                await changed.wait()
+                changed.clear()
+        finally:
+            self.__parameters.unsubscribe(notify)
+
+# asyncio counterpart of Node. Arguments are the same as in Node, except:
+# mixnet - the AsyncMixnet that runs the node.
+class AsyncNode:
+
+    def __init__(self,
+                 layer      : int,
+                 nodeId     : str,
+                 params     : SphinxParams,
+                 bodySize   : int,
+                 eventQueue : SimpleQueue,
+                 mixnet     : AsyncMixnet,
+                 portBase   : int = NODE_PORT_BASE,
+                 secretKey  : Bn = None):
+
+        # For entropy computation.
+        self.__h = 0
+        self.__k = 0
+        self.__l = 0
+
+        self.__port       = portBase + int(nodeId[1:])
+        self.__tasks      = set()
+        self.__layer      = layer
+        self.__mixnet     = mixnet
+        self.__params     = params
+        self.__nodeId     = nodeId
+        self.__queued     = 0
+        self.__server     = None
+        self.__bodySize   = bodySize
+        self.__tagCache   = ReplayCache(REPLAY_CAPACITY, REPLAY_EPOCH, time())
+        self.__random     = workerStream(nodeId)
+        self.__decoyPool  = None
+        self.__eventQueue = eventQueue
+        self.__processing = None
+
+        # Generate key pair.
+        self.__secretKey = params.group.gensecret() if secretKey is None else secretKey
+        self.__publicKey = params.group.expon(params.group.g, [ self.__secretKey ])
+        self.__secretHex = self.__secretKey.hex()
+
+    # Export minimal node PKI info in a dict.
+    def toPKIView(self,) -> dict:
+        node              = dict()
+        node['port'     ] = self.__port
+        node['layer'    ] = self.__layer
+        node['nodeId'   ] = self.__nodeId
+        node['publicKey'] = self.__publicKey.export().hex()
+
+        return node
+
+    # Counters of the replay tag cache.
+    def replayStats(self,) -> dict:
+        return self.__tagCache.stats()
+
+    def setPKI(self, pki : CompiledPKI):
+        self.__pki = pki
+
+    def setDecoyPool(self, decoyPool : DecoyPool):
+        self.__decoyPool = decoyPool
+
+    # processing - optional pool of worker processes that unwraps the received packets instead of
+    #              the mixnet's thread executor.
+    def setProcessingPool(self, processing : ProcessingPool):
+        self.__processing = processing
+
+    async def listen(self,):
+        self.__server = await start_server(self.__serve, '127.0.0.1', self.__port)
+
+    def close(self,):
+        self.__server.close()
+
+    # Emit the LOOP_MIX decoy traffic. Providers only relay packets.
+    async def start(self,):
+        if self.__layer == 0:
+            return
+
+        while True:
+            await sleep(self.__random.exponential(self.__mixnet.lambdas['LOOP_MIX']))
+
+            data = None
+
+            if self.__decoyPool is not None:
+                data = self.__decoyPool.pop(self.__nodeId, 'LOOP_MIX')
+
+            # No pool or no pre-generated packet ready.
+            if data is None:
+                splits = await self.__mixnet.offload(generateMessage,
+                                                     self.__pki,
+                                                     self.__nodeId,
+                                                     'LOOP_MIX',
+                                                     self.__params,
+                                                     self.__bodySize,
+                                                     self.__bodySize,
+                                                     self.__mixnet.lambdas['DELAY'],
+                                                     None,
+                                                     None,
+                                                     self.__random)
+                data   = splits[0]
+
+            await self.__send(data)
+
+    # Serve a single persistent connection of framed packets.
+    async def __serve(self, reader : StreamReader, writer : StreamWriter):
+        try:
+            while True:
+                header = await reader.readexactly(FRAME_HEADER.size)
+                packet = await reader.readexactly(FRAME_HEADER.unpack(header)[0])
+
+                await self.__processPacket(packet)
+
+        # The peer closed the connection.
+        except (IncompleteReadError, ConnectionError):
+            pass
+
+        finally:
+            writer.close()
+
+    # Processes a single Sphinx packet.
+    async def __processPacket(self, data : bytes):
+        if self.__processing is not None:
+            tag, flag, routing = await wrap_future(self.__processing.future(self.__secretHex, data))
+        else:
+            tag, flag, routing = await self.__mixnet.offload(unwrapPacket, self.__params, self.__secretKey, data)
+
+        # Check for tagging and replay attacks.
+        if self.__tagCache.seen(tag, time()):
+            print('REPLAY ATTACK')
+            return
+
+        if flag == Relay_flag:
+            delay      = routing[2]
+            queueTuple = (routing[0], routing[1], routing[3], routing[4], routing[5])
+
+            # Keep a reference to the task, the event loop only keeps a weak one.
+            task = create_task(self.__relay(delay, queueTuple))
+
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+            self.__k      += 1
+            self.__queued += 1
+
+        elif flag == Dest_flag:
+            destination = routing[0]
+            msgId       = routing[1]
+            split       = routing[2]
+            ofType      = routing[3]
+            now         = time()
+
+            # Log packet delivery.
+            logEvent(now, self.__nodeId, destination, msgId, split, ofType)
+
+            # Inform the optimizer that a LEGIT packet is ready for the delivery to a user.
+            if ofType == 'LEGIT':
+                self.__eventQueue.put((msgId, "{:.7f}".format(now)))
+
+    # Hold a relayed packet for its delay, send it and update the entropy of the mix.
+    async def __relay(self, delay : float, data : tuple):
+        await sleep(delay)
+
+        self.__queued -= 1
+
+        await self.__send(data)
+
+        if self.__k != 0 or self.__l != 0:
+            h_t = updateEntropy(self.__h, self.__k, self.__l)
+
+            # Inform the optimizer about the current entropy level.
+            self.__eventQueue.put((self.__nodeId, h_t))
+
+            self.__h = h_t
+            self.__l = self.__queued
+            self.__k = 0
+
+    async def __send(self, data : tuple):
+        packet   = data[0]
+        nextNode = data[1]
+        msgId    = data[2]
+        split    = data[3]
+        ofType   = data[4]
+
+        await self.__mixnet.connections.send(packet, self.__pki.port(nextNode))
+
+        # Logging.
+        now = time()
+
+        logEvent(now, self.__nodeId, nextNode, msgId, split, ofType)
+
+# asyncio counterpart of Client. Arguments are the same as in Client, except:
+# mixnet - the AsyncMixnet that runs the client.
+class AsyncClient:
+
+    def __init__(self,
+                 userId       : str,
+                 bodySize     : int,
+                 rawMails     : list,
+                 eventQueue   : SimpleQueue,
+                 providerPort : int,
+                 msgGenerator : Callable,
+                 decoyPool    : DecoyPool,
+                 mixnet       : AsyncMixnet):
+        self.__mixnet       = mixnet
+        self.__userId       = userId
+        self.__bodySize     = bodySize
+        self.__decoyPool    = decoyPool
+        self.__eventQueue   = eventQueue
+        self.__msgGenerator = msgGenerator
+        self.__messageQueue = deque()
+        self.__providerPort = providerPort
+        self.__random       = workerStream(userId)
+
+        # Schedule the LEGIT emails for sending after the initial LEGIT_LAG, in the sending order.
+        mails           = sorted(rawMails, key=lambda mail : mail['time'])
+        self.__start    = time()
+        self.__rawMails = deque([(self.__start + mail['time'] + LEGIT_LAG, mail) for mail in mails])
+
+        # Set from the feeder's thread when a mail is scheduled, it wakes up the client sleeping on
+        # its timers. Created once the event loop runs.
+        self.__loop   = None
+        self.__mailed = None
+
+    # Schedule a LEGIT email streamed in from a traces file. The mails arrive in the sending order.
+    # Called from the feeder's thread, appending to a deque is atomic. A client that did not start yet
+    # finds the mail when it does.
+    def schedule(self, mail : dict):
+        self.__rawMails.append((self.__start + mail['time'] + LEGIT_LAG, mail))
+
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__mailed.set)
+
+    # Simulate a client. Sleep until the earliest timer or LEGIT mail is due.
+    async def start(self,):
+        lambdas       = self.__mixnet.lambdas
+        self.__mailed = Event()
+        self.__loop   = get_running_loop()
+
+        # Dictionary of times at which the next packet of a given type should be emitted.
+        timers          = dict()
+        timers['DROP' ] = time() + self.__random.exponential(lambdas['DROP'])
+        timers['LOOP' ] = time() + self.__random.exponential(lambdas['LOOP'])
+        timers['LEGIT'] = time() + self.__random.exponential(lambdas['LEGIT'])
+
+        while True:
+            lambdas = self.__mixnet.lambdas
+
+            # Convert the due LEGIT mail to Sphinx packets and put them on the sending queue.
+            if self.__rawMails and self.__rawMails[0][0] < time():
+                mail   = self.__rawMails.popleft()[1]
+                splits = await self.__mixnet.offload(self.__msgGenerator,
+                                                     self.__userId,
+                                                     'LEGIT',
+                                                     mail['size'],
+                                                     lambdas['DELAY'],
+                                                     mail['receiver'],
+                                                     self.__random)
+
+                for split in splits:
+                    self.__messageQueue.append(split + (len(splits), ))
+
+                continue
+
+            updateType = min(timers, key=timers.get)
+            wakeUp     = timers[updateType]
+
+            if self.__rawMails:
+                wakeUp = min(wakeUp, self.__rawMails[0][0])
+
+            # Sleep until the wake up, or until a new mail is scheduled, it may be due earlier.
+            if wakeUp > time():
+                try:
+                    await wait_for(self.__mailed.wait(), wakeUp - time())
+                except WaitTimeout:
+                    pass
+
+                self.__mailed.clear()
+                continue
+
+            legitSend = updateType == 'LEGIT' and len(self.__messageQueue) > 0
+
+            # Send a LEGIT message if there is one, a DROP packet in its place otherwise.
+            if legitSend:
+                data = self.__messageQueue.popleft()
+            elif updateType == 'LEGIT':
+                data = await self.__decoy('DROP')
+            else:
+                data = await self.__decoy(updateType)
+
+            # Unpack the data for sending.
+            packet   = data[0]
+            nextNode = data[1]
+            msgId    = data[2]
+            split    = data[3]
+            ofType   = data[4]
+
+            await self.__mixnet.connections.send(packet, self.__providerPort)
+
+            # Logging.
+            now = time()
+
+            logEvent(now, self.__userId, nextNode, msgId, split, ofType)
+
+            # Reset the timer for a given message type.
+            timers[updateType] = time() + self.__random.exponential(lambdas[updateType])
+
+            # When LEGIT message was sent inform the optimizer about it through eventQueue.
+            if legitSend:
+                self.__eventQueue.put((msgId, "{:.7f}".format(now), data[5]))
+
+    # Take a pre-generated decoy packet from the pool, generate it in the executor on a miss.
+    async def __decoy(self, ofType : str) -> tuple:
+        data = None
+
+        if self.__decoyPool is not None:
+            data = self.__decoyPool.pop(self.__userId, ofType)
+
+        if data is None:
+            splits = await self.__mixnet.offload(self.__msgGenerator,
+                                                 self.__userId,
+                                                 ofType,
+                                                 self.__bodySize,
+                                                 self.__mixnet.lambdas['DELAY'],
+                                                 None,
+                                                 self.__random)
+            data   = splits[0]
+
+        return data
@@ -0,0 +1,103 @@
+from sys                  import exit
+from time                 import time
+from os.path              import exists
+from platform             import platform
+from platform             import python_version
+from argparse             import ArgumentParser
+from benchmarks.harness   import compare
+from benchmarks.harness   import saveResults
+from benchmarks.harness   import loadResults
+from benchmarks.network   import benchmarkSend
+from benchmarks.engines   import benchmarkEngines
+from benchmarks.packets   import benchmarkProcessing
+from benchmarks.packets   import benchmarkGeneration
+from benchmarks.endToEnd  import benchmarkEndToEnd
+from benchmarks.observing import benchmarkObserver
+
+"""
+Runs the benchmarks, writes their results to a JSON file and compares them with the stored baseline.
+Exits with a non-zero status when any measurement regressed beyond the tolerance.
+"""
+
+SUITES = ['generation', 'processing', 'send', 'observer', 'endToEnd', 'engines']
+
+if __name__ == "__main__":
+    
+    # Get command line arguments.
+    parser = ArgumentParser()
+
+    parser.add_argument('--suites',       type=str,   default=SUITES, nargs='+', choices=SUITES)
+    parser.add_argument('--bodySizes',    type=int,   default=[1024, 4096, 16384], nargs='+')
+    parser.add_argument('--repeat',       type=int,   default=50)
+    parser.add_argument('--seed',         type=int,   default=0)
+    parser.add_argument('--output',       type=str,   default="../../logs/benchmarks.json")
+    parser.add_argument('--baseline',     type=str,   default="benchmarks/baseline.json")
+    parser.add_argument('--tolerance',    type=float, default=0.2)
+    parser.add_argument('--saveBaseline', action='store_true')
+
+    args      = parser.parse_args()
+    suites    = args.suites
+    bodySizes = args.bodySizes
+    repeat    = args.repeat
+    seed      = args.seed
+    results   = dict()
+
+    if 'generation' in suites:
+        results.update(benchmarkGeneration(bodySizes, repeat))
+
+    if 'processing' in suites:
+        results.update(benchmarkProcessing(bodySizes, repeat))
+
+    if 'send' in suites:
+        for bodySize in bodySizes:
+            results.update(benchmarkSend(bodySize, repeat * 10))
+
+    if 'observer' in suites:
+        results.update(benchmarkObserver(repeat * 1000, seed))
+
+    if 'endToEnd' in suites:
+        results.update(benchmarkEndToEnd(seed))
+
+    if 'engines' in suites:
+        results.update(benchmarkEngines(seed))
+
+    report            = dict()
+    report['meta'   ] = { 'time' : time(), 'python' : python_version(), 'platform' : platform(), 'seed' : seed, 'repeat' : repeat }
+    report['results'] = results
+
+    saveResults(args.output, report)
+
+    for name, measurement in results.items():
+        if 'failed' in measurement:
+            print('FAILED', name, measurement['failed'])
+        else:
+            print(name, measurement['value'], measurement['unit'])
+
+    failures = [name for name, measurement in results.items() if 'failed' in measurement]
+
+    # A failed measurement is never saved as the baseline.
+    if args.saveBaseline and failures:
+        print('baseline not saved, failed measurements:', failures)
+
+        exit(1)
+
+    elif args.saveBaseline:
+        saveResults(args.baseline, report)
+
+        print('baseline saved:', args.baseline)
+
+    elif not exists(args.baseline):
+        print('no baseline to compare with, save one with --saveBaseline')
+
+        if failures:
+            exit(1)
+
+    # Fail loudly on the regressions.
+    else:
+        regressions = compare(results, loadResults(args.baseline)['results'], args.tolerance)
+
+        for name, base, value in regressions:
+            print('REGRESSION', name, 'baseline', base, 'now', value)
+
+        if regressions:
+            exit(1)
@@ -0,0 +1,5 @@
+"""
+Reproducible benchmarks of the mixnet: packet generation, per-hop processing, sending a packet,
+observer event handling and an end-to-end run of a small topology on seeded traces. Every benchmark
+module has a run function returning its measurements, see harness.py. Run them with benchmark.py.
+"""
@@ -0,0 +1,89 @@
+from os                  import devnull
+from os.path             import join
+from time                import perf_counter
+from tempfile            import TemporaryDirectory
+from analysis            import loadLog
+from optimizer           import createMixnet
+from contextlib          import redirect_stdout
+from benchmarks.harness  import lower
+from benchmarks.harness  import higher
+from benchmarks.harness  import failed
+from benchmarks.harness  import guarded
+from benchmarks.fixtures import LAYERS
+from benchmarks.fixtures import PROVIDERS
+from benchmarks.fixtures import RUN_TIMEOUT
+from benchmarks.fixtures import seededTraces
+from benchmarks.fixtures import NODES_PER_LAYER
+
+"""
+End-to-end run of the fixed small topology on seeded traces. The discrete-event simulation runs it
+as fast as the CPU allows, so the packets per second measure the whole packet path of the mixnet:
+generation, unwrapping, relaying and logging. The runs are guarded by a wall-clock timeout, a run that
+hangs is a failed measurement.
+"""
+
+"""
+PUBLIC
+"""
+
+# The names of the measurements of a run with the given engine.
+def measurementNames(engine : str) -> list:
+    return ['endToEnd.{}.{}'.format(engine, name) for name in ['packetsPerSecond', 'wallTime', 'latencyMean', 'latencyP95']]
+
+# Run the traces with the given engine, its output is discarded. Runs in a guarded process.
+# return - tuple of the final statistics of the run, the number of packets logged and its wall time.
+def runMixnet(engine : str, tracesFile : str, logFile : str, bodySize : int, seed : int) -> tuple:
+    began = perf_counter()
+
+    with open(devnull, 'w') as output:
+        with redirect_stdout(output):
+            statistics = createMixnet(LAYERS,
+                                      bodySize,
+                                      PROVIDERS,
+                                      tracesFile,
+                                      NODES_PER_LAYER,
+                                      decoyWorkers=0,
+                                      encoderWorkers=0,
+                                      engine=engine,
+                                      static=True,
+                                      logFile=logFile,
+                                      seed=seed)
+
+    wallTime = perf_counter() - began
+
+    return statistics, len(loadLog(logFile)), wallTime
+
+# Benchmark a whole run.
+# users    - the number of users in the traces.
+# duration - the time of the last mail in the traces in seconds.
+# timeout  - the wall time of the run in seconds, after which it fails.
+# return   - the packets logged per second of wall time, the wall time of the run and the mean and the
+#            95th percentile of the simulated E2E latency.
+def benchmarkEndToEnd(seed     : int,
+                      users    : int = 16,
+                      duration : float = 60.,
+                      bodySize : int = 1024,
+                      engine   : str = 'simulation',
+                      timeout  : float = RUN_TIMEOUT) -> dict:
+
+    with TemporaryDirectory() as directory:
+        tracesFile = join(directory, 'traces.ndjson')
+        logFile    = join(directory, 'logs.log')
+
+        seededTraces(tracesFile, seed, users, 10., duration, bodySize // 2)
+
+        run, reason = guarded(runMixnet, (engine, tracesFile, logFile, bodySize, seed), timeout)
+
+    if run is None:
+        return dict([(name, failed(reason)) for name in measurementNames(engine)])
+
+    statistics, packets, wallTime = run
+    names                         = measurementNames(engine)
+
+    results           = dict()
+    results[names[0]] = higher(packets / wallTime, 'packets/s', packets)
+    results[names[1]] = lower(wallTime, 's')
+    results[names[2]] = lower(statistics['mean'], 's', statistics['count'])
+    results[names[3]] = lower(statistics['p95'], 's', statistics['count'])
+
+    return results
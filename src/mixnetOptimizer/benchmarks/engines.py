@@ -0,0 +1,81 @@
+from os.path             import join
+from tempfile            import TemporaryDirectory
+from benchmarks.harness  import lower
+from benchmarks.harness  import failed
+from benchmarks.harness  import guarded
+from benchmarks.endToEnd import runMixnet
+from benchmarks.fixtures import RUN_TIMEOUT
+from benchmarks.fixtures import seededTraces
+
+"""
+Agreement of the discrete-event simulation with the threaded engine. Both engines run the same seeded
+traces with the same seed, so the simulated latency distribution can be checked against the one of
+the real sockets and timers. The simulation fires its timers exactly on the virtual clock and takes
+no time to process a packet, so the gap between the two is what the threaded engine adds - the
+lateness of its workers' timers, reported alongside, and its packet path. The threaded run takes the
+traces' duration of wall time. Both runs are guarded by a wall-clock timeout, a run that hangs fails
+all the measurements.
+"""
+
+"""
+PRIVATE
+"""
+
+# The percentiles of the E2E latency compared between the engines.
+__PERCENTILES = ['mean', 'p50', 'p95', 'p99']
+
+# The names of all the measurements of the suite.
+def __names() -> list:
+    names  = ['engines.{}.latency.{}'.format(engine, key) for engine in ['simulation', 'threaded', 'gap'] for key in __PERCENTILES]
+    names += ['engines.threaded.latenessMean', 'engines.threaded.latenessMax']
+
+    return names
+
+"""
+PUBLIC
+"""
+
+# Benchmark the simulation against the threaded engine.
+# users    - the number of users in the traces.
+# duration - the time of the last mail in the traces in seconds.
+# timeout  - the wall time of each run in seconds, after which it fails.
+# return   - the E2E latency percentiles of both engines, their relative gap (the simulated minus the
+#            threaded one, over the threaded one) and the mean and max lateness of the threaded
+#            workers' timers.
+def benchmarkEngines(seed     : int,
+                     users    : int = 8,
+                     duration : float = 20.,
+                     bodySize : int = 1024,
+                     timeout  : float = RUN_TIMEOUT) -> dict:
+
+    statistics = dict()
+
+    with TemporaryDirectory() as directory:
+        tracesFile = join(directory, 'traces.ndjson')
+
+        seededTraces(tracesFile, seed, users, 5., duration, bodySize // 2)
+
+        for engine in ['simulation', 'threaded']:
+            run, reason = guarded(runMixnet, (engine, tracesFile, join(directory, engine + '.log'), bodySize, seed), timeout)
+
+            if run is None:
+                return dict([(name, failed(engine + ' ' + reason)) for name in __names()])
+
+            statistics[engine] = run[0]
+
+    simulated = statistics['simulation']
+    threaded  = statistics['threaded']
+    results   = dict()
+
+    for key in __PERCENTILES:
+        results['engines.simulation.latency.' + key] = lower(simulated[key], 's', simulated['count'])
+        results['engines.threaded.latency.'   + key] = lower(threaded[key], 's', threaded['count'])
+
+        # The gap is compared by its size, either direction is a disagreement.
+        if threaded[key]:
+            results['engines.gap.latency.' + key] = lower(abs(simulated[key] - threaded[key]) / threaded[key], 'ratio')
+
+    results['engines.threaded.latenessMean'] = lower(threaded['scheduling']['mean'], 's', threaded['scheduling']['count'])
+    results['engines.threaded.latenessMax' ] = lower(threaded['scheduling']['max'], 's', threaded['scheduling']['count'])
+
+    return results
@@ -0,0 +1,59 @@
+from pki          import CompiledPKI
+from json         import dumps
+from util         import sphinxParams
+from numpy        import array
+from users        import ProviderMap
+from random       import Random
+from petlib.bn    import Bn
+from sharding     import assignShards
+
+"""
+Fixed small topology and seeded traces shared by the benchmarks.
+"""
+
+# The topology of all the benchmarks.
+LAYERS          = 2
+PROVIDERS       = 2
+NODES_PER_LAYER = 2
+
+# The wall time in seconds after which an end-to-end run fails instead of blocking the benchmarks.
+RUN_TIMEOUT = 300.
+
+# Mixnet of the fixed topology, with known secret keys, so the packets can be unwrapped hop by hop.
+# users  - the number of users, assigned to the providers round-robin.
+# return - dictionary with the params (SphinxParams), pki (CompiledPKI), secrets (node ID to its
+#          secret key) and users (ProviderMap).
+def smallMixnet(bodySize : int, users : int = 16) -> dict:
+    userIds           = ["u{:06d}".format(idx) for idx in range(users)]
+    topology, secrets = assignShards(LAYERS, bodySize, PROVIDERS, NODES_PER_LAYER, userIds, ['127.0.0.1'])
+    params            = sphinxParams(LAYERS, bodySize)
+
+    mixnet            = dict()
+    mixnet['params' ] = params
+    mixnet['pki'    ] = CompiledPKI(topology['pki'], params)
+    mixnet['secrets'] = dict([(nodeId, Bn.from_hex(secret)) for nodeId, secret in secrets[0].items()])
+    mixnet['users'  ] = ProviderMap(userIds, array([idx % PROVIDERS for idx in range(users)]))
+
+    return mixnet
+
+# Write seeded NDJSON traces - the users send mails at exponentially distributed intervals to random
+# receivers.
+# interval - the mean time between two mails of a user in seconds.
+# duration - the time of the last mail in seconds.
+def seededTraces(path : str, seed : int, users : int, interval : float, duration : float, size : int):
+    random = Random(seed)
+    mails  = []
+
+    for sender in range(users):
+        sentAt = random.expovariate(1 / interval)
+
+        while sentAt < duration:
+            receiver  = random.randrange(users)
+            mails    += [{ 'time' : sentAt, 'sender' : "u{:06d}".format(sender), 'size' : size, 'receiver' : "u{:06d}".format(receiver) }]
+            sentAt   += random.expovariate(1 / interval)
+
+    mails.sort(key=lambda mail : mail['time'])
+
+    with open(path, 'w', encoding='utf-8') as file:
+        for mail in mails:
+            file.write(dumps(mail) + '\n')
@@ -0,0 +1,128 @@
+from json                       import dump
+from json                       import load
+from time                       import perf_counter
+from typing                     import Callable
+from statistics                 import median
+from statistics                 import quantiles
+from multiprocessing            import get_context
+from multiprocessing.connection import Connection
+
+"""
+Measurements of the benchmarks and their comparison with a baseline. A measurement is a dictionary
+with its value, unit and direction - whether a lower or a higher value is better. The results of a
+benchmark run map the name of each measurement to it.
+"""
+
+"""
+PRIVATE
+"""
+
+# Entry point of a guarded process, sends the function's result back.
+def __callInto(function : Callable, args : tuple, conn : Connection):
+    conn.send(function(*args))
+    conn.close()
+
+"""
+PUBLIC
+"""
+
+# A measurement where the lower value is better, e.g. seconds per operation.
+def lower(value : float, unit : str, samples : int = 1) -> dict:
+    return { 'value' : value, 'unit' : unit, 'better' : 'lower', 'samples' : samples }
+
+# A measurement where the higher value is better, e.g. operations per second.
+def higher(value : float, unit : str, samples : int = 1) -> dict:
+    return { 'value' : value, 'unit' : unit, 'better' : 'higher', 'samples' : samples }
+
+# A measurement that could not be taken, e.g. a run that hung. It counts as a regression.
+# reason - why the measurement failed.
+def failed(reason : str) -> dict:
+    return { 'value' : None, 'unit' : None, 'better' : None, 'samples' : 0, 'failed' : reason }
+
+# Call a function in a spawned process with a wall-clock timeout, so a run that hangs is reported
+# instead of blocking the benchmarks. The function and its arguments must be picklable.
+# timeout - seconds.
+# return  - tuple of the function's result and None, or None and the reason of the failure when the
+#           function crashed or did not return in time.
+def guarded(function : Callable, args : tuple, timeout : float) -> tuple:
+    context        = get_context('spawn')
+    reader, writer = context.Pipe(duplex=False)
+    process        = context.Process(target=__callInto, args=(function, args, writer))
+    result         = None
+    reason         = None
+
+    process.start()
+    writer.close()
+
+    try:
+        if reader.poll(timeout):
+            result = reader.recv()
+        else:
+            reason = 'did not finish within {} seconds'.format(timeout)
+    except EOFError:
+        reason = 'crashed'
+
+    if process.is_alive() and reason is not None:
+        process.terminate()
+
+    process.join()
+    reader.close()
+
+    if reason == 'crashed':
+        reason += ' with exit code {}'.format(process.exitcode)
+
+    return result, reason
+
+# Time single calls of a function.
+# repeat - the number of timed calls.
+# warmup - the number of calls before the timing starts.
+# return - the median seconds of a call, and the 95th percentile, both as the lower-is-better
+#          measurements.
+def timeCalls(function : Callable, repeat : int, warmup : int = 3) -> tuple:
+    for _ in range(warmup):
+        function()
+
+    times = []
+
+    for _ in range(repeat):
+        began  = perf_counter()
+        function()
+        times += [perf_counter() - began]
+
+    p95 = quantiles(times, n=20)[-1] if len(times) > 1 else times[0]
+
+    return lower(median(times), 's/op', repeat), lower(p95, 's/op', repeat)
+
+# Compare the results with the baseline. Measurements missing in either of them are skipped, a
+# failed measurement is always a regression.
+# tolerance - the relative change of a value in the worse direction that is still accepted.
+# return    - list of the regressions, tuples of the name, the baseline value and the current value.
+def compare(results : dict, baseline : dict, tolerance : float) -> list:
+    regressions = []
+
+    for name, measurement in results.items():
+        if 'failed' in measurement:
+            regressions += [(name, baseline[name]['value'] if name in baseline else None, None)]
+            continue
+
+        if name not in baseline or baseline[name]['value'] is None:
+            continue
+
+        value = measurement['value']
+        base  = baseline[name]['value']
+
+        if measurement['better'] == 'lower' and value > base * (1 + tolerance):
+            regressions += [(name, base, value)]
+
+        elif measurement['better'] == 'higher' and value < base * (1 - tolerance):
+            regressions += [(name, base, value)]
+
+    return regressions
+
+def saveResults(path : str, results : dict):
+    with open(path, 'w', encoding='utf-8') as file:
+        dump(results, file, indent=4)
+
+def loadResults(path : str) -> dict:
+    with open(path, 'r', encoding='utf-8') as file:
+        return load(file)
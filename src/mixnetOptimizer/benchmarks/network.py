@@ -0,0 +1,66 @@
+from util                import sendPacket
+from util                import closeConnections
+from queue               import SimpleQueue
+from socket              import socket
+from socket              import AF_INET
+from socket              import SOCK_STREAM
+from threading           import Thread
+from connections         import FrameReader
+from benchmarks.harness  import timeCalls
+
+"""
+Sending a packet through sendPacket, over the pooled TCP connection, until the receiving end has
+reassembled its frame.
+"""
+
+"""
+PRIVATE
+"""
+
+# Receive the frames of a single connection and hand each of them over to the queue.
+def __receive(server : socket, received : SimpleQueue, capacity : int):
+    conn, _ = server.accept()
+    reader  = FrameReader(capacity)
+
+    with conn:
+        while reader.receive(conn) > 0:
+            for frame in reader.frames():
+                received.put(frame)
+
+"""
+PUBLIC
+"""
+
+# Benchmark the round trip of a packet: sendPacket from the sender's thread, the frame reassembled by
+# the receiving thread and handed back to the sender.
+# packetSize - the size of the packet in bytes.
+# repeat     - the number of packets timed.
+def benchmarkSend(packetSize : int, repeat : int) -> dict:
+    server   = socket(AF_INET, SOCK_STREAM)
+    received = SimpleQueue()
+    packet   = bytes(packetSize)
+
+    # An ephemeral port, so the benchmark does not collide with a running mixnet.
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+
+    port     = server.getsockname()[1]
+    receiver = Thread(target=__receive, args=(server, received, 2 * packetSize))
+
+    receiver.start()
+
+    def roundTrip():
+        sendPacket(packet, port)
+        received.get()
+
+    median, p95 = timeCalls(roundTrip, repeat)
+
+    closeConnections()
+    receiver.join()
+    server.close()
+
+    results                                      = dict()
+    results['send.{}.median'.format(packetSize)] = median
+    results['send.{}.p95'   .format(packetSize)] = p95
+
+    return results
@@ -0,0 +1,50 @@
+from time               import time
+from time               import perf_counter
+from random             import Random
+from observer           import Observer
+from benchmarks.harness import lower
+
+"""
+Event handling of the observer: the LEGIT messages sent by the clients, their splits delivered by
+the providers and the entropy measurements of the mixes.
+"""
+
+# Benchmark the observer on a seeded stream of events.
+# messages - the number of LEGIT messages, each of them is sent, delivered in two splits and followed
+#            by an entropy measurement of a mix.
+# return   - the mean seconds of handling an event and of polling the observer.
+def benchmarkObserver(messages : int, seed : int) -> dict:
+    random = Random(seed)
+    nodes  = ["m{:06d}".format(idx) for idx in range(16)]
+    start  = time()
+    events = []
+
+    for idx in range(messages):
+        msgId   = "{:024x}".format(idx)
+        sentAt  = start + idx * 0.001
+        events += [(msgId, "{:.7f}".format(sentAt), 2)]
+        events += [(msgId, "{:.7f}".format(sentAt + random.expovariate(1.)))]
+        events += [(msgId, "{:.7f}".format(sentAt + random.expovariate(1.)))]
+        events += [(random.choice(nodes), random.random())]
+
+    # The observer only iterates over the node IDs of the PKI. It expects one more message, so the
+    # polls never terminate it.
+    tracker = Observer(nodes, float('inf'), messages + 1, start, static=True)
+    began   = perf_counter()
+
+    for event in events:
+        tracker.handle(event)
+
+    handled = perf_counter() - began
+    began   = perf_counter()
+
+    for idx in range(messages):
+        tracker.poll(start)
+
+    polled = perf_counter() - began
+
+    results                    = dict()
+    results['observer.handle'] = lower(handled / len(events), 's/event', len(events))
+    results['observer.poll'  ] = lower(polled / messages, 's/poll', messages)
+
+    return results
@@ -0,0 +1,86 @@
+from util                   import unwrapPacket
+from util                   import generateMessage
+from constants              import LAMBDAS
+from sphinxmix.SphinxClient import Relay_flag
+from benchmarks.harness     import timeCalls
+from benchmarks.fixtures    import smallMixnet
+
+"""
+Sphinx packet generation for each traffic type and body size, and the unwrapping of a packet in a
+node, per hop: sphinx_process in the relaying mixes and providers, together with receive_forward at
+the destination.
+"""
+
+# The senders of the benchmark packets.
+USER = 'u000000'
+MIX  = 'm000002'
+
+# Benchmark the generation of the packets.
+# bodySizes - the plaintext sizes of a packet in bytes.
+# repeat    - the number of packets timed per type and size.
+def benchmarkGeneration(bodySizes : list, repeat : int) -> dict:
+    results = dict()
+
+    for bodySize in bodySizes:
+        mixnet = smallMixnet(bodySize)
+        params = mixnet['params']
+        pki    = mixnet['pki']
+        users  = mixnet['users']
+        delay  = LAMBDAS['DELAY']
+
+        generators             = dict()
+        generators['LEGIT'   ] = lambda : generateMessage(pki, USER, 'LEGIT', params, bodySize, bodySize, delay, users, 'u000001')
+        generators['DROP'    ] = lambda : generateMessage(pki, USER, 'DROP', params, bodySize, bodySize, delay, users)
+        generators['LOOP'    ] = lambda : generateMessage(pki, USER, 'LOOP', params, bodySize, bodySize, delay, users)
+        generators['LOOP_MIX'] = lambda : generateMessage(pki, MIX, 'LOOP_MIX', params, bodySize, bodySize, delay)
+
+        for ofType, generator in generators.items():
+            median, p95 = timeCalls(generator, repeat)
+
+            results['generate.{}.{}.median'.format(ofType, bodySize)] = median
+            results['generate.{}.{}.p95'   .format(ofType, bodySize)] = p95
+
+    return results
+
+# Benchmark the unwrapping of LEGIT packets at every hop of their path - the sender's provider, the
+# mixes, the receiver's provider, which also decodes the destination.
+def benchmarkProcessing(bodySizes : list, repeat : int) -> dict:
+    results = dict()
+
+    for bodySize in bodySizes:
+        mixnet  = smallMixnet(bodySize)
+        params  = mixnet['params']
+        secrets = mixnet['secrets']
+
+        # Hop number to the (node ID, packet) pairs to unwrap at that hop.
+        hops = dict()
+
+        for _ in range(repeat):
+            packet, nextNode = generateMessage(mixnet['pki'], USER, 'LEGIT', params, bodySize, bodySize, LAMBDAS['DELAY'], mixnet['users'], 'u000001')[0][:2]
+            hop              = 0
+
+            while True:
+                hops.setdefault(hop, []).append((nextNode, packet))
+
+                _, flag, info = unwrapPacket(params, secrets[nextNode], packet)
+
+                if flag != Relay_flag:
+                    break
+
+                packet, nextNode  = info[:2]
+                hop              += 1
+
+        for hop, packets in hops.items():
+            pending = iter(packets)
+
+            def unwrapNext():
+                nodeId, packet = next(pending)
+
+                unwrapPacket(params, secrets[nodeId], packet)
+
+            median, p95 = timeCalls(unwrapNext, len(packets), warmup=0)
+
+            results['unwrap.hop{}.{}.median'.format(hop, bodySize)] = median
+            results['unwrap.hop{}.{}.p95'   .format(hop, bodySize)] = p95
+
+    return results
@@ -0,0 +1,59 @@
+"""
+Buffers of the packet path of the nodes. The receive buffers of the connections are preallocated and
+reused, the frames are handed over as views into them and a relayed packet is sent without being
+copied into a frame. The buffers allocated and the bytes copied are counted, so the cost of a hop can
+be read from the node's metrics.
+"""
+
+# Buffers allocated and bytes copied on the packet path of a single thread, e.g. the I/O thread of a
+# node.
+class CopyCounter:
+
+    def __init__(self,):
+        self.allocations = 0
+        self.copied      = 0
+
+    # A new buffer of the given size was allocated and filled.
+    def copy(self, size : int):
+        self.allocations += 1
+        self.copied      += size
+
+    # The given number of bytes was moved within a buffer, or into a reused one.
+    def move(self, size : int):
+        self.copied += size
+
+# Free list of preallocated buffers of the same size. A buffer is taken from the pool while the
+# pool has one and a larger one is not needed, otherwise it is allocated. Only the buffers of the
+# pool's size are taken back. Not synchronized, a pool is used by a single thread.
+class BufferPool:
+
+    # size  - the size of the buffers in bytes.
+    # count - the number of the buffers preallocated and kept in the pool.
+    def __init__(self, size : int, count : int):
+        self.size          = size
+        self.__count       = count
+        self.__free        = [bytearray(size) for _ in range(count)]
+        self.__allocations = 0
+        self.__reuses      = 0
+
+    # A buffer of at least the given size.
+    def acquire(self, size : int) -> bytearray:
+        if size <= self.size and self.__free:
+            self.__reuses += 1
+
+            return self.__free.pop()
+
+        self.__allocations += 1
+
+        return bytearray(max(size, self.size))
+
+    def release(self, buffer : bytearray):
+        if len(buffer) == self.size and len(self.__free) < self.__count:
+            self.__free += [buffer]
+
+    # The buffers allocated beyond the preallocated ones and the buffers reused from the pool.
+    def stats(self,) -> dict:
+        return { 'size'        : self.size,
+                 'free'        : len(self.__free),
+                 'allocations' : self.__allocations,
+                 'reuses'      : self.__reuses }
@@ -1,14 +1,16 @@
 from time         import time
-from time         import sleep
 from util         import sendPacket
+from decoys       import DecoyPool
 from queue        import Queue
 from queue        import SimpleQueue
 from queue        import PriorityQueue
 from typing       import Callable
-from logging      import info
-from constants    import LAMBDAS
+from eventlog     import logEvent
+from scheduler    import Scheduler
+from parameters   import ParameterStore
 from constants    import LEGIT_LAG
-from numpy.random import exponential
+from itertools    import count
+from randomness   import workerStream
 
 class Client:
 
@@ -23,38 +25,73 @@ class Client:
     #                    - receiver - the ID of a single receiving user. The emails that had 
     #                      multiple receivers were split into emails of the same sizes, sending 
     #                      times and senders, but one receiver per email.
-    # cmdQueue     - queue synchronized with the optimizer. The optimizer uses it to propagate the 
-    #                mixnet parameter updates across the network. It can also be used to send 
-    #                an empty command that initiates the graceful termination of the mixnet.
+    #                More mails can be streamed in later through schedule.
+    # parameters   - store of the mixnet parameters shared with the optimizer. The optimizer 
+    #                publishes the parameter updates to it and sets its shutdown event to initiate 
+    #                the graceful termination of the mixnet.
     # eventQueue   - queue synchronized with optimizer. It is used to inform the optimizer when 
     #                a LEGIT message is sent. This information is used for latency computation.
-    # providerPort - Port at which user's provider listens for a connection.
+    # providerPort - Port at which user's provider listens for a connection on the local host, or its
+    #                (host, port) address.
     # msgGenerator - wrapper function for generation messages encapsulated in Sphinx packets 
-    #                implicitly gives the client access to the PKI info.
+    #                implicitly gives the client access to the PKI info. It draws from the random
+    #                stream of the client, passed as the keyword random.
+    # decoyPool    - optional pool of pre-generated DROP and LOOP packets. When it is None or has no
+    #                packet ready, the decoy is generated through msgGenerator.
+    # scheduler    - timers shared by the workers of the threaded engine. The client sleeps until 
+    #                its next timer or LEGIT mail is due. With None, the client has its own.
     def __init__(self, 
                  userId       : str, 
                  bodySize     : int, 
                  rawMails     : list,
-                 cmdQueue     : PriorityQueue,
+                 parameters   : ParameterStore,
                  eventQueue   : SimpleQueue,
-                 providerPort : int,
-                 msgGenerator : Callable):
+                 providerPort,
+                 msgGenerator : Callable,
+                 decoyPool    : DecoyPool = None,
+                 scheduler    : Scheduler = None):
         self.__userId       = userId
-        self.__lastCmd      = 0.
-        self.__lambdas      = LAMBDAS
+        self.__lambdas      = parameters.current.lambdas
+        self.__version      = parameters.current.version
         self.__bodySize     = bodySize
-        self.__cmdQueue     = cmdQueue
+        self.__parameters   = parameters
+        self.__decoyPool    = decoyPool
         self.__rawMails     = PriorityQueue()
         self.__eventQueue   = eventQueue
         self.__msgGenerator = msgGenerator
         self.__messageQueue = Queue()
         self.__providerPort = providerPort
+        self.__scheduler    = scheduler if scheduler is not None else Scheduler()
+        self.__wakeup       = self.__scheduler.wakeup()
+        self.__random       = workerStream(userId)
+
+        # The mails' times are relative to the creation of the client. Mails split by receiver share
+        # their sending time, the sequence number keeps them in the scheduling order.
+        self.__start    = time()
+        self.__sequence = count()
 
-        # Schedule the LEGIT emails for sending. The LEGIT traffic should start once the mixnet 
-        # is well established, so decoy traffic flows through it. Therefore, schedule LEGIT traffic
-        # after some initial delay in LEGIT_LAG.
         for mail in rawMails:
-            self.__rawMails.put_nowait((time() + mail['time'] + LEGIT_LAG, mail))
+            self.schedule(mail)
+
+    # Schedule a LEGIT email for sending. The LEGIT traffic should start once the mixnet is well 
+    # established, so decoy traffic flows through it. Therefore, schedule LEGIT traffic after some 
+    # initial delay in LEGIT_LAG. Thread-safe, the mails can be streamed in while the client runs.
+    def schedule(self, mail : dict):
+        self.__rawMails.put_nowait((self.__start + mail['time'] + LEGIT_LAG, next(self.__sequence), mail))
+        self.__wakeup.notify()
+
+    # Take a pre-generated decoy packet of a given type from the pool. Generate it synchronously 
+    # when there is no pool or the pool has no packet ready.
+    def __decoy(self, ofType : str) -> tuple:
+        data = None
+
+        if self.__decoyPool is not None:
+            data = self.__decoyPool.pop(self.__userId, ofType)
+
+        if data is None:
+            data = self.__msgGenerator(self.__userId, ofType, self.__bodySize, self.__lambdas['DELAY'], None, random=self.__random)[0]
+
+        return data
 
     # Simulate a client.
     def start(self,):
@@ -68,18 +105,21 @@ class Client:
         # Dictionary of times at which the next packet of a given type should be emitted. 
         timers = dict()
 
+        # Wake up on the parameter updates and the shutdown.
+        self.__parameters.subscribe(self.__wakeup.notify)
+
         # Sample the initial sending times for messages of a given type.
-        timers['DROP' ] = time() + exponential(self.__lambdas['DROP'])
-        timers['LOOP' ] = time() + exponential(self.__lambdas['LOOP'])
-        timers['LEGIT'] = time() + exponential(self.__lambdas['LEGIT'])
+        timers['DROP' ] = time() + self.__random.exponential(self.__lambdas['DROP'])
+        timers['LOOP' ] = time() + self.__random.exponential(self.__lambdas['LOOP'])
+        timers['LEGIT'] = time() + self.__random.exponential(self.__lambdas['LEGIT'])
 
         while True:
 
             # Check if it is time for sending a LEGIT message. If yes then convert it to Sphinx 
             # packet and put on sending queue that's probed via Poisson process.
             if not self.__rawMails.empty() and self.__rawMails.queue[0][0] < time():
-                mail   = self.__rawMails.get_nowait()[1]
-                splits = self.__msgGenerator(self.__userId, 'LEGIT', mail['size'], self.__lambdas['DELAY'], mail['receiver'])
+                mail   = self.__rawMails.get_nowait()[2]
+                splits = self.__msgGenerator(self.__userId, 'LEGIT', mail['size'], self.__lambdas['DELAY'], mail['receiver'], random=self.__random)
 
                 for split in splits:
                     self.__messageQueue.put_nowait(split + (len(splits), ))
@@ -93,20 +133,21 @@ class Client:
             # There is no LEGIT message to send, so send a DROP packet instead and reset the LEGIT
             # traffic timer.
             elif self.__messageQueue.empty() and timers['LEGIT'] < time():
-                data       = self.__msgGenerator(self.__userId, 'DROP', self.__bodySize, self.__lambdas['DELAY'], None)[0]
+                data       = self.__decoy('DROP')
                 updateType = 'LEGIT'
 
             # Generate DROP decoy packet.
             elif timers['DROP'] < time():
-                data       = self.__msgGenerator(self.__userId, 'DROP', self.__bodySize, self.__lambdas['DELAY'], None)[0]
+                data       = self.__decoy('DROP')
                 updateType = 'DROP'
 
             # Generate LOOP decoy packet.
             elif timers['LOOP'] < time():
-                data       = self.__msgGenerator(self.__userId, 'LOOP', self.__bodySize, self.__lambdas['DELAY'], None)[0]
+                data       = self.__decoy('LOOP')
                 updateType = 'LOOP'
 
             if data is not None:
+                self.__scheduler.fired(timers[updateType])
 
                 # Unpack the data for sending.
                 packet    = data[0]
@@ -118,16 +159,16 @@ class Client:
                 sendPacket(packet, self.__providerPort)
 
                 # Logging.
-                timeStr = "{:.7f}".format(time())
+                now = time()
 
-                info('%s %s %s %s %s %s', timeStr, self.__userId, nextNode, msgId, split, ofType)
+                logEvent(now, self.__userId, nextNode, msgId, split, ofType)
 
                 # Reset the timer for a given message type.
-                timers[updateType] = time() + exponential(self.__lambdas[updateType])
+                timers[updateType] = time() + self.__random.exponential(self.__lambdas[updateType])
 
                 # When LEGIT message was sent inform the optimizer about it through eventQueue.
                 if legitSend:
-                    self.__eventQueue.put((msgId, timeStr, data[5]))
+                    self.__eventQueue.put((msgId, "{:.7f}".format(now), data[5]))
 
                     legitSend = False
 
@@ -135,24 +176,24 @@ class Client:
                 data       = None
                 updateType = None
 
-            if not self.__cmdQueue.empty():
-                cmd = self.__cmdQueue.get()
-
-                # Empty command gracefully terminates the worker.
-                if len(cmd) == 0:
-                    self.__cmdQueue.put([])
-                    break
-
-                # Update the mixnet parameters.
-                elif self.__lastCmd < cmd[0]:
-                    self.__lambdas = cmd[1][1]
-                    self.__lastCmd = cmd[0]
-
-                    cmd[1][0] -= 1
-                    
-                # When the counter reaches 0, all workers have successfully updated their 
-                # parameters.
-                if cmd[1][0] > 0:
-                    self.__cmdQueue.put(cmd)
-            else:
-                sleep(0.01)
\ No newline at end of file
+            # The shutdown event gracefully terminates the worker.
+            if self.__parameters.shutdown.is_set():
+                break
+
+            # Pick up the latest parameters published by the optimizer.
+            current = self.__parameters.current
+
+            if self.__version != current.version:
+                self.__lambdas = current.lambdas
+                self.__version = current.version
+
+                self.__parameters.acknowledge(current.version)
+
+            # Sleep until the next timer fires, the next LEGIT mail is due or the optimizer publishes
+            # new parameters.
+            deadline = min(timers.values())
+
+            if not self.__rawMails.empty():
+                deadline = min(deadline, self.__rawMails.queue[0][0])
+
+            self.__wakeup.wait(deadline)
\ No newline at end of file
@@ -0,0 +1,325 @@
+from time      import sleep
+from struct    import Struct
+from socket    import socket
+from socket    import TCP_NODELAY
+from socket    import IPPROTO_TCP
+from socket    import create_connection
+from asyncio   import Lock as AsyncLock
+from asyncio   import sleep as asyncSleep
+from asyncio   import StreamWriter
+from asyncio   import open_connection
+from threading import Lock
+from buffers   import BufferPool
+from buffers   import CopyCounter
+
+"""
+Packets travel between the mixnet entities as frames over persistent TCP streams. A frame is the
+packet prefixed with its length, so many packets can share one stream.
+"""
+
+# Frame length prefix - 4 byte, big-endian unsigned integer.
+FRAME_HEADER = Struct('>I')
+
+# Send a packet as a frame over a blocking socket. The length prefix and the packet are gathered by
+# a single sendmsg call, so the packet is not copied into the frame.
+def sendFrame(sock : socket, packet : bytes):
+    header = FRAME_HEADER.pack(len(packet))
+    sent   = sock.sendmsg([header, packet])
+
+    # The rest of a partial send.
+    if sent < FRAME_HEADER.size:
+        sock.sendall(header[sent:])
+        sock.sendall(packet)
+
+    elif sent < FRAME_HEADER.size + len(packet):
+        sock.sendall(memoryview(packet)[sent - FRAME_HEADER.size:])
+
+# Reassembles the frames of a single stream. TCP hands back partial or coalesced reads, so the bytes
+# are received directly into a preallocated buffer and only complete frames are extracted from it.
+class FrameReader:
+
+    # capacity - initial size of the buffer in bytes. The buffer grows when a frame does not fit.
+    # pool     - the pool the buffer is taken from and returned to on close. A private buffer when
+    #            None.
+    # counter  - counts the buffers allocated and the bytes copied by the reader.
+    def __init__(self, capacity : int, pool : BufferPool = None, counter : CopyCounter = None):
+        self.__pool    = pool if pool is not None else BufferPool(capacity, 0)
+        self.__counter = counter if counter is not None else CopyCounter()
+        self.__buffer  = self.__pool.acquire(capacity)
+        self.__view    = memoryview(self.__buffer)
+        self.__start   = 0
+        self.__end     = 0
+
+    # Receive the available bytes of a non-blocking socket into the buffer. Returns the number of
+    # bytes received, 0 when the peer closed the stream.
+    def receive(self, conn : socket) -> int:
+        if self.__end == len(self.__buffer):
+            self.__compact()
+
+        received    = conn.recv_into(self.__view[self.__end:])
+        self.__end += received
+
+        return received
+
+    # Extract all the complete frames received so far. Returns a list of packets.
+    # copy - copy each frame to bytes. Otherwise the frames are views into the buffer, valid only
+    #        until the next receive, e.g. for unwrapping them right away.
+    def frames(self, copy : bool = True) -> list:
+        frames = []
+
+        while self.__end - self.__start >= FRAME_HEADER.size:
+            length = FRAME_HEADER.unpack_from(self.__buffer, self.__start)[0]
+            end    = self.__start + FRAME_HEADER.size + length
+
+            # Incomplete frame, wait for more data. Make sure the whole frame fits in the buffer.
+            if self.__end < end:
+                if FRAME_HEADER.size + length > len(self.__buffer):
+                    self.__grow(FRAME_HEADER.size + length)
+
+                break
+
+            frame = self.__view[self.__start + FRAME_HEADER.size:end]
+
+            if copy:
+                frame = bytes(frame)
+
+                self.__counter.copy(length)
+
+            frames      += [frame]
+            self.__start = end
+
+        # Everything consumed, receive from the beginning of the buffer again.
+        if self.__start == self.__end:
+            self.__start = 0
+            self.__end   = 0
+
+        return frames
+
+    # Return the buffer to the pool. The reader is not used afterwards.
+    def close(self,):
+        self.__view.release()
+        self.__pool.release(self.__buffer)
+
+    # Move the unconsumed bytes to the beginning of the buffer.
+    def __compact(self,):
+        pending = self.__end - self.__start
+
+        self.__view[:pending] = self.__view[self.__start:self.__end]
+        self.__start          = 0
+        self.__end            = pending
+
+        self.__counter.move(pending)
+
+    def __grow(self, capacity : int):
+        pending = self.__end - self.__start
+        buffer  = self.__pool.acquire(max(capacity, 2 * len(self.__buffer)))
+
+        buffer[:pending] = self.__view[self.__start:self.__end]
+
+        self.__counter.move(pending)
+        self.__view.release()
+        self.__pool.release(self.__buffer)
+
+        self.__buffer = buffer
+        self.__view   = memoryview(buffer)
+        self.__start  = 0
+        self.__end    = pending
+
+# Persistent connection to a single next hop. The lock serializes the frames of concurrent senders,
+# so frames never interleave in the stream.
+class Connection:
+
+    # address - the port of the next hop on the pool's host, or its (host, port) address.
+    def __init__(self, address):
+        self.address    = address
+        self.lock       = Lock()
+        self.sock       = None
+        self.sent       = 0
+        self.dropped    = 0
+        self.failures   = 0
+        self.reconnects = 0
+
+# Pool of persistent connections keyed by the next hop's port, or its (host, port) address when the
+# nodes listen on different hosts. On a failure, the connection is
+# re-established with exponential backoff. Packets that can not be sent after all the retries are
+# dropped and counted.
+class ConnectionPool:
+
+    # host       - address at which the mixnet nodes addressed by a port only listen.
+    # retries    - number of attempts to send a single packet.
+    # backoff    - initial delay between the attempts in seconds, doubled on every failure.
+    # maxBackoff - upper bound of the delay between the attempts in seconds.
+    def __init__(self,
+                 host       : str   = '127.0.0.1',
+                 retries    : int   = 4,
+                 backoff    : float = 0.01,
+                 maxBackoff : float = 1.):
+        self.__host        = host
+        self.__lock        = Lock()
+        self.__retries     = retries
+        self.__backoff     = backoff
+        self.__maxBackoff  = maxBackoff
+        self.__connections = dict()
+
+    # Send a single packet as a frame to the node listening at the given port or (host, port) 
+    # address. Returns True on success, False when the packet was dropped.
+    def send(self, packet : bytes, address) -> bool:
+        connection = self.__connections.get(address)
+
+        if connection is None:
+            with self.__lock:
+                connection = self.__connections.setdefault(address, Connection(address))
+
+        with connection.lock:
+            for attempt in range(self.__retries):
+                try:
+                    if connection.sock is None:
+                        connection.sock = self.__connect(address)
+
+                        if attempt > 0 or connection.sent > 0:
+                            connection.reconnects += 1
+
+                    sendFrame(connection.sock, packet)
+
+                    connection.sent += 1
+
+                    return True
+
+                # Connection refused, reset or broken. Drop the socket, a partially sent frame
+                # would corrupt the stream, and retry on a fresh connection after a backoff.
+                except OSError:
+                    connection.failures += 1
+
+                    self.__disconnect(connection)
+
+                    if attempt + 1 < self.__retries:
+                        sleep(min(self.__backoff * 2 ** attempt, self.__maxBackoff))
+
+            connection.dropped += 1
+
+        return False
+
+    # Counters summed over all the connections.
+    def stats(self,) -> dict:
+        stats               = dict()
+        stats['sent'      ] = 0
+        stats['dropped'   ] = 0
+        stats['failures'  ] = 0
+        stats['reconnects'] = 0
+
+        for connection in list(self.__connections.values()):
+            stats['sent'      ] += connection.sent
+            stats['dropped'   ] += connection.dropped
+            stats['failures'  ] += connection.failures
+            stats['reconnects'] += connection.reconnects
+
+        return stats
+
+    def close(self,):
+        for connection in list(self.__connections.values()):
+            with connection.lock:
+                self.__disconnect(connection)
+
+    def __connect(self, address) -> socket:
+        sock = create_connection(address if type(address) == tuple else (self.__host, address))
+
+        # Frames are small and latency matters more than the number of TCP segments.
+        sock.setsockopt(IPPROTO_TCP, TCP_NODELAY, 1)
+
+        return sock
+
+    def __disconnect(self, connection : Connection):
+        if connection.sock is not None:
+            try:
+                connection.sock.close()
+            except OSError:
+                pass
+
+            connection.sock = None
+
+# asyncio counterpart of ConnectionPool, used from the coroutines of a single event loop. A frame is
+# written to the transport at once, so the frames of concurrent senders never interleave.
+class AsyncConnectionPool:
+
+    # Arguments are the same as in ConnectionPool.
+    def __init__(self,
+                 host       : str   = '127.0.0.1',
+                 retries    : int   = 4,
+                 backoff    : float = 0.01,
+                 maxBackoff : float = 1.):
+        self.__host       = host
+        self.__locks      = dict()
+        self.__retries    = retries
+        self.__backoff    = backoff
+        self.__writers    = dict()
+        self.__maxBackoff = maxBackoff
+
+        self.__stats               = dict()
+        self.__stats['sent'      ] = 0
+        self.__stats['dropped'   ] = 0
+        self.__stats['failures'  ] = 0
+        self.__stats['reconnects'] = 0
+
+    # Send a single packet as a frame to the node listening at the given port. Returns True on
+    # success, False when the packet was dropped.
+    async def send(self, packet : bytes, port : int) -> bool:
+        header = FRAME_HEADER.pack(len(packet))
+
+        for attempt in range(self.__retries):
+            try:
+                writer = await self.__writer(port)
+
+                # Written at once, without joining the header and the packet.
+                writer.writelines([header, packet])
+                await writer.drain()
+
+                self.__stats['sent'] += 1
+
+                return True
+
+            except OSError:
+                self.__stats['failures'] += 1
+
+                self.__disconnect(port)
+
+                if attempt + 1 < self.__retries:
+                    await asyncSleep(min(self.__backoff * 2 ** attempt, self.__maxBackoff))
+
+        self.__stats['dropped'] += 1
+
+        return False
+
+    def stats(self,) -> dict:
+        return dict(self.__stats)
+
+    def close(self,):
+        for port in list(self.__writers):
+            self.__disconnect(port)
+
+    # Open connection to the port once, concurrent senders wait for the same connection.
+    async def __writer(self, port : int) -> StreamWriter:
+        writer = self.__writers.get(port)
+
+        if writer is None:
+            async with self.__locks.setdefault(port, AsyncLock()):
+                writer = self.__writers.get(port)
+
+                if writer is None:
+                    _, writer = await open_connection(self.__host, port)
+
+                    # Ports that had a connection before are reconnecting.
+                    if port in self.__writers:
+                        self.__stats['reconnects'] += 1
+
+                    self.__writers[port] = writer
+
+        return writer
+
+    # The disconnected port keeps its entry (None) for counting the reconnects.
+    def __disconnect(self, port : int):
+        writer = self.__writers.get(port)
+
+        if writer is not None:
+            writer.close()
+
+        self.__writers[port] = None
@@ -26,6 +26,94 @@ STATIC MIXNET PARAMETERS - do not change within a single experiment.
 # Number of seconds between starting the mixnet and sending first LEGIT message.
 LEGIT_LAG = 10
 
+# Decoy pool reservoir watermarks. A (sender, type) reservoir is refilled up to the high watermark 
+# once it holds fewer pre-generated packets than the low watermark.
+DECOY_LOW_WATERMARK  = 2
+DECOY_HIGH_WATERMARK = 8
+
+# Replay tag cache of a node. At most REPLAY_CAPACITY tags are kept, each of them for at least
+# REPLAY_EPOCH seconds unless the traffic fills the capacity sooner.
+REPLAY_CAPACITY = 2 ** 18
+REPLAY_EPOCH    = 600.
+
+# The longest time in seconds a worker of the threaded engine sleeps between its timers. The workers
+# are woken up on the parameter updates, this only bounds the sleep of idle workers.
+SCHEDULER_MAX_WAIT = 0.1
+
+# Streaming of the traces files. The mails are handed to their clients TRACE_LOOKAHEAD seconds before 
+# they are due, a JSON array is read TRACE_CHUNK characters at a time, a binary traces file 
+# TRACE_ROWS mails at a time.
+TRACE_ROWS      = 1 << 14
+TRACE_CHUNK     = 1 << 20
+TRACE_LOOKAHEAD = 5.
+
+# The observer logs the entropy and latency statistics every REPORT_INTERVAL seconds.
+REPORT_INTERVAL = 1.
+
+# The number of records of the binary event log buffered per thread before they are handed to the
+# writer, kept small as every client runs a thread. The writer also writes the records buffered by
+# the idle threads every EVENTLOG_FLUSH seconds. A log is read EVENTLOG_READ records at a time.
+EVENTLOG_BATCH = 64
+EVENTLOG_FLUSH = 1.
+EVENTLOG_READ  = 4096
+
+# The number of lines of a text log the analyzer converts to records at once.
+ANALYZER_CHUNK = 1 << 18
+
+# The nodes listen at NODE_PORT_BASE plus the number of their ID. The node IDs are numbered
+# consecutively, so these are the same ports as the consecutive ports per host of a sharded mixnet
+# on a single host.
+NODE_PORT_BASE = 49152
+
+# The number of the receive buffers preallocated per node, about the number of the node's upstream
+# connections. The buffers of the closed connections are reused by the new ones.
+READER_BUFFERS = 8
+
+# Backpressure of the overloaded nodes. QUEUE_POLICY is the default policy of a node with a queue 
+# limit. A node that paused its reads resumes them once its queue drains to QUEUE_RESUME of the limit,
+# it checks the queue every QUEUE_POLL seconds while paused.
+QUEUE_POLICY = 'dropNewest'
+QUEUE_RESUME = 0.75
+QUEUE_POLL   = 0.01
+
+# Sharded mixnet. The coordinator listens for the shards at OBSERVER_PORT, the shards send their 
+# events to it in batches of at most SHARD_BATCH events, at least every SHARD_FLUSH seconds. A local
+# shard that did not exit SHARD_EXIT seconds after it reported its statistics is terminated.
+OBSERVER_PORT = 49151
+SHARD_BATCH   = 256
+SHARD_FLUSH   = 0.01
+SHARD_EXIT    = 30.
+
+# The ranges, in seconds, from which the parameter search samples each of the LAMBDAS. The values are
+# sampled log-uniformly, the dataset's mean time between two emails lies within all of them.
+SEARCH_SPACE             = dict()
+SEARCH_SPACE['DROP'    ] = (1., 64.)
+SEARCH_SPACE['LOOP'    ] = (1., 64.)
+SEARCH_SPACE['LEGIT'   ] = (1., 64.)
+SEARCH_SPACE['DELAY'   ] = (0.1, 16.)
+SEARCH_SPACE['LOOP_MIX'] = (1., 64.)
+
+# The wall time in seconds after which a run of the parameter search is considered stuck.
+SEARCH_TIMEOUT = 3600.
+
+# Online control of the DELAY, see controller.py. A step is taken at most every CONTROL_INTERVAL 
+# seconds and changes the DELAY at most by the factor CONTROL_MAX_STEP. CONTROL_KP and CONTROL_KI are
+# the gains of the PI controller, the latency within CONTROL_TOLERANCE of the target is converged.
+CONTROL_KP        = 0.5
+CONTROL_KI        = 0.2
+CONTROL_INTERVAL  = 5.
+CONTROL_MAX_STEP  = 1.25
+CONTROL_TOLERANCE = 0.1
+
+# LEGIT messages with fewer splits are encoded serially by the client, the round trip to the 
+# encoder's worker processes does not pay off for them.
+ENCODER_MIN_SPLITS = 2
+
+# The number of exponentials and uniforms drawn at once by a random stream, and the number of the
+# plaintext characters, see randomness.py.
+RANDOM_BLOCK    = 1024
+PLAINTEXT_BLOCK = 65536
+
 """
 UTIL
 """
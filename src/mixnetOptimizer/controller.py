@@ -0,0 +1,122 @@
+from math      import log
+from math      import exp
+from time      import perf_counter
+from constants import CONTROL_KP
+from constants import CONTROL_KI
+from constants import SEARCH_SPACE
+from constants import CONTROL_INTERVAL
+from constants import CONTROL_MAX_STEP
+from constants import CONTROL_TOLERANCE
+
+# Online control of the mixnet parameters. It holds the E2E latency of the LEGIT messages at a target
+# while maximising the entropy: the entropy of the mixes grows with the mean delay of the packets, so
+# the controller keeps the DELAY as long as the latency target allows. A PI controller acts on the
+# logarithm of the DELAY, driven by the relative error of the mean latency of the messages delivered
+# since the last step. The other LAMBDAS are left as they are.
+# The changes are rate limited - a step is taken at most once per interval and changes the DELAY by
+# at most the factor maxStep, within the bounds. The time of a step is measured, so its overhead on
+# the observer can be reported.
+class LatencyController:
+
+    # target    - the mean E2E latency of the LEGIT messages to hold, in seconds.
+    # lambdas   - the initial parameters.
+    # start     - the starting time of the simulation.
+    # interval  - the minimal time between two steps in seconds.
+    # maxStep   - the maximal factor by which a step changes the DELAY.
+    # bounds    - the minimal and the maximal DELAY.
+    # tolerance - the relative error of the latency within which the controller has converged.
+    def __init__(self,
+                 target    : float,
+                 lambdas   : dict,
+                 start     : float,
+                 interval  : float = CONTROL_INTERVAL,
+                 maxStep   : float = CONTROL_MAX_STEP,
+                 bounds    : tuple = SEARCH_SPACE['DELAY'],
+                 tolerance : float = CONTROL_TOLERANCE):
+
+        self.__target    = target
+        self.__lambdas   = dict(lambdas)
+        self.__start     = start
+        self.__last      = start
+        self.__interval  = interval
+        self.__maxStep   = log(maxStep)
+        self.__bounds    = (log(bounds[0]), log(bounds[1]))
+        self.__tolerance = tolerance
+        self.__base      = log(lambdas['DELAY'])
+        self.__integral  = 0.
+
+        # Start of the latest streak of steps with the latency within the tolerance, None when the
+        # latest step was out of it.
+        self.__converged = None
+
+        self.__steps    = 0
+        self.__changes  = 0
+        self.__overhead = 0.
+        self.__maxTime  = 0.
+
+    # Whether the next step is due at the given time.
+    def due(self, now : float) -> bool:
+        return now - self.__last >= self.__interval
+
+    # Take a control step.
+    # latency - the mean E2E latency of the messages delivered since the last step.
+    # count   - the number of the messages delivered since the last step.
+    # return  - the new LAMBDAS or None when they do not change.
+    def step(self, now : float, latency : float, count : int) -> dict:
+        began       = perf_counter()
+        self.__last = now
+        lambdas     = None
+
+        # Without deliveries there is nothing to measure, the parameters are held.
+        if count > 0:
+            lambdas = self.__control(now, latency)
+
+        elapsed = perf_counter() - began
+
+        self.__steps    += 1
+        self.__overhead += elapsed
+        self.__maxTime   = max(self.__maxTime, elapsed)
+
+        return lambdas
+
+    # The control statistics: the number of steps and of parameter changes, the current DELAY, the
+    # convergence time since the start (None when the latency is out of the tolerance) and the mean
+    # and the maximal time of a step in seconds.
+    def stats(self,) -> dict:
+        return { 'steps'       : self.__steps,
+                 'changes'     : self.__changes,
+                 'delay'       : self.__lambdas['DELAY'],
+                 'convergence' : None if self.__converged is None else self.__converged - self.__start,
+                 'meanStep'    : self.__overhead / self.__steps if self.__steps > 0 else 0.,
+                 'maxStep'     : self.__maxTime }
+
+    def __control(self, now : float, latency : float) -> dict:
+
+        # Positive when the latency is below the target, so the DELAY can grow.
+        error = log(self.__target / max(latency, 1e-6))
+
+        if abs(error) <= log(1 + self.__tolerance):
+            if self.__converged is None:
+                self.__converged = now
+        else:
+            self.__converged = None
+
+        current  = log(self.__lambdas['DELAY'])
+        integral = self.__integral + error
+        output   = self.__base + CONTROL_KP * error + CONTROL_KI * integral
+
+        # Rate and range limits. The integral only accumulates while the output is not limited, so it
+        # does not wind up.
+        limited = min(max(output, current - self.__maxStep, self.__bounds[0]), current + self.__maxStep, self.__bounds[1])
+
+        if limited == output:
+            self.__integral = integral
+
+        # Changes below 1% are not worth propagating to all the workers.
+        if abs(limited - current) < 0.01:
+            return None
+
+        self.__lambdas['DELAY']  = exp(limited)
+        self.__changes          += 1
+
+        return dict(self.__lambdas)
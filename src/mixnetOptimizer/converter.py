@@ -0,0 +1,21 @@
+from argparse import ArgumentParser
+from traces   import convertTraces
+
+"""
+Converts a JSON or NDJSON traces file to the compact binary format, which the mixnet loads without 
+parsing.
+"""
+
+if __name__ == "__main__":
+    
+    # Get command line arguments.
+    parser = ArgumentParser()
+
+    parser.add_argument('--tracesFile', type=str, default="../../data/sample.json")
+    parser.add_argument('--output',     type=str, default="../../data/sample.npy")
+
+    args       = parser.parse_args()
+    tracesFile = args.tracesFile
+    output     = args.output
+
+    convertTraces(tracesFile, output)
@@ -0,0 +1,179 @@
+from pki                    import CompiledPKI
+from workers                import initWorker
+from workers                import generateDecoys
+from constants              import DECOY_LOW_WATERMARK
+from randomness             import streamSeed
+from constants              import DECOY_HIGH_WATERMARK
+from threading              import RLock
+from collections            import deque
+from multiprocessing        import get_context
+from concurrent.futures     import Future
+from concurrent.futures     import ProcessPoolExecutor
+from sphinxmix.SphinxParams import SphinxParams
+
+# Pool of pre-generated decoy packets. DROP, LOOP and LOOP_MIX packets do not depend on any user
+# content, so worker processes generate them ahead of time into per-sender, per-type reservoirs. The
+# send loops only pop a ready packet when their Poisson timer fires, keeping the Sphinx EC work off
+# the critical path. A pop from an empty reservoir is a miss, the caller then has to generate the
+# packet synchronously. Hits and misses are counted per type, so it is visible when the generation
+# can not keep up with the configured LAMBDAS.
+class DecoyPool:
+
+    # pki           - CompiledPKI of the mixnet, exported to the worker processes.
+    # params        - an instance of SphinxParams object of the experiment.
+    # bodySize      - the size of plaintext in a mixnet packet in bytes.
+    # users         - dictionary, maps user ID to its provider ID.
+    # delayMean     - Mean packet delay, mixnet parameter, embedded in the generated packets.
+    # workers       - the number of worker processes generating the decoys.
+    # lowWatermark  - reservoir is refilled once it holds fewer packets.
+    # highWatermark - the number of packets in a refilled reservoir.
+    def __init__(self,
+                 pki           : CompiledPKI,
+                 params        : SphinxParams,
+                 bodySize      : int,
+                 users         : dict,
+                 delayMean     : float,
+                 workers       : int = 2,
+                 lowWatermark  : int = DECOY_LOW_WATERMARK,
+                 highWatermark : int = DECOY_HIGH_WATERMARK):
+
+        assert 0 < workers and 0 <= lowWatermark and lowWatermark < highWatermark
+
+        # Reentrant, a done callback runs in the submitting thread if the job already finished.
+        self.__lock          = RLock()
+        self.__jobs          = 0
+        self.__epoch         = 0
+        self.__closed        = False
+        self.__pending       = dict()
+        self.__delayMean     = delayMean
+        self.__reservoirs    = dict()
+        self.__lowWatermark  = lowWatermark
+        self.__highWatermark = highWatermark
+
+        # Counters for reporting.
+        self.__hits      = dict()
+        self.__misses    = dict()
+        self.__generated = 0
+        self.__discarded = 0
+
+        # Spawn (not fork) the workers, the pool is created while other threads may hold locks.
+        initArgs        = (pki.export(), params.m, params.max_len, bodySize, users, streamSeed())
+        self.__executor = ProcessPoolExecutor(max_workers=workers,
+                                              mp_context=get_context('spawn'),
+                                              initializer=initWorker,
+                                              initargs=initArgs)
+
+    # Register a reservoir of decoy packets of a given type for a sender. Must be called before
+    # start.
+    def register(self, sender : str, ofType : str):
+        assert ofType in ['DROP', 'LOOP', 'LOOP_MIX']
+
+        self.__reservoirs[(sender, ofType)] = deque()
+
+        self.__hits.setdefault(ofType, 0)
+        self.__misses.setdefault(ofType, 0)
+
+    # Start filling all the registered reservoirs.
+    def start(self,):
+        with self.__lock:
+            for key in self.__reservoirs:
+                self.__refill(key)
+
+    # Take a pre-generated packet of a given type of a sender. Returns None on a miss.
+    def pop(self, sender : str, ofType : str) -> tuple:
+        key = (sender, ofType)
+
+        with self.__lock:
+            reservoir = self.__reservoirs[key]
+            data      = reservoir.popleft() if reservoir else None
+
+            if data is None:
+                self.__misses[ofType] += 1
+            else:
+                self.__hits[ofType] += 1
+
+            if len(reservoir) < self.__lowWatermark:
+                self.__refill(key)
+
+        return data
+
+    # Mean packet delay is embedded in the packets' routing information. On its change, discard
+    # all the pre-generated packets and refill the reservoirs with the new parameter.
+    def setDelayMean(self, delayMean : float):
+        with self.__lock:
+            if delayMean == self.__delayMean:
+                return
+
+            self.__epoch     += 1
+            self.__delayMean  = delayMean
+
+            for key, reservoir in self.__reservoirs.items():
+                self.__discarded += len(reservoir)
+
+                reservoir.clear()
+                self.__refill(key)
+
+    # Snapshot of the pool counters. hitRate is None for types that were never popped.
+    def stats(self,) -> dict:
+        with self.__lock:
+            stats              = dict()
+            stats['hits'     ] = dict(self.__hits)
+            stats['misses'   ] = dict(self.__misses)
+            stats['hitRate'  ] = dict()
+            stats['generated'] = self.__generated
+            stats['discarded'] = self.__discarded
+
+            for ofType in self.__hits:
+                total = self.__hits[ofType] + self.__misses[ofType]
+
+                stats['hitRate'][ofType] = self.__hits[ofType] / total if total > 0 else None
+
+        return stats
+
+    # Stop the generation, the pending jobs are cancelled.
+    # wait - wait until the worker processes exit, e.g. before a spawned process running the pool
+    #        exits itself, otherwise its workers may be left blocked.
+    def close(self, wait : bool = False):
+        with self.__lock:
+            self.__closed = True
+
+        self.__executor.shutdown(wait=wait, cancel_futures=True)
+
+    # Submit a refill job for a reservoir unless one is already in flight. Called with lock held.
+    def __refill(self, key : tuple):
+        if self.__closed or self.__pending.get(key) == self.__epoch:
+            return
+
+        count = self.__highWatermark - len(self.__reservoirs[key])
+        job   = key[0] + '/' + key[1] + '/' + str(self.__jobs)
+
+        try:
+            future = self.__executor.submit(generateDecoys, key[0], key[1], count, self.__delayMean, job)
+        except RuntimeError:
+            return
+
+        self.__jobs         += 1
+        self.__pending[key]  = self.__epoch
+
+        future.add_done_callback(lambda x, y=key, z=self.__epoch : self.__onGenerated(y, z, x))
+
+    # Move the generated packets into the reservoir. Packets generated before a parameter change
+    # are discarded.
+    def __onGenerated(self, key : tuple, epoch : int, future : Future):
+        with self.__lock:
+            if self.__pending.get(key) == epoch:
+                del self.__pending[key]
+
+            if future.cancelled() or future.exception() is not None:
+                return
+
+            if epoch != self.__epoch:
+                self.__discarded += len(future.result())
+                return
+
+            self.__generated += len(future.result())
+
+            self.__reservoirs[key].extend(future.result())
+
+            if len(self.__reservoirs[key]) < self.__lowWatermark:
+                self.__refill(key)
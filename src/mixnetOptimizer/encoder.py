@@ -0,0 +1,97 @@
+from pki                    import CompiledPKI
+from bson                   import ObjectId
+from util                   import splitSizes
+from util                   import generateMessage
+from workers                import initWorker
+from workers                import encodeSplit
+from itertools              import repeat
+from constants              import ENCODER_MIN_SPLITS
+from randomness             import streamSeed
+from randomness             import threadStream
+from randomness             import RandomStream
+from multiprocessing        import get_context
+from concurrent.futures     import ProcessPoolExecutor
+from sphinxmix.SphinxParams import SphinxParams
+
+# Encoder service shared by all the clients, started once by createMixnet. Large LEGIT messages are
+# split into many Sphinx packets, the splits are encoded in parallel by worker processes and handed
+# back in the split order, so the encoding neither holds the GIL nor stalls the client's timer loop
+# for long. Decoys and small messages are encoded serially in the calling thread. With no workers,
+# or once the worker pool breaks, everything is encoded serially.
+class Encoder:
+
+    # pki       - CompiledPKI used for serial encoding.
+    # params    - an instance of SphinxParams object of the experiment.
+    # bodySize  - the size of plaintext in a mixnet packet in bytes.
+    # users     - dictionary, maps user ID to its provider ID.
+    # workers   - the number of worker processes, 0 encodes serially.
+    # minSplits - LEGIT messages with fewer splits are encoded serially.
+    def __init__(self,
+                 pki       : CompiledPKI,
+                 params    : SphinxParams,
+                 bodySize  : int,
+                 users     : dict,
+                 workers   : int = 2,
+                 minSplits : int = ENCODER_MIN_SPLITS):
+        self.__pki       = pki
+        self.__users     = users
+        self.__params    = params
+        self.__bodySize  = bodySize
+        self.__executor  = None
+        self.__minSplits = minSplits
+
+        if workers > 0:
+            initArgs        = (pki.export(), params.m, params.max_len, bodySize, users, streamSeed())
+            self.__executor = ProcessPoolExecutor(max_workers=workers,
+                                                  mp_context=get_context('spawn'),
+                                                  initializer=initWorker,
+                                                  initargs=initArgs)
+
+    # Same interface as the clients' message generator wrapper.
+    # sender    - user ID.
+    # ofType    - the type of message to generate, enum.
+    # size      - the size of the plaintext message in bytes.
+    # delayMean - mean packet delay, mixnet parameter.
+    # receiver  - an ID of the receiving user for LEGIT traffic.
+    # random    - RandomStream of the sender, None uses the stream of the calling thread. The splits
+    #             encoded by the workers draw from the streams of a job keyed by a draw from it.
+    # return    - a list of packets in the split order, as in generateMessage.
+    def generate(self, sender : str, ofType : str, size : int, delayMean : float, receiver : str, random : RandomStream = None) -> list:
+        sizes = splitSizes(size, self.__bodySize)
+
+        if random is None:
+            random = threadStream()
+
+        if ofType == 'LEGIT' and self.__executor is not None and len(sizes) >= self.__minSplits:
+            msgId = str(ObjectId())
+            job   = sender + '/' + str(random.index(2 ** 32))
+
+            try:
+                return list(self.__executor.map(encodeSplit,
+                                                 repeat(sender),
+                                                 repeat(receiver),
+                                                 repeat(msgId),
+                                                 range(len(sizes)),
+                                                 sizes,
+                                                 repeat(delayMean),
+                                                 repeat(job)))
+
+            # Worker pool is broken or shut down, fall back to serial encoding for good.
+            except RuntimeError:
+                self.__executor = None
+
+        return generateMessage(self.__pki,
+                               sender,
+                               ofType,
+                               self.__params,
+                               size,
+                               self.__bodySize,
+                               delayMean,
+                               self.__users,
+                               receiver,
+                               random)
+
+    # wait - wait until the worker processes exit, see DecoyPool.close.
+    def close(self, wait : bool = False):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,223 @@
+from time      import time
+from queue     import Empty
+from queue     import SimpleQueue
+from struct    import Struct
+from logging   import info
+from threading import Lock
+from threading import local
+from threading import Thread
+from constants import TYPE_TO_ID
+from constants import ID_TO_TYPE
+from constants import EVENTLOG_READ
+from constants import EVENTLOG_BATCH
+from constants import EVENTLOG_FLUSH
+
+"""
+Binary event log. Every packet sent or delivered by a client or a node is a fixed-size record
+instead of a formatted line of text. The records are packed into a small per-thread buffer, so the
+packet path takes no lock and formats no strings, full buffers are written to the file by a
+background thread. The writer also writes the records of the partially filled buffers periodically,
+so the records of an idle thread are not held until the end of the run and survive a crash. A buffer
+is only appended to by its thread, and a record is counted as used once it is packed, so the writer
+reads the used part without a lock. exportText converts a binary log to the text format of the
+logging module.
+"""
+
+# Record - timestamp (epoch seconds), sender, receiver, message ID (12 bytes of the bson ObjectId),
+# split, message type, padded to 36 bytes.
+RECORD = Struct('<dII12sIB3x')
+
+# Mixnet entities are encoded as an integer - the kind of the entity (the first character of its ID,
+# its index in ENTITY_KINDS) in the top byte, followed by the 6 digit ID number.
+ENTITY_KINDS = 'ump'
+
+"""
+PRIVATE
+"""
+
+__state = dict()
+
+"""
+PUBLIC
+"""
+
+def encodeEntity(entityId : str) -> int:
+    return ENTITY_KINDS.index(entityId[0]) << 24 | int(entityId[1:])
+
+def decodeEntity(code : int) -> str:
+    return ENTITY_KINDS[code >> 24] + "{:06d}".format(code & 0xFFFFFF)
+
+# Records of a single thread waiting for the writer. The thread appends records up to used, the
+# writer has written them up to written.
+class Batch:
+
+    def __init__(self, size : int):
+        self.data    = bytearray(size * RECORD.size)
+        self.used    = 0
+        self.written = 0
+
+class EventLog:
+
+    # path     - the binary log file.
+    # batch    - the number of records buffered per thread before they are handed to the writer.
+    # interval - seconds between the writes of the partially filled buffers.
+    def __init__(self, path : str, batch : int = EVENTLOG_BATCH, interval : float = EVENTLOG_FLUSH):
+        self.__file     = open(path, 'wb')
+        self.__lock     = Lock()
+        self.__batch    = batch
+        self.__interval = interval
+        self.__local   = local()
+        self.__queue   = SimpleQueue()
+        self.__batches = []
+        self.__written = 0
+        self.__writer  = Thread(target=self.__write, daemon=True)
+
+        self.__writer.start()
+
+    # Record a packet sent from the sender to the receiver, or delivered to the receiver.
+    # timestamp - epoch seconds.
+    # msgId     - message ID, string in the pymongo bson ObjectId format.
+    # split     - 5 digit string ordinal number of the split.
+    # ofType    - enum, 'LEGIT', 'DROP', 'LOOP' or 'LOOP_MIX'.
+    def log(self, timestamp : float, sender : str, receiver : str, msgId : str, split : str, ofType : str):
+        batch = getattr(self.__local, 'batch', None)
+
+        if batch is None:
+            batch = self.__newBatch()
+
+        RECORD.pack_into(batch.data,
+                         batch.used,
+                         timestamp,
+                         encodeEntity(sender),
+                         encodeEntity(receiver),
+                         bytes.fromhex(msgId),
+                         int(split),
+                         TYPE_TO_ID[ofType])
+
+        batch.used += RECORD.size
+
+        # Hand the full buffer over to the writer and continue in a new one.
+        if batch.used == len(batch.data):
+            self.__queue.put(batch)
+            self.__newBatch(batch)
+
+    # Write the partially filled buffers of all the threads and close the file. The threads should
+    # not log anymore.
+    def close(self,):
+        with self.__lock:
+            for batch in self.__batches:
+                if batch.used > 0:
+                    self.__queue.put(batch)
+
+            self.__batches = []
+
+        self.__queue.put(None)
+        self.__writer.join()
+        self.__file.close()
+
+    # The number of records and bytes written so far.
+    def stats(self,) -> dict:
+        return { 'records' : self.__written // RECORD.size, 'bytes' : self.__written }
+
+    # Give the calling thread a new buffer, replacing the full one.
+    def __newBatch(self, full : Batch = None) -> Batch:
+        batch              = Batch(self.__batch)
+        self.__local.batch = batch
+
+        with self.__lock:
+            if full is not None:
+                self.__batches.remove(full)
+
+            self.__batches += [batch]
+
+        return batch
+
+    # Write the records of a buffer the writer did not write yet.
+    def __writeBatch(self, batch : Batch):
+        used = batch.used
+
+        if used > batch.written:
+            self.__file.write(memoryview(batch.data)[batch.written:used])
+
+            self.__written += used - batch.written
+            batch.written   = used
+
+    # Write the full buffers as they come, and the records of all the partially filled buffers every
+    # interval, flushed to the OS.
+    def __write(self,):
+        flushAt = time() + self.__interval
+
+        while True:
+            try:
+                batch = self.__queue.get(timeout=max(0., flushAt - time()))
+
+                if batch is None:
+                    break
+
+                self.__writeBatch(batch)
+            except Empty:
+                pass
+
+            if time() >= flushAt:
+                with self.__lock:
+                    batches = list(self.__batches)
+
+                for batch in batches:
+                    self.__writeBatch(batch)
+
+                self.__file.flush()
+
+                flushAt = time() + self.__interval
+
+# Start logging to a binary event log instead of the logging module.
+def startEventLog(path : str):
+    __state['log'] = EventLog(path)
+
+# Stop the binary event log, returns its stats. None when the logging module is used.
+def stopEventLog() -> dict:
+    log = __state.pop('log', None)
+
+    if log is None:
+        return None
+
+    log.close()
+
+    return log.stats()
+
+# Log a packet sent or delivered, see EventLog.log. Without a binary event log, it is formatted as a
+# line of text for the logging module.
+def logEvent(timestamp : float, sender : str, receiver : str, msgId : str, split : str, ofType : str):
+    log = __state.get('log')
+
+    if log is not None:
+        log.log(timestamp, sender, receiver, msgId, split, ofType)
+    else:
+        info('%s %s %s %s %s %s', "{:.7f}".format(timestamp), sender, receiver, msgId, split, ofType)
+
+# Iterate over the records of a binary event log, read in chunks of whole records. Yields tuples of
+# (timestamp, sender, receiver, msgId, split, ofType) in the format of the text log.
+def readEventLog(path : str, records : int = EVENTLOG_READ):
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(records * RECORD.size)
+
+            # A record cut off at the end of the file, e.g. by a crash, is skipped.
+            chunk = chunk[:len(chunk) - len(chunk) % RECORD.size]
+
+            if not chunk:
+                break
+
+            for timestamp, sender, receiver, msgId, split, typeId in RECORD.iter_unpack(chunk):
+                yield (timestamp,
+                       decodeEntity(sender),
+                       decodeEntity(receiver),
+                       msgId.hex(),
+                       "{:05d}".format(split),
+                       ID_TO_TYPE[typeId])
+
+# Convert a binary event log to the text log, as written by the logging module. Records of different
+# threads are written in batches, so unlike in the text log, they are not ordered by time.
+def exportText(path : str, output : str):
+    with open(output, 'w', encoding='utf-8') as file:
+        for timestamp, sender, receiver, msgId, split, ofType in readEventLog(path):
+            file.write('INFO:root:{:.7f} {} {} {} {} {}\n'.format(timestamp, sender, receiver, msgId, split, ofType))
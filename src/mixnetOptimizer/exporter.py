@@ -0,0 +1,20 @@
+from argparse import ArgumentParser
+from eventlog import exportText
+
+"""
+Converts a binary event log to the text log format.
+"""
+
+if __name__ == "__main__":
+    
+    # Get command line arguments.
+    parser = ArgumentParser()
+
+    parser.add_argument('--eventLog', type=str, default="../../logs/logs.bin")
+    parser.add_argument('--output',   type=str, default="../../logs/logs.log")
+
+    args     = parser.parse_args()
+    eventLog = args.eventLog
+    output   = args.output
+
+    exportText(eventLog, output)
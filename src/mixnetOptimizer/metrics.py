@@ -0,0 +1,163 @@
+from json        import dump
+from json        import dumps
+from time        import time
+from threading   import Lock
+from threading   import Thread
+from http.server import ThreadingHTTPServer
+from http.server import BaseHTTPRequestHandler
+from buffers     import CopyCounter
+from aggregators import LatencyHistogram
+from constants   import TYPE_TO_ID
+
+"""
+Live metrics of the mixnet nodes. Every node counts the packets it receives and sends per type and
+records the time it spends unwrapping and sending the packets and how late its timers fire. The
+metrics of the received packets (unwrap, packetsIn, maxQueue, dropped, relayed) are updated under the
+node's unwrap lock - by its I/O thread, or with nodeWorkers by the callback thread of the processing
+pool. The sender thread alone updates send, lateness and packetsOut, the I/O thread alone the received
+bytes and the pauses. So no metric has two concurrent writers and the updates cost a counter increment
+or a histogram record.
+The snapshots are read by the HTTP and reporting threads without any lock, they rely on the GIL: a
+snapshot is not an atomic cut of all the counters, and a histogram read while it records may be off
+by the sample in flight, but no update is lost.
+The snapshots of all the nodes are served as JSON over a local HTTP endpoint and dumped to a file at
+the end of a run.
+"""
+
+"""
+PUBLIC
+"""
+
+# Summary of a histogram of seconds.
+def summary(histogram : LatencyHistogram) -> dict:
+    return { 'count' : histogram.count,
+             'mean'  : histogram.mean,
+             'p50'   : histogram.percentile(0.5),
+             'p99'   : histogram.percentile(0.99),
+             'max'   : histogram.max }
+
+# Counters and histograms of a single node.
+class NodeMetrics:
+
+    def __init__(self,):
+
+        # Packets received and sent, per message type.
+        self.packetsIn  = dict([(ofType, 0) for ofType in TYPE_TO_ID])
+        self.packetsOut = dict([(ofType, 0) for ofType in TYPE_TO_ID])
+
+        # The largest depth of the message queue so far.
+        self.maxQueue = 0
+
+        # Seconds spent unwrapping a packet, sending a packet and the lateness of the timers.
+        self.unwrap   = LatencyHistogram()
+        self.send     = LatencyHistogram()
+        self.lateness = LatencyHistogram()
+
+        # Buffers allocated and bytes copied on receiving the packets, by the I/O thread, and on 
+        # re-packing the relayed ones, by the thread that unwraps them.
+        self.received = CopyCounter()
+        self.relayed  = CopyCounter()
+
+        # Overload of the message queue: the packets dropped per type because the queue was full, the
+        # number of times the reads were paused and the seconds they were paused for.
+        self.dropped = dict([(ofType, 0) for ofType in TYPE_TO_ID])
+        self.pauses  = 0
+        self.paused  = 0.
+
+    # queue   - the current depth of the node's message queue.
+    # replay  - the stats of the node's replay tag cache.
+    # buffers - the stats of the node's pool of receive buffers.
+    def snapshot(self, queue : int, replay : dict, buffers : dict) -> dict:
+        packets     = max(1, sum(self.packetsIn.values()))
+        allocations = self.received.allocations + self.relayed.allocations + buffers['allocations']
+        copied      = self.received.copied + self.relayed.copied
+
+        snapshot               = dict()
+        snapshot['packetsIn' ] = dict(self.packetsIn)
+        snapshot['packetsOut'] = dict(self.packetsOut)
+        snapshot['queue'     ] = { 'depth' : queue, 'max' : self.maxQueue }
+        snapshot['unwrap'    ] = summary(self.unwrap)
+        snapshot['send'      ] = summary(self.send)
+        snapshot['lateness'  ] = summary(self.lateness)
+        snapshot['replay'    ] = replay
+        snapshot['overload'  ] = { 'dropped' : dict(self.dropped), 'pauses' : self.pauses, 'paused' : self.paused }
+        snapshot['buffers'   ] = { 'allocations'       : allocations,
+                                   'copied'            : copied,
+                                   'allocationsPerHop' : allocations / packets,
+                                   'copiedPerHop'      : copied / packets,
+                                   'pool'              : buffers }
+
+        return snapshot
+
+# The overload of the nodes summed over their snapshots: the packets dropped per type because of the
+# full queues, the number of the pauses of the reads and the seconds the reads were paused for.
+def overloadStats(snapshots : list) -> dict:
+    stats = { 'dropped' : dict([(ofType, 0) for ofType in TYPE_TO_ID]), 'pauses' : 0, 'paused' : 0. }
+
+    for snapshot in snapshots:
+        for ofType, dropped in snapshot['overload']['dropped'].items():
+            stats['dropped'][ofType] += dropped
+
+        stats['pauses'] += snapshot['overload']['pauses']
+        stats['paused'] += snapshot['overload']['paused']
+
+    return stats
+
+# The nodes whose metrics are served and dumped. A node provides its snapshot through its metrics
+# method.
+class MetricsRegistry:
+
+    def __init__(self,):
+        self.__lock  = Lock()
+        self.__nodes = dict()
+
+    def register(self, nodeId : str, node):
+        with self.__lock:
+            self.__nodes[nodeId] = node
+
+    # Snapshot of all the registered nodes, maps the node ID to its metrics.
+    def snapshot(self,) -> dict:
+        with self.__lock:
+            nodes = list(self.__nodes.items())
+
+        return { 'time' : time(), 'nodes' : dict([(nodeId, node.metrics()) for nodeId, node in nodes]) }
+
+    # Write a snapshot to a JSON file, e.g. at the end of a run.
+    def dump(self, path : str):
+        with open(path, 'w', encoding='utf-8') as file:
+            dump(self.snapshot(), file, indent=4)
+
+# Local HTTP endpoint serving a fresh snapshot of the registry as JSON on every GET request, e.g.
+# curl http://127.0.0.1:<port>/metrics. Poll it for the periodic snapshots.
+class MetricsServer:
+
+    # port - the port on the local host, 0 picks a free one.
+    def __init__(self, registry : MetricsRegistry, port : int = 0):
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self,):
+                body = dumps(registry.snapshot()).encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            # The requests are not logged, the root logger writes the packet log.
+            def log_message(self, format, *args):
+                pass
+
+        self.__server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.__thread = Thread(target=self.__server.serve_forever, daemon=True)
+
+        self.__thread.start()
+
+    # The port at which the snapshots are served.
+    @property
+    def port(self,) -> int:
+        return self.__server.server_address[1]
+
+    def close(self,):
+        self.__server.shutdown()
+        self.__server.server_close()
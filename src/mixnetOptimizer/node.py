@@ -1,82 +1,133 @@
+from pki                    import CompiledPKI
 from time                   import time
-from time                   import sleep
+from time                   import perf_counter
 from util                   import sendPacket
+from util                   import unpacksViews
+from util                   import unwrapPacket
+from util                   import updateEntropy
 from util                   import generateMessage
-from numpy                  import log2
+from decoys                 import DecoyPool
 from queue                  import SimpleQueue
 from queue                  import PriorityQueue
+from heapq                  import heapify
 from socket                 import socket
 from socket                 import AF_INET
 from socket                 import SOCK_STREAM
-from logging                import info
+from replay                 import ReplayCache
+from scheduler              import Scheduler
+from parameters             import ParameterStore
+from eventlog               import logEvent
+from metrics                import NodeMetrics
+from functools              import partial
+from threading              import Lock
 from threading              import Thread
 from selectors              import EVENT_READ
 from selectors              import DefaultSelector
-from constants              import LAMBDAS
-from constants              import ID_TO_TYPE
-from numpy.random           import exponential
-from sphinxmix.SphinxNode   import sphinx_process
+from constants              import REPLAY_EPOCH
+from constants              import REPLAY_CAPACITY
+from constants              import NODE_PORT_BASE
+from constants              import READER_BUFFERS
+from constants              import QUEUE_POLL
+from constants              import QUEUE_POLICY
+from constants              import QUEUE_RESUME
+from processing             import ProcessingPool
+from randomness             import workerStream
+from connections            import FrameReader
+from buffers                import BufferPool
+from petlib.bn              import Bn
 from sphinxmix.SphinxParams import SphinxParams
-from sphinxmix.SphinxClient import PFdecode
 from sphinxmix.SphinxClient import Dest_flag
 from sphinxmix.SphinxClient import Relay_flag
-from sphinxmix.SphinxClient import pack_message
-from sphinxmix.SphinxClient import unpack_message
-from sphinxmix.SphinxClient import receive_forward
 
 class Node:
     
-    # nodeId     - 'm' for mix, 'p' for provider, followed by 6 digit ID string. providers are also 
-    #              identified by being on the 0th layer.
-    # bodySize   - the size of plaintext in any mixnet packet in bytes.
-    # cmdQueue   - queue synchronized with the optimizer. The optimizer uses it to propagate the 
-    #              mixnet parameter updates across the network. It can also be used to send an empty 
-    #              command that initiates the graceful termination of the mixnet.
-    # addBuffer  - The excess of bytes that are needed to fully transfer a sphinx packet. Setting 
-    #              the buffer size to bodySize + headerLen is not enough, about 40 additional bytes 
-    #              are needed.
-    # eventQueue - queue synchronized with optimizer. It is used to inform the optimizer when 
-    #              a LEGIT message is received by the provider and ready for delivery to a user. The 
-    #              optimizer compares the time when the message is received with the time when 
-    #              it was sent to compute the E2E latency. Mixes, also inform the optimizer about 
-    #              their entropy.
+    # nodeId      - 'm' for mix, 'p' for provider, followed by 6 digit ID string. providers are also 
+    #               identified by being on the 0th layer.
+    # bodySize    - the size of plaintext in any mixnet packet in bytes.
+    # parameters  - store of the mixnet parameters shared with the optimizer. The optimizer publishes
+    #               the parameter updates to it and sets its shutdown event to initiate the graceful
+    #               termination of the mixnet.
+    # eventQueue  - queue synchronized with optimizer. It is used to inform the optimizer when 
+    #               a LEGIT message is received by the provider and ready for delivery to a user. The 
+    #               optimizer compares the time when the message is received with the time when 
+    #               it was sent to compute the E2E latency. Mixes, also inform the optimizer about 
+    #               their entropy.
+    # scheduler   - timers shared by the workers of the threaded engine. The sender worker sleeps 
+    #               until its next deadline or until a packet is enqueued for the relay.
+    # portBase    - the node listens at portBase plus the number of its ID, so mixnets running side 
+    #               by side use disjoint port ranges.
+    # address     - host and port at which the node listens instead, e.g. when the nodes are sharded 
+    #               over several hosts.
+    # secretKey   - the node's secret key, a new one is generated when None.
+    # queueLimit  - the number of packets the message queue holds before the node is overloaded, 
+    #               unbounded when None.
+    # queuePolicy - what the overloaded node does with a packet to relay:
+    #                   - 'dropNewest' drops it.
+    #                   - 'dropDecoys' drops it when it is a decoy, otherwise drops a queued decoy to 
+    #                     make room for it, or drops it when there is none.
+    #                   - 'pauseReads' stops reading the node's connections until the queue drains 
+    #                     below QUEUE_RESUME of the limit, so the senders are blocked by TCP. Packets
+    #                     already received are still queued, none is dropped.
     def __init__(self, 
-                 layer      : int, 
-                 nodeId     : str, 
-                 params     : SphinxParams, 
-                 bodySize   : int, 
-                 cmdQueue   : PriorityQueue,
-                 addBuffer  : int,
-                 eventQueue : SimpleQueue):
+                 layer       : int, 
+                 nodeId      : str, 
+                 params      : SphinxParams, 
+                 bodySize    : int, 
+                 parameters  : ParameterStore,
+                 eventQueue  : SimpleQueue,
+                 scheduler   : Scheduler,
+                 portBase    : int = NODE_PORT_BASE,
+                 address     : tuple = None,
+                 secretKey   : Bn = None,
+                 queueLimit  : int = None,
+                 queuePolicy : str = QUEUE_POLICY):
+
+        assert queuePolicy in ['dropNewest', 'dropDecoys', 'pauseReads']
 
         # For entropy computation.
         self.__h = 0
         self.__k = 0
         self.__l = 0
 
-        self.__port       = 49152 + int(nodeId[1:])
+        self.__host       = '127.0.0.1' if address is None else address[0]
+        self.__port       = portBase + int(nodeId[1:]) if address is None else address[1]
         self.__layer      = layer
         self.__params     = params
         self.__nodeId     = nodeId
-        self.__lambdas    = LAMBDAS
-        self.__lastCmd    = 0.
+        self.__lambdas    = parameters.current.lambdas
+        self.__version    = parameters.current.version
         self.__bodySize   = bodySize
-        self.__cmdQueue   = cmdQueue
+        self.__parameters = parameters
+        self.__decoyPool  = None
         self.__selector   = DefaultSelector()
-        self.__tagCache   = set()
-        self.__addBuffer  = addBuffer
+        self.__tagCache   = ReplayCache(REPLAY_CAPACITY, REPLAY_EPOCH, time())
+        self.__readers    = dict()
+        self.__unwrapLock = Lock()
+        self.__processing = None
         self.__eventQueue = eventQueue
+        self.__scheduler  = scheduler
+        self.__wakeup     = scheduler.wakeup()
+        self.__metrics    = NodeMetrics()
+        self.__random     = workerStream(nodeId)
+
+        # Backpressure. The reads are paused since the given time, None when they are not.
+        self.__queueLimit  = queueLimit
+        self.__queuePolicy = queuePolicy
+        self.__pausedSince = None
+
+        # A packed Sphinx packet is slightly larger than its header and body, the receive buffers leave
+        # room for a few frames in flight. The buffers of the closed connections are reused.
+        self.__buffers = BufferPool(4 * (params.max_len + params.m), READER_BUFFERS)
 
         # Generate key pair.
-        self.__secretKey    = params.group.gensecret()
+        self.__secretKey    = params.group.gensecret() if secretKey is None else secretKey
         self.__publicKey    = params.group.expon(params.group.g, [ self.__secretKey ])
-        self.__paramsDict   = { (params.max_len, params.m) : params }
         self.__messageQueue = PriorityQueue()
         
         # Instantiate listener worker.
         server = socket(AF_INET, SOCK_STREAM)
         
-        server.bind(('127.0.0.1', self.__port))
+        server.bind((self.__host, self.__port))
         server.listen()
         server.setblocking(False)
         self.__selector.register(server, EVENT_READ, self.__acceptConnection)
@@ -84,6 +135,7 @@ class Node:
     # Export minimal node PKI info in a dict.
     def toPKIView(self,) -> dict:
         node              = dict()
+        node['host'     ] = self.__host
         node['port'     ] = self.__port
         node['layer'    ] = self.__layer
         node['nodeId'   ] = self.__nodeId
@@ -91,106 +143,221 @@ class Node:
 
         return node
 
-    def setPKI(self, pki : dict):
+    # Counters of the replay tag cache.
+    def replayStats(self,) -> dict:
+        return self.__tagCache.stats()
+
+    # Snapshot of the node's live metrics, see metrics.py.
+    def metrics(self,) -> dict:
+        return self.__metrics.snapshot(len(self.__messageQueue.queue), self.__tagCache.stats(), self.__buffers.stats())
+
+    # pki - CompiledPKI shared by all the nodes and clients of the mixnet.
+    def setPKI(self, pki : CompiledPKI):
         self.__pki = pki
+
+    # decoyPool - optional pool of pre-generated LOOP_MIX packets. When it is None or has no packet
+    #             ready, the mix generates the LOOP_MIX packet synchronously.
+    def setDecoyPool(self, decoyPool : DecoyPool):
+        self.__decoyPool = decoyPool
+
+    # processing - optional pool of worker processes that unwraps the received packets. When it is 
+    #              None, the packets are unwrapped in the node's I/O thread.
+    def setProcessingPool(self, processing : ProcessingPool):
+        self.__processing = processing
+        self.__secretHex  = self.__secretKey.hex()
         
     def __acceptConnection(self, server : socket, mask):
         conn, _ = server.accept()
 
         conn.setblocking(False)
-        self.__selector.register(conn, EVENT_READ, self.__processPacket)
 
-    # Receives and processes Sphinx packet.
-    def __processPacket(self, conn : socket, mask):
-        
-        # 37 holds for body_len = 2 ** x for 8 <= x < 16.
-        data = conn.recv(self.__params.max_len + self.__params.m + self.__addBuffer)
-
-        if data: 
-            unpacked = unpack_message(self.__paramsDict, data)
-            header   = unpacked[1][0]
-            delta    = unpacked[1][1]
-
-            processed = sphinx_process(self.__params, self.__secretKey, header, delta)
-            tag       = processed[0]
-            routing   = processed[1]
-
-            routing = PFdecode(self.__params, routing)
-            flag    = routing[0]
-
-            # Check for tagging and replay attacks. Prevent repeating packets by keeping their tags
-            # in a cache.
-            if tag in self.__tagCache:
-                print('REPLAY ATTACK')
-                return
-            else:
-                self.__tagCache.add(tag)
-
-            if flag == Relay_flag:
-                nextNode  = routing[1][0]
-                delay     = routing[1][1]
-                messageId = routing[1][2]
-                split     = routing[1][3]
-                ofType    = ID_TO_TYPE[routing[1][4]]
-
-                # Prepare message for the relay, put it on sender's queue, and inform it about 
-                # sending time. Add logging info in the queueTuple to monitor traffic (routing info 
-                # contains ground truth).
-                packed      = pack_message(self.__params, processed[2])
-                queueTuple  = (packed, nextNode, messageId, split, ofType)
-                sendingTime = time() + delay
-
-                self.__messageQueue.put((sendingTime, queueTuple))
-
-                self.__k += 1
-
-            elif flag == Dest_flag:
-                delta  = processed[2][1]
-                macKey = processed[3]
-
-                dest, _ = receive_forward(self.__params, macKey, delta)
-
-                destination = dest[0].decode('utf-8')
-                msgId       = dest[1]
-                split       = dest[2]
-                ofType      = ID_TO_TYPE[dest[3]]
-                timeStr     = "{:.7f}".format(time())
-
-                # Log packet delivery.
-                info('%s %s %s %s %s %s', timeStr, self.__nodeId, destination, msgId, split, ofType)
-
-                # Inform the optimizer that a LEGIT packet is ready for the delivery to a user.
-                if ofType == 'LEGIT':
-                    self.__eventQueue.put((msgId, timeStr))
+        # A connection accepted while the reads are paused is read once they resume.
+        if self.__pausedSince is None:
+            self.__selector.register(conn, EVENT_READ, self.__receive)
+
+        self.__readers[conn] = FrameReader(self.__buffers.size, self.__buffers, self.__metrics.received)
+
+    # Receives framed Sphinx packets from a persistent connection. The stream may deliver partial or 
+    # multiple frames at once, so bytes are reassembled per connection and every complete frame is
+    # processed. The packets unwrapped in this thread are not copied out of the receive buffer, the
+    # ones handed over to the processing pool are.
+    def __receive(self, conn : socket, mask):
+        reader = self.__readers[conn]
+
+        if reader.receive(conn) > 0: 
+            for packet in reader.frames(copy=self.__processing is not None or not unpacksViews()):
+                self.__processPacket(packet)
         else:
 
             # Close connection.
+            del self.__readers[conn]
+
+            reader.close()
+
             self.__selector.unregister(conn)
             conn.close()  
 
-    # Worker that probes the message queue periodically emits decoy traffic and sends packets.
+    # Processes a single Sphinx packet. With a processing pool, the packet is unwrapped by a worker 
+    # process and the result is handled once it is ready.
+    def __processPacket(self, data : bytes):
+        began = perf_counter()
+
+        if self.__processing is not None:
+            self.__processing.submit(self.__secretHex, data, partial(self.__handlePooled, began))
+        else:
+            self.__handleUnwrapped(*unwrapPacket(self.__params, self.__secretKey, data), perf_counter() - began)
+
+    # Result of the processing pool. The unwrap time includes the wait for a worker process.
+    def __handlePooled(self, began : float, tag : bytes, flag, routing : tuple):
+        self.__handleUnwrapped(tag, flag, routing, perf_counter() - began)
+
+    # Checks the replay tag of an unwrapped packet and relays or delivers it. Results of the worker 
+    # processes arrive from other threads, so the replay check and the queue update are serialized.
+    # elapsed - seconds it took to unwrap the packet.
+    def __handleUnwrapped(self, tag : bytes, flag, routing : tuple, elapsed : float):
+        with self.__unwrapLock:
+            self.__metrics.unwrap.record(elapsed)
+            self.__relayOrDeliver(tag, flag, routing)
+
+    def __relayOrDeliver(self, tag : bytes, flag, routing : tuple):
+
+        # Check for tagging and replay attacks. Prevent repeating packets by keeping their tags
+        # in a cache.
+        if self.__tagCache.seen(tag, time()):
+            print('REPLAY ATTACK')
+            return
+
+        if flag == Relay_flag:
+            packed    = routing[0]
+            nextNode  = routing[1]
+            delay     = routing[2]
+            messageId = routing[3]
+            split     = routing[4]
+            ofType    = routing[5]
+
+            # Put the message prepared for the relay on sender's queue, and inform it about sending
+            # time. Add logging info in the queueTuple to monitor traffic (routing info contains 
+            # ground truth).
+            queueTuple  = (packed, nextNode, messageId, split, ofType)
+            sendingTime = time() + delay
+
+            # The queue is full, the policy drops a packet unless the reads are paused instead.
+            if self.__overloaded() and self.__queuePolicy != 'pauseReads':
+                if self.__queuePolicy == 'dropNewest' or ofType != 'LEGIT' or not self.__dropDecoy():
+                    self.__metrics.dropped[ofType] += 1
+                    return
+
+            # Sphinx packs the relayed packet into a new buffer.
+            self.__metrics.relayed.copy(len(packed))
+
+            self.__messageQueue.put((sendingTime, queueTuple))
+            self.__wakeup.notify()
+
+            self.__k += 1
+
+            self.__metrics.packetsIn[ofType] += 1
+            self.__metrics.maxQueue           = max(self.__metrics.maxQueue, len(self.__messageQueue.queue))
+
+        elif flag == Dest_flag:
+            destination = routing[0]
+            msgId       = routing[1]
+            split       = routing[2]
+            ofType      = routing[3]
+            now         = time()
+
+            # Log packet delivery.
+            logEvent(now, self.__nodeId, destination, msgId, split, ofType)
+
+            self.__metrics.packetsIn[ofType] += 1
+
+            # Inform the optimizer that a LEGIT packet is ready for the delivery to a user.
+            if ofType == 'LEGIT':
+                self.__eventQueue.put((msgId, "{:.7f}".format(now)))
+
+    def __overloaded(self,) -> bool:
+        return self.__queueLimit is not None and len(self.__messageQueue.queue) >= self.__queueLimit
+
+    # Make room for a LEGIT packet in the full queue by dropping a queued decoy, the latest one in the
+    # heap's order. The dropped decoy leaves the pool of the entropy, it is taken from the packets
+    # that arrived since the last send first, the queue does not tell when it arrived. Returns whether
+    # a decoy was dropped.
+    def __dropDecoy(self,) -> bool:
+        queue = self.__messageQueue
+
+        with queue.mutex:
+            for idx in range(len(queue.queue) - 1, -1, -1):
+                ofType = queue.queue[idx][1][4]
+
+                if ofType != 'LEGIT':
+                    queue.queue[idx] = queue.queue[-1]
+
+                    queue.queue.pop()
+                    heapify(queue.queue)
+
+                    self.__metrics.dropped[ofType] += 1
+
+                    if self.__k > 0:
+                        self.__k -= 1
+                    elif self.__l > 0:
+                        self.__l -= 1
+
+                    return True
+
+        return False
+
+    # Pause the reads of all the connections when the queue is full, resume them once it drained.
+    # Called from the I/O thread, which owns the selector.
+    def __backpressure(self,):
+        if self.__pausedSince is None and self.__overloaded():
+            for conn in self.__readers:
+                self.__selector.unregister(conn)
+
+            self.__pausedSince     = time()
+            self.__metrics.pauses += 1
+
+        elif self.__pausedSince is not None and len(self.__messageQueue.queue) <= QUEUE_RESUME * self.__queueLimit:
+            for conn in self.__readers:
+                self.__selector.register(conn, EVENT_READ, self.__receive)
+
+            self.__metrics.paused += time() - self.__pausedSince
+            self.__pausedSince     = None
+
+    # Worker that waits for the next relay deadline or LOOP_MIX timer, emits decoy traffic and sends
+    # packets.
     def __sender(self,):
 
         # Instantiate state.
         data          = None
-        sendingTime   = time() + exponential(self.__lambdas['LOOP_MIX'])
+        sendingTime   = time() + self.__random.exponential(self.__lambdas['LOOP_MIX'])
         generatedLoop = False
 
         while True:
 
             # Check if there is any message to send and its delay has passed.
             if not self.__messageQueue.empty() and self.__messageQueue.queue[0][0] < time():
-                data = self.__messageQueue.get()[1]
+                deadline, data = self.__messageQueue.get()
+
+                self.__scheduler.fired(deadline)
+                self.__metrics.lateness.record(max(0., time() - deadline))
 
             # Node that is a mix generates LOOP_MIX decoy traffic periodically.
             elif self.__layer != 0 and sendingTime < time():
-                data = generateMessage(self.__pki, 
-                                       self.__nodeId, 
-                                       'LOOP_MIX', 
-                                       self.__params, 
-                                       self.__bodySize, 
-                                       self.__bodySize,
-                                       self.__lambdas['DELAY'])[0]
+                self.__scheduler.fired(sendingTime)
+                self.__metrics.lateness.record(max(0., time() - sendingTime))
+
+                if self.__decoyPool is not None:
+                    data = self.__decoyPool.pop(self.__nodeId, 'LOOP_MIX')
+
+                # No pool or no pre-generated packet ready.
+                if data is None:
+                    data = generateMessage(self.__pki, 
+                                           self.__nodeId, 
+                                           'LOOP_MIX', 
+                                           self.__params, 
+                                           self.__bodySize, 
+                                           self.__bodySize,
+                                           self.__lambdas['DELAY'],
+                                           random=self.__random)[0]
                 
                 generatedLoop = True
 
@@ -202,82 +369,90 @@ class Node:
                 msgId       = data[2]
                 split       = data[3]
                 ofType      = data[4]
-                nextAddress = self.__pki[nextNode]['port']
+                nextAddress = self.__pki.address(nextNode)
+
+                began = perf_counter()
 
                 sendPacket(packet, nextAddress)
 
+                self.__metrics.send.record(perf_counter() - began)
+                self.__metrics.packetsOut[ofType] += 1
+
                 # Logging.
-                timeStr = "{:.7f}".format(time())
+                now = time()
 
-                info('%s %s %s %s %s %s', timeStr, self.__nodeId, nextNode, msgId, split, ofType)
+                logEvent(now, self.__nodeId, nextNode, msgId, split, ofType)
                 
                 # Reset state.
                 data = None
 
                 # Sample the sending time of next LOOP_MIX decoy message.
                 if generatedLoop:
-                    sendingTime   = time() + exponential(self.__lambdas['LOOP_MIX'])
+                    sendingTime   = time() + self.__random.exponential(self.__lambdas['LOOP_MIX'])
                     generatedLoop = False
 
                 # On sending a message compute the entropy incrementally.
                 elif self.__k != 0 or self.__l != 0:
-                    denominator = (self.__k + self.__l)
-                    h_t         = self.__l * self.__h / denominator
-
-                    if self.__k != 0:
-                        h_t += self.__k * log2(self.__k) / denominator
-                        h_t -= self.__k / denominator * log2(self.__k / denominator)
-
-                    if self.__l != 0:
-                        h_t -= self.__l / denominator * log2(self.__l / denominator)
+                    h_t = updateEntropy(self.__h, self.__k, self.__l)
 
                     # Inform the optimizer about the current entropy level.
-                    self.__eventQueue.put((self.__nodeId, float(h_t)))
+                    self.__eventQueue.put((self.__nodeId, h_t))
 
                     self.__h = h_t
                     self.__l = len(self.__messageQueue.queue)
                     self.__k = 0
 
-            # Empty command gracefully terminates the worker.
-            if not self.__cmdQueue.empty():
-                cmd = self.__cmdQueue.get()
+            # The shutdown event gracefully terminates the worker.
+            if self.__parameters.shutdown.is_set():
+                break
+
+            # Pick up the latest parameters published by the optimizer.
+            current = self.__parameters.current
+
+            if self.__version != current.version:
+                self.__lambdas = current.lambdas
+                self.__version = current.version
 
-                if len(cmd) == 0:
-                    self.__cmdQueue.put([])
-                    break
+                self.__parameters.acknowledge(current.version)
 
-                # Update the mixnet parameters.
-                elif self.__lastCmd < cmd[0]:
-                    self.__lambdas = cmd[1][1]
-                    self.__lastCmd = cmd[0]
+            # Sleep until the next packet is due, a new packet is enqueued or the optimizer publishes
+            # new parameters.
+            self.__wakeup.wait(self.__nextDeadline(sendingTime))
 
-                    cmd[1][0] -= 1
-                    
-                # When the counter reaches 0, all workers have successfully updated their 
-                # parameters.
-                if cmd[1][0] > 0:
-                    self.__cmdQueue.put(cmd)
-            else:
-                sleep(0.01)
+    # The earliest of the relay deadline at the head of the message queue and the LOOP_MIX timer.
+    # Providers do not emit LOOP_MIX traffic, they only wait for the relays.
+    def __nextDeadline(self, sendingTime : float) -> float:
+        deadline = sendingTime if self.__layer != 0 else float('inf')
+
+        try:
+            deadline = min(deadline, self.__messageQueue.queue[0][0])
+        except IndexError:
+            pass
+
+        return deadline
 
     # Run the server.
     def start(self,):
 
-        # Instantiate worker that probes the message queue periodically, emits decoy traffic and 
-        # sends packets.
+        # Instantiate worker that waits for the relay deadlines, emits decoy traffic and sends 
+        # packets. It is woken up when the optimizer publishes new parameters or shuts down.
         nodeSender = Thread(target=self.__sender)
 
+        self.__parameters.subscribe(self.__wakeup.notify)
         nodeSender.start()
         
-        # Serve multiple connections.
+        # Serve multiple connections. While the reads are paused, the queue is polled until it drains.
         while True:
-            events = self.__selector.select(timeout=LAMBDAS['DELAY'])
+            events = self.__selector.select(timeout=self.__lambdas['DELAY'] if self.__pausedSince is None else QUEUE_POLL)
             
             for key, mask in events:
                 callback = key.data
                 
                 callback(key.fileobj, mask)
 
+            if self.__queuePolicy == 'pauseReads' and self.__queueLimit is not None:
+                self.__backpressure()
+
             # Gracefully shut down the mix. sender worker propagates the close command.
             if not nodeSender.is_alive():
                 self.__selector.close()
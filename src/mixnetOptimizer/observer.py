@@ -0,0 +1,203 @@
+from pki         import CompiledPKI
+from controller  import LatencyController
+from threading   import Lock
+from constants   import REPORT_INTERVAL
+from aggregators import RunningMean
+from aggregators import LatencyHistogram
+
+# State of the optimizer's observation of a running mixnet. It monitors the average level of entropy
+# in the mixnet, computes the E2E latency of LEGIT messages and decides on the parameter changes and
+# the termination of the mixnet. It does not depend on the clock or the engine, the time is passed
+# in, so the same logic drives the socket engines and the discrete-event simulation.
+# The statistics are aggregated incrementally, in constant time per event, reported periodically and
+# can be queried at any time, also from other threads, through statistics.
+class Observer:
+
+    # pki        - the mixnet nodes reporting their entropy.
+    # timeout    - the maximal time of running the simulation.
+    # legitMails - the number of LEGIT mails that should be delivered in the simulation.
+    # start      - the starting time of the simulation.
+    # static     - keep the initial parameters for the whole run.
+    # controller - adapts the parameters to the live latency, None when they are not adapted.
+    def __init__(self, 
+                 pki        : CompiledPKI, 
+                 timeout    : float, 
+                 legitMails : int, 
+                 start      : float, 
+                 static     : bool = False,
+                 controller : LatencyController = None):
+
+        # Maps message ID to a tuple, where the first element tracks the number of messages splits
+        # that still need to be delivered for the overall message to be delivered. The second
+        # element tracks the sending time of the first chunk of a message. It is used to compute
+        # the E2E latency by subtracting the time of delivery of the last message chunk from the
+        # time of sending the first message chunk. The third element counts the send events of the
+        # other splits that did not arrive yet.
+        self.__tracker = dict()
+
+        # The events of the shards arrive over separate connections, so a delivery may arrive before
+        # the send of its message. Maps message ID to the delivery times of such splits, they are
+        # counted once the send arrives. Messages completed before all their send events arrived
+        # map to the number of the send events still to come, so they are not tracked again.
+        self.__parked   = dict()
+        self.__finished = dict()
+
+        # Histogram of the E2E latencies of all of the LEGIT messages delivered so far, and of the
+        # ones delivered since the last control step.
+        self.__latencies = LatencyHistogram()
+        self.__window    = LatencyHistogram()
+
+        # Mean of the current levels of entropy of all the mixnet nodes.
+        self.__entropies = RunningMean(list(pki))
+
+        self.__lock       = Lock()
+        self.__reported   = start
+        self.__start      = start
+        self.__timeout    = timeout
+        self.__legitMails = legitMails
+        self.__controller = None if static else controller
+
+        # Make one parameter change for testing purposes, unless the parameters are static or adapted
+        # by the controller.
+        self.__changed = static or controller is not None
+
+    # Process a single event reported by a client or a node.
+    def handle(self, event : tuple):
+        with self.__lock:
+            self.__handle(event)
+
+    # Current statistics of the mixnet: the mean entropy across all the nodes and the number, mean,
+    # percentiles and maximum of the E2E latencies of the LEGIT messages in seconds.
+    def statistics(self,) -> dict:
+        with self.__lock:
+            statistics            = dict()
+            statistics['entropy'] = self.__entropies.mean
+            statistics['count'  ] = self.__latencies.count
+            statistics['mean'   ] = self.__latencies.mean
+            statistics['p50'    ] = self.__latencies.percentile(0.5)
+            statistics['p95'    ] = self.__latencies.percentile(0.95)
+            statistics['p99'    ] = self.__latencies.percentile(0.99)
+            statistics['max'    ] = self.__latencies.max
+
+            return statistics
+
+    def __handle(self, event : tuple):
+
+        # Entropy measurement is delivered.
+        if len(event) == 2 and type(event[1]) == float:
+            nodeId  = event[0]
+            entropy = event[1]
+
+            self.__entropies.update(nodeId, entropy)
+
+        # The LEGIT packet was delivered to user's provider. Park it until the send of its message
+        # arrives.
+        elif len(event) == 2:
+            msgId = event[0]
+
+            if msgId in self.__tracker:
+                self.__deliver(msgId, event[1])
+            else:
+                self.__parked.setdefault(msgId, []).append(event[1])
+
+        # The optimizer is notified that a LEGIT packet was sent by a client.
+        else:
+            msgId = event[0]
+
+            # A late send of a message that was already delivered.
+            if msgId in self.__finished:
+                self.__finished[msgId] -= 1
+
+                if self.__finished[msgId] == 0:
+                    del self.__finished[msgId]
+
+            # The optimizer records the new LEGIT message only once, together with number
+            # of packets to which it was split and the time when first split was sent. The
+            # deliveries that arrived before are counted now.
+            elif msgId not in self.__tracker:
+                timeStr                = event[1]
+                numSplits              = event[2]
+                self.__tracker[msgId]  = [numSplits, timeStr, numSplits - 1]
+
+                for delivered in self.__parked.pop(msgId, []):
+                    self.__deliver(msgId, delivered)
+
+            else:
+                self.__tracker[msgId][2] -= 1
+
+    # Count a delivered split of a tracked message.
+    # timeStr - the delivery time.
+    def __deliver(self, msgId : str, timeStr : str):
+        tracked = self.__tracker[msgId]
+
+        # Check if it is the last split of the message. If yes then compute the overall E2E
+        # latency and record it.
+        if tracked[0] == 1:
+            latency = float(timeStr) - float(tracked[1])
+
+            self.__latencies.record(latency)
+            self.__window.record(latency)
+
+            del self.__tracker[msgId]
+
+            if tracked[2] > 0:
+                self.__finished[msgId] = tracked[2]
+
+        # There are still packets of the given message that need to be delivered. Decrement
+        # the counter of packets waiting for delivery for the current message.
+        else:
+            tracked[0] -= 1
+
+    # Log the mean entropy and the latency statistics.
+    def report(self,):
+        statistics = self.statistics()
+
+        print('entropy:', statistics['entropy'])
+        print('latency:', 
+              statistics['mean' ], 
+              statistics['count'], 
+              'p50', statistics['p50'], 
+              'p95', statistics['p95'], 
+              'p99', statistics['p99'])
+
+    # Decide on the next command for the mixnet at the given time.
+    # return - an empty list when the mixnet should terminate, a dictionary of new LAMBDAS when the
+    #          parameters should change, None otherwise.
+    def poll(self, now : float):
+
+        # Log the statistics periodically.
+        if now - self.__reported >= REPORT_INTERVAL:
+            self.report()
+
+            self.__reported = now
+
+        # If all messages were delivered or the simulation runs too long, finish it.
+        if self.__latencies.count >= self.__legitMails or self.__timeout < now - self.__start:
+            self.report()
+
+            return []
+
+        # Adapt the parameters to the latency of the messages delivered since the last step.
+        elif self.__controller is not None and self.__controller.due(now):
+            with self.__lock:
+                window        = self.__window
+                self.__window = LatencyHistogram()
+
+            return self.__controller.step(now, window.mean, window.count)
+
+        # Test changing parameters.
+        elif now - self.__start > 30 and not self.__changed:
+            newLambdas             = dict()
+            newLambdas['DROP'    ] = 16
+            newLambdas['LOOP'    ] = 16
+            newLambdas['LEGIT'   ] = 2
+            newLambdas['DELAY'   ] = 2
+            newLambdas['LOOP_MIX'] = 16
+
+            print('PARAMETER CHANGE')
+
+            self.__changed = True
+
+            return newLambdas
+
+        return None
@@ -1,262 +1,569 @@
-from json                   import load
+from os.path                import exists
+from pki                    import CompiledPKI
 from time                   import time
-from time                   import sleep
 from node                   import Node
-from util                   import generateMessage
-from numpy                  import mean
+from util                   import sendStats
+from util                   import nodeIds
+from util                   import sphinxParams
+from util                   import closeConnections
+from queue                  import Empty
 from queue                  import SimpleQueue
-from queue                  import PriorityQueue
 from client                 import Client
+from metrics                import MetricsServer
+from metrics                import MetricsRegistry
+from metrics                import overloadStats
+from observer               import Observer
+from controller             import LatencyController
+from asyncEngine            import AsyncNode
+from asyncEngine            import AsyncClient
+from asyncEngine            import AsyncMixnet
+from simulation             import SimNode
+from simulation             import SimClient
+from simulation             import Simulation
+from decoys                 import DecoyPool
+from users                  import ProviderMap
+from traces                 import scanTraces
+from snapshot               import loadSnapshot
+from snapshot               import saveSnapshot
+from eventlog               import stopEventLog
+from eventlog               import startEventLog
+from traces                 import TraceFeeder
+from traces                 import isTracesFile
+from encoder                import Encoder
+from replay                 import mergeStats
+from scheduler              import Scheduler
+from parameters             import ParameterStore
+from randomness             import seedStreams
+from randomness             import workerStream
+from processing             import ProcessingPool
 from logging                import INFO
 from logging                import basicConfig
+from constants              import LAMBDAS
+from constants              import NODE_PORT_BASE
+from constants              import QUEUE_POLICY
+from constants              import OBSERVER_PORT
+from constants              import SHARD_EXIT
+from sharding               import runShard
+from sharding               import newAuthkey
+from sharding               import isLocalHost
+from sharding               import assignShards
+from sharding               import writeTopology
+from sharding               import ObserverChannel
 from threading              import Thread
-from numpy.random           import randint
-from sphinxmix.SphinxParams import SphinxParams
+from multiprocessing        import get_context
 
 # Creates new mix net with a provided number of layers, nodes per each layer and providers. 
 # A plaintext of a packet in a mix can have at most bodySize of bytes.
 # tracesFile - a path to JSON file with legitimate traffic traces that should be emitted 
-#              in a simulation. A tracesFile is a list of email objects. Email object is a dict 
-#              with:
+#              in a simulation. A tracesFile is a list of email objects ordered by time, or an 
+#              NDJSON file with one email object per line, or a binary traces file (.npy) created 
+#              by converter.py. Email object is a dict with:
 #                  - time - timestamp, relative to the time at which the messages should start 
 #                    to flow.
 #                  - sender - the user ID of the sending entity. `u` followed by 6 digit ID string 
 #                    (there are over 100k users in the training set).
 #                  - size - the number of bytes in a plaintext mail message.
 #                  - receiver - the user ID of the receiving entity. The same format as the sender.
-def createMixnet(layers        : int, 
-                 bodySize      : int, 
-                 providers     : int, 
-                 tracesFile    : str, 
-                 nodesPerLayer : int):
-
-    # Ensure the provided tracesFile is in JSON format.
-    assert tracesFile[-5:] == '.json'
-
-    pki     = dict()
-    nodes   = []
-    clients = []
-    threads = []
+# decoyWorkers   - the number of worker processes pre-generating DROP, LOOP and LOOP_MIX decoy 
+#                  packets. With 0, the decoys are generated synchronously when they are sent.
+# encoderWorkers - the number of worker processes encoding the splits of large LEGIT messages in 
+#                  parallel. With 0, the clients encode their messages serially.
+# engine         - 'threaded' runs a thread per client and two per node. 'asyncio' runs all the 
+#                  clients and nodes as coroutines of a single event loop. 'simulation' runs a 
+#                  discrete-event simulation on a virtual clock, without sockets.
+# asyncWorkers   - the number of executor threads doing the Sphinx work of the asyncio engine.
+# nodeWorkers    - the number of worker processes unwrapping the packets received by the nodes of the
+#                  socket engines. With 0, each node unwraps its packets in its I/O thread.
+# eventLog       - 'text' logs every packet as a line of text to logs.log through the logging module.
+#                  'binary' logs fixed-size records to logs.bin, batched per thread and written by a 
+#                  background thread, see eventlog.py.
+# lambdas        - the initial mixnet parameters, LAMBDAS when None.
+# static         - keep the initial parameters for the whole run, the observer does not change them.
+# portBase       - the nodes listen at portBase plus the number of their ID. Mixnets running side by 
+#                  side need disjoint port ranges.
+# logFile        - the packet log, logs.log or logs.bin in the logs directory when None.
+# horizon        - only the mails sent until this time are emitted, all of them when None.
+# targetLatency  - the mean E2E latency of the LEGIT messages in seconds the observer holds by adapting
+#                  the DELAY online, see controller.py. None keeps the parameters.
+# metricsPort    - the local port serving the live metrics of the nodes of the threaded engine, see 
+#                  metrics.py. None serves no metrics, 0 picks a free port.
+# metricsFile    - the metrics of the nodes of the threaded engine dumped at the end of the run, 
+#                  metrics.json in the logs directory when None.
+# queueLimit     - the number of packets the message queue of a node of the threaded engine holds 
+#                  before the node is overloaded, unbounded when None.
+# queuePolicy    - 'dropNewest', 'dropDecoys' or 'pauseReads', what an overloaded node does, see Node.
+# snapshot       - the snapshot file of the setup, see snapshot.py. The setup is loaded from it when it
+#                  exists, otherwise it is saved to it.
+# seed           - seed of the random streams of the clients and nodes, see randomness.py. A fresh
+#                  one is drawn and printed when None, so the run can be replayed.
+# return         - the final statistics of the run, see Observer.statistics, the number of LEGIT mails
+#                  emitted in the run, with a queue limit the overload of the nodes and, with the
+#                  threaded engine, the lateness of the workers' timers.
+def createMixnet(layers         : int, 
+                 bodySize       : int, 
+                 providers      : int, 
+                 tracesFile     : str, 
+                 nodesPerLayer  : int,
+                 decoyWorkers   : int = 2,
+                 encoderWorkers : int = 2,
+                 engine         : str = 'threaded',
+                 asyncWorkers   : int = 4,
+                 nodeWorkers    : int = 0,
+                 eventLog       : str = 'text',
+                 lambdas        : dict = None,
+                 static         : bool = False,
+                 portBase       : int = NODE_PORT_BASE,
+                 logFile        : str = None,
+                 horizon        : float = None,
+                 targetLatency  : float = None,
+                 metricsPort    : int = None,
+                 metricsFile    : str = None,
+                 queueLimit     : int = None,
+                 queuePolicy    : str = QUEUE_POLICY,
+                 snapshot       : str = None,
+                 seed           : int = None) -> dict:
+
+    # Ensure the provided tracesFile is in JSON, NDJSON or the binary format.
+    assert isTracesFile(tracesFile)
+    assert engine in ['threaded', 'asyncio', 'simulation']
+    assert eventLog in ['text', 'binary']
+
+    pki        = dict()
+    nodes      = []
+    decoyPool  = None
+    clients    = []
+    unwrapper  = None
+    threads    = []
+    registry   = MetricsRegistry()
+    server     = None
+    overload   = None
+    scheduling = None
 
     # Synchronized queue through which clients and mixes inform the optimizer about the current 
     # level of entropy or the sending and receiving times of LEGIT messages.
     eventQueue = SimpleQueue()
 
-    # Synchronized queue. The optimizer uses it to propagate the mixnet parameter updates across the 
-    # network. It can also be used to send an empty command that initiates the graceful termination 
-    # of the mixnet.
-    cmdQueue = PriorityQueue(maxsize=1)
-
-    # Gather info on how many users should be registered in the simulation.
-    userIds = []
+    if lambdas is None:
+        lambdas = LAMBDAS
 
-    # Maps user ID to the legitimate emails that they should send in the simulation. Length of this 
-    # dictionary defines the total number of sending clients that should be active at some time 
-    # in the simulation.
-    legitTraffic = dict()
+    # Logging configuration. All nodes & clients log to same file.
+    if eventLog == 'binary':
+        startEventLog('../../logs/logs.bin' if logFile is None else logFile)
+    else:
+        basicConfig(filename='../../logs/logs.log' if logFile is None else logFile, level=INFO, encoding='utf-8', force=True)
 
-    # Maps user ID to its provider ID.
-    users = dict()
+    # The streams of all the clients and nodes derive from the seed of the run.
+    seed = seedStreams(seed)
 
-    # Logging configuration. All nodes & clients log to same file.
-    basicConfig(filename='../../logs/logs.log', level=INFO, encoding='utf-8')
+    print('seed:', seed)
 
-    # Load the traces file.
-    with open(tracesFile, 'r') as file:
-        traces = load(file)
+    # The arguments the setup depends on, a snapshot is only loaded with the same ones.
+    config                  = dict()
+    config['layers'       ] = layers
+    config['bodySize'     ] = bodySize
+    config['providers'    ] = providers
+    config['nodesPerLayer'] = nodesPerLayer
+    config['tracesFile'   ] = tracesFile
+    config['horizon'      ] = horizon
 
-        file.close()
+    # Warm start - the keys, the providers of the users and the summary of the traces of a previous 
+    # run.
+    if snapshot is not None and exists(snapshot):
+        params, secrets, traces, userIdxToProvider = loadSnapshot(snapshot, config)
 
-    # Parse the dataset.
-    for mail in traces:
-        sender = mail['sender']
+        print('snapshot: loaded', snapshot)
+    else:
 
-        if sender not in legitTraffic:
-            legitTraffic[sender] = [mail]
-        else:
-            legitTraffic[sender] += [mail]
+        # Scan the traces file without loading it. The senders define the total number of sending 
+        # clients that should be active at some time in the simulation, the mails themselves are 
+        # streamed to the clients while the mixnet runs.
+        traces = scanTraces(tracesFile, horizon)
+
+        # Randomly assign each user to a provider. User ID starts with 'u', provider ID starts with 
+        # 'p', they are followed by 6 digit ID string (there are over 100k users in the dataset).
+        userIdxToProvider = workerStream('providers').integers(providers, len(traces.userIds))
+
+        # Set the global static variables - things that do not change within an experiment. Mainly,
+        # the packet size and other variables that depend on it such as the size of the packet header 
+        # and plaintext body.
+        params = sphinxParams(layers, bodySize)
+
+        # Generate the key pairs of the nodes.
+        secrets = dict([(nodeId, params.group.gensecret()) for _, nodeId in nodeIds(layers, providers, nodesPerLayer)])
+
+    # Map a user ID to its provider ID.
+    users      = ProviderMap(traces.userIds, userIdxToProvider)
+    numWorkers = len(traces.senders) + providers + layers * nodesPerLayer
+
+    # Versioned store of the mixnet parameters. The optimizer publishes the parameter updates to it,
+    # all the workers read it on each loop. Its shutdown event initiates the graceful termination of
+    # the mixnet.
+    parameters = ParameterStore(lambdas, numWorkers)
+
+    # Engine specific node constructor.
+    # x - layer.
+    # y - node ID.
+    # z - secret key.
+    if engine == 'asyncio':
+        mixnet  = AsyncMixnet(parameters, asyncWorkers)
+        newNode = lambda x, y, z : AsyncNode(x, y, params, bodySize, eventQueue, mixnet, portBase, z)
+    elif engine == 'simulation':
+        simulation = Simulation(time(), lambdas)
+        newNode    = lambda x, y, z : SimNode(x, y, params, bodySize, simulation, portBase, z)
+    else:
+        scheduler = Scheduler()
+        newNode   = lambda x, y, z : Node(x, y, params, bodySize, parameters, eventQueue, scheduler, portBase, secretKey=z, queueLimit=queueLimit, queuePolicy=queuePolicy)
 
-        userIds += [sender, mail['receiver']]
+    # Instantiate the providers and the mixes of each layer and add their info to PKI.
+    for layer, nodeId in nodeIds(layers, providers, nodesPerLayer):
+        nodes       += [newNode(layer, nodeId, secrets[nodeId])]
+        pki[nodeId]  = nodes[-1].toPKIView()
 
-    # Compute number of unique users.
-    userIds  = sorted(list(set(userIds)))
-    numUsers = len(userIds)
+    # Save the setup for the warm start of the next runs.
+    if snapshot is not None and not exists(snapshot):
+        saveSnapshot(snapshot, config, params, secrets, pki, traces, userIdxToProvider)
 
-    # Randomly assign each user to a provider.
-    userIdxToProvider = randint(0, high=providers, size=numUsers)
+        print('snapshot: saved', snapshot)
 
-    # Map a user ID to its provider ID. User ID starts with 'u', provider ID starts with 'p', they 
-    # are followed by 6 digit ID string (there are over 100k users in the dataset).
-    for idx in range(numUsers):
-        providerIdString = "p{:06d}".format(userIdxToProvider[idx])
+    # Compile the PKI once - decode the public keys and index the nodes per layer. The compiled PKI 
+    # is shared by all nodes and clients, it has to be rebuilt only when the PKI changes.
+    pki = CompiledPKI(pki, params)
 
-        users[userIds[idx]] = providerIdString
+    # Start the worker processes that pre-generate decoy packets. Clients need DROP and LOOP 
+    # packets, mixes need LOOP_MIX packets.
+    if decoyWorkers > 0:
+        decoyPool = DecoyPool(pki, params, bodySize, users, lambdas['DELAY'], decoyWorkers)
 
-    # Set the global static variables - things that do not change within an experiment. Mainly, the 
-    # packet size and other variables that depend on it such as the size of the connection buffer, 
-    # size of the packet header and plaintext body.
-    if bodySize < 65536:
-        addBody   = 63
-        addBuffer = 36
-    else:
-        addBody   = 65
-        addBuffer = 40
-
-    if 0 < layers and layers < 3:
-        addBuffer += 1
-    elif 2 < layers:
-        addBuffer += 3
-    
-    headerLen  = 71 * layers + 108
-    params     = SphinxParams(body_len=bodySize + addBody, header_len=headerLen)
-    numWorkers = len(legitTraffic) + providers + layers * nodesPerLayer
-
-    # Instantiate providers and add their info to PKI.
-    for provider in range(providers):
-        nodeId       = "p{:06d}".format(provider)
-        nodes       += [Node(0, nodeId, params, bodySize, cmdQueue, addBuffer, eventQueue)]
-        pki[nodeId]  = nodes[-1].toPKIView()
+        for userId in traces.senders:
+            decoyPool.register(userId, 'DROP')
+            decoyPool.register(userId, 'LOOP')
 
-    # Instantiate each mix and add their info to PKI.
-    for layer in range(1, layers + 1):
-        for node in range(nodesPerLayer):
+        for nodeId in pki:
+            if pki.layer(nodeId) != 0:
+                decoyPool.register(nodeId, 'LOOP_MIX')
 
-            # Mix ID is 'm' followed by 6 digit ID string. Mix IDs do not start at 0, they follow 
-            # provider numeration. Node IDs define listening ports, so overall node ID configuration
-            # avoids port collisions.
-            nodeId       = "m{:06d}".format((layer - 1) * nodesPerLayer + node + providers)
-            nodes       += [Node(layer, nodeId, params, bodySize, cmdQueue, addBuffer, eventQueue)]
-            pki[nodeId]  = nodes[-1].toPKIView()
+        decoyPool.start()
 
     # Set the timeout to twice the time of sending the last LEGIT message in the simulation relative
     # to its start.
-    lastSend  = 2 * traces[-1]['time']
-    threads  += [Thread(target=observer, args=(pki, lastSend, cmdQueue, len(traces), numWorkers, eventQueue))]
+    lastSend = 2 * traces.lastTime
 
-    # Propagate the global PKI state to each node.
+    # The optimizer's observation of the mixnet. The discrete-event simulation drives it on its 
+    # virtual clock, the socket engines in the observer thread.
+    start      = simulation.now if engine == 'simulation' else time()
+    controller = None
+
+    if targetLatency is not None:
+        controller = LatencyController(targetLatency, lambdas, start)
+
+    tracker = Observer(pki, lastSend, traces.mails, start, static, controller)
+
+    if engine != 'simulation':
+        threads += [Thread(target=observer, args=(tracker, parameters, eventQueue, decoyPool))]
+
+    # Pool of worker processes shared by the nodes, so the unwrapping of the packets is spread over
+    # all the cores. The simulation has no I/O to overlap with, it unwraps the packets inline.
+    if nodeWorkers > 0 and engine != 'simulation':
+        unwrapper = ProcessingPool(params, nodeWorkers)
+
+    # Propagate the global PKI state, the decoy pool and the processing pool to each node.
     for node in nodes:
         node.setPKI(pki)
+        node.setDecoyPool(decoyPool)
+
+        if unwrapper is not None:
+            node.setProcessingPool(unwrapper)
 
-        threads += [Thread(target=node.start)]
+        if engine == 'threaded':
+            threads += [Thread(target=node.start)]
+
+            registry.register(node.toPKIView()['nodeId'], node)
+
+    # Serve the live metrics of the nodes.
+    if engine == 'threaded' and metricsPort is not None:
+        server = MetricsServer(registry, metricsPort)
+
+        print('metrics:', 'http://127.0.0.1:{}/metrics'.format(server.port))
+
+    # Encoder service shared by all the clients. It propagates PKI info to all clients and it is used
+    # to encapsulate messages of any type in a set of Sphinx packets. Its generate method takes:
+    # x - user ID.
+    # y - the type of message to generate, enum.
+    # z - the size of the plaintext message in bytes.
+    # u - mean packet delay, mixnet parameter.
+    # v - receiver, an ID of the receiving user for LEGIT traffic.
+    encoder   = Encoder(pki, params, bodySize, users, encoderWorkers)
+    usrMsgGen = encoder.generate
 
     # Create online clients in the simulation.
     # ASSUMPTION: user that sends at least a single message is active throughout the whole 
     # simulation. The user that receives, but does not send a packet is never online.
-    for userId, mails in legitTraffic.items():
-
-        # Wrapper that propagates PKI info to all clients. It is used to encapsulate messages of any
-        # type in a set of Sphinx packets.
-        # x - user ID.
-        # y - the type of message to generate, enum.
-        # z - the size of the plaintext message in bytes.
-        # u - mean packet delay, mixnet parameter.
-        # v - receiver, an ID of the receiving user for LEGIT traffic.
-        usrMsgGen = lambda  x, y, z, u, v : generateMessage(pki, x, y, params, z, bodySize, u, users, v)
+    for userId in traces.senders:
+        providerPort = pki.port(users[userId])
+
+        # Instantiate the clients. Their mails are streamed in by the feeder.
+        if engine == 'asyncio':
+            clients += [AsyncClient(userId, bodySize, [], eventQueue, providerPort, usrMsgGen, decoyPool, mixnet)]
+        elif engine == 'simulation':
+            clients += [SimClient(userId, bodySize, [], users[userId], usrMsgGen, decoyPool, simulation)]
+        else:
+            clients += [Client(userId, bodySize, [], parameters, eventQueue, providerPort, usrMsgGen, decoyPool, scheduler)]
+            threads += [Thread(target=clients[-1].start)]
 
-        providerPort = pki[users[userId]]['port']
+    # Hand the mails to their senders' clients shortly before they are due. The socket engines feed 
+    # them from a thread on the wall clock, the simulation on its virtual clock.
+    feeder = TraceFeeder(tracesFile, dict(zip(traces.senders, clients)), horizon=horizon)
 
-        # Instantiate the clients.
-        clients += [Client(userId, bodySize, mails, cmdQueue, eventQueue, providerPort, usrMsgGen)]
-        threads += [Thread(target=clients[-1].start)]
+    if engine == 'simulation':
+        simulation.schedule(0., feeder.simulate, simulation)
+    else:
+        threads += [Thread(target=feeder.run, args=(time(), parameters.shutdown))]
 
     # Run the mixnet.
     for thread in threads:
         thread.start()
 
+    # The asyncio engine runs all the nodes and clients in this thread until the optimizer 
+    # terminates the mixnet.
+    if engine == 'asyncio':
+        mixnet.run(nodes, clients)
+
+    # The discrete-event simulation runs in this thread as fast as the CPU allows.
+    elif engine == 'simulation':
+        wallStart = time()
+        simulated = simulation.run(tracker, nodes, clients, decoyPool)
+
+        print('simulated:', simulated, 'seconds in', time() - wallStart, 'seconds')
+
     # Terminate the mixnet.
     for thread in threads:
         thread.join()
 
-# Worker that monitors the average level of entropy in the mixnet and computes the E2E latency
-# of LEGIT messages.
-# timeout    - the maximal time of running the simulation.
-# legitMails - the number of LEGIT mails that should be delivered in the simulation.
-def observer(pki        : dict, 
-             timeout    : float,
-             cmdQueue   : PriorityQueue,
-             legitMails : int,
-             numWorkers : int,
-             eventQueue : SimpleQueue):
+    # The pools are shut down before returning, the run may be a spawned process about to exit, e.g.
+    # of the parameter search.
+    encoder.close(wait=True)
+    closeConnections()
+
+    # Report the packets lost on the way between the mixnet entities.
+    if engine == 'asyncio':
+        print('connections:', mixnet.connections.stats())
+    elif engine == 'threaded':
+        print('connections:', sendStats())
+
+        # Report how late the workers acted on their timers.
+        scheduling = scheduler.stats()
+
+        print('scheduling error:', scheduling)
+
+        # Report the packets the overloaded nodes dropped and how long they paused their reads.
+        if queueLimit is not None:
+            overload = overloadStats([node.metrics() for node in nodes])
+
+            print('overload:', overload)
+
+        # Dump the final metrics of the nodes.
+        registry.dump('../../logs/metrics.json' if metricsFile is None else metricsFile)
+
+        if server is not None:
+            server.close()
+
+    # Write the remaining records of the binary event log.
+    if eventLog == 'binary':
+        print('event log:', stopEventLog())
+
+    # Report how long it took until all the workers used the published parameter versions.
+    if engine != 'simulation':
+        print('parameter propagation:', parameters.propagationStats())
+
+    # Report the replays detected and the memory held by the replay tag caches.
+    print('replay caches:', mergeStats([node.replayStats() for node in nodes]))
+
+    # Report how fast the controller reached the target latency and what its steps cost.
+    if controller is not None:
+        print('controller:', controller.stats())
+
+    # Report the packets that could not be unwrapped.
+    if unwrapper is not None:
+        unwrapper.close(wait=True)
+
+        print('processing pool:', unwrapper.stats())
+
+    # Report whether the decoy generation kept up with the emission rates.
+    if decoyPool is not None:
+        decoyPool.close(wait=True)
+
+        print('decoy pool:', decoyPool.stats())
+
+    statistics          = tracker.statistics()
+    statistics['mails'] = traces.mails
+
+    if overload is not None:
+        statistics['overload'] = overload
+
+    if scheduling is not None:
+        statistics['scheduling'] = scheduling
+
+    return statistics
+
+# Creates a mixnet sharded over several processes, possibly on different hosts, see sharding.py. This 
+# process is the coordinator: it writes the topology file, runs the observer and waits for the shards. 
+# The shards on the local host are launched as processes, the other ones have to be started on their 
+# hosts with shard.py. The shards run the threaded engine. Arguments are the same as in createMixnet,
+# except:
+# hosts        - the host of each shard, all of them on the local host when None.
+# shards       - the number of shards, the length of hosts when they are given.
+# topologyFile - the topology file, shared with all the shards. Every shard's keys are written next 
+#                to it.
+# observerHost - the host at which the shards reach the coordinator.
+# logFile      - the packet log of each shard, {} is replaced with the number of the shard.
+def createShardedMixnet(layers         : int,
+                        bodySize       : int,
+                        providers      : int,
+                        tracesFile     : str,
+                        nodesPerLayer  : int,
+                        shards         : int = 2,
+                        hosts          : list = None,
+                        topologyFile   : str = '../../logs/topology.json',
+                        observerHost   : str = '127.0.0.1',
+                        decoyWorkers   : int = 2,
+                        encoderWorkers : int = 2,
+                        eventLog       : str = 'text',
+                        lambdas        : dict = None,
+                        static         : bool = False,
+                        portBase       : int = NODE_PORT_BASE,
+                        logFile        : str = None,
+                        horizon        : float = None,
+                        targetLatency  : float = None,
+                        queueLimit     : int = None,
+                        queuePolicy    : str = QUEUE_POLICY,
+                        seed           : int = None) -> dict:
+
+    assert isTracesFile(tracesFile)
+    assert eventLog in ['text', 'binary']
+
+    if lambdas is None:
+        lambdas = LAMBDAS
+
+    if hosts is None:
+        hosts = ['127.0.0.1'] * shards
+
+    if logFile is None:
+        logFile = '../../logs/logs.shard{}.' + ('bin' if eventLog == 'binary' else 'log')
+
+    # The clients of all the shards, their users' providers and the PKI of all the nodes.
+    traces            = scanTraces(tracesFile, horizon)
+    seed              = seedStreams(seed)
+    userIdxToProvider = workerStream('providers').integers(providers, len(traces.userIds))
+    senders           = list(traces.senders)
+
+    topology, secrets = assignShards(layers, bodySize, providers, nodesPerLayer, senders, hosts, portBase)
+
+    config                   = dict()
+    config['layers'        ] = layers
+    config['bodySize'      ] = bodySize
+    config['tracesFile'    ] = tracesFile
+    config['horizon'       ] = horizon
+    config['decoyWorkers'  ] = decoyWorkers
+    config['encoderWorkers'] = encoderWorkers
+    config['eventLog'      ] = eventLog
+    config['logFile'       ] = logFile
+    config['lambdas'       ] = dict(lambdas)
+    config['seed'          ] = seed
+    config['queueLimit'    ] = queueLimit
+    config['queuePolicy'   ] = queuePolicy
+
+    print('seed:', seed)
+
+    topology['config'   ] = config
+    topology['userIds'  ] = traces.userIds
+    topology['providers'] = userIdxToProvider.tolist()
+    topology['observer' ] = [observerHost, OBSERVER_PORT]
+    topology['authkey'  ] = newAuthkey()
+
+    writeTopology(topologyFile, topology, secrets)
+
+    # The shards report their events to the observer through the channel. The parameter updates and 
+    # the shutdown published to the store are broadcast to the shards.
+    eventQueue = SimpleQueue()
+    parameters = ParameterStore(lambdas, len(hosts))
+    channel    = ObserverChannel(('0.0.0.0', OBSERVER_PORT), bytes.fromhex(topology['authkey']), len(hosts), eventQueue, parameters)
+    processes  = []
+
+    for shard, host in enumerate(hosts):
+        if isLocalHost(host):
+            processes += [(shard, get_context('spawn').Process(target=runShard, args=(topologyFile, shard)))]
+            processes[-1][1].start()
+
+    channel.accept()
+
+    start      = channel.start()
+    controller = None
+
+    if targetLatency is not None:
+        controller = LatencyController(targetLatency, lambdas, start)
+
+    # Run the observer in this thread until it terminates the mixnet.
+    tracker = Observer(CompiledPKI(topology['pki'], sphinxParams(layers, bodySize)), 2 * traces.lastTime, traces.mails, start, static, controller)
+
+    observer(tracker, parameters, eventQueue)
 
-    # Maps message ID to a tuple, where the first element tracks the number of messages splits that 
-    # still need to be delivered for the overall message to be delivered. The second element tracks 
-    # the sending time of the first chunk of a message. It is used to compute the E2E latency 
-    # by subtracting the time of delivery of the last message chunk from the time of sending the 
-    # first message chunk.
-    tracker = dict()
+    shardStats = channel.close()
 
-    # Stores the E2E latencies of all of the LEGIT messages in the dataset.
-    latencies = []
+    # A shard that hangs at its exit is terminated, its statistics were already reported.
+    for shard, process in processes:
+        process.join(SHARD_EXIT)
 
-    # Maps the mixnet node to its current level of entropy.
-    entropies = dict([(nodeId, 0.) for nodeId in pki])
+        if process.exitcode is None:
+            process.terminate()
+            process.join()
 
-    # Track the starting time of the simulation.
-    start = time()
+            print('shard', shard, 'did not exit, terminated')
 
-    # Make one parameter change for testing purposes.
-    changed = False
+        elif process.exitcode != 0:
+            print('shard', shard, 'exited with code', process.exitcode)
+
+    for shard, stats in enumerate(shardStats):
+        print('shard', shard, stats)
+
+    print('event channel:', channel.stats())
+    print('parameter propagation:', parameters.propagationStats())
+
+    if controller is not None:
+        print('controller:', controller.stats())
+
+    statistics          = tracker.statistics()
+    statistics['mails'] = traces.mails
+
+    return statistics
+
+# Worker that feeds the events of the clients and nodes to the Observer, which monitors the average 
+# level of entropy in the mixnet and computes the E2E latency of LEGIT messages, and publishes its 
+# commands to the parameter store.
+# decoyPool - pool of pre-generated decoy packets or None. Informed about the mean delay changes.
+def observer(tracker    : Observer,
+             parameters : ParameterStore,
+             eventQueue : SimpleQueue,
+             decoyPool  : DecoyPool = None):
 
     while True:
-        if not eventQueue.empty():
-            event = eventQueue.get()
-
-            # Entropy measurement is delivered.
-            if len(event) == 2 and type(event[1]) == float:
-                nodeId            = event[0]
-                entropy           = event[1]
-                entropies[nodeId] = entropy
-
-                # Compute & log the mean entropy across all the nodes.
-                print('entropy:', mean(list(entropies.values())))
-
-            # The LEGIT packet was delivered to user's provider.
-            elif len(event) == 2:
-                msgId = event[0]
-
-                # Check if it is the last split of the message. If yes then compute the overall E2E
-                # latency and log the mean latency of all LEGIT messages delivered so far.
-                if tracker[msgId][0] == 1:
-                    timeStr    = event[1]
-                    latencies += [float(timeStr) - float(tracker[msgId][1])]
-
-                    print('latency:', mean(latencies), len(latencies))                    
-                    del tracker[msgId]
-
-                # There are still packets of the given message that need to be delivered. Decrement
-                # the counter of packets waiting for delivery for the current message.
-                else:
-                    tracker[msgId][0] -= 1
-
-            # The optimizer is notified that a LEGIT packet was sent by a client.
-            else:
-                msgId = event[0]
-
-                # The optimizer records the new LEGIT message only once, together with number 
-                # of packets to which it was split and the time when first split was sent.
-                if msgId not in tracker:
-                    timeStr        = event[1]
-                    numSplits      = event[2]
-                    tracker[msgId] = [numSplits, timeStr]
-
-        # If all messages were delivered or the simulation runs too long, finish it.
-        if len(latencies) >= legitMails or timeout < time() - start:
-            cmdQueue.get()
-            cmdQueue.put([])
+
+        # Wait for the next event, but poll the tracker at least every 10 ms.
+        try:
+            tracker.handle(eventQueue.get(timeout=0.01))
+        except Empty:
+            pass
+
+        cmd = tracker.poll(time())
+
+        # All messages were delivered or the simulation runs too long.
+        if cmd == []:
+            parameters.stop()
             break
 
-        # Test changing parameters.
-        elif time() - start > 30 and not changed:
-            newLambdas             = dict()
-            newLambdas['DROP'    ] = 16
-            newLambdas['LOOP'    ] = 16
-            newLambdas['LEGIT'   ] = 2
-            newLambdas['DELAY'   ] = 2
-            newLambdas['LOOP_MIX'] = 16
-
-            cmdQueue.put((time(), [numWorkers, newLambdas]))
-            print('PARAMETER CHANGE')
-            
-            changed = True
-        else:
-            sleep(0.01)
+        # Publish the parameter change, all the workers pick it up at once.
+        elif cmd is not None:
+            parameters.publish(cmd)
+
+            # Pre-generated decoys embed the mean delay, refill them with the new one.
+            if decoyPool is not None:
+                decoyPool.setDelayMean(cmd['DELAY'])
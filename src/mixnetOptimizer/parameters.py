@@ -0,0 +1,120 @@
+from time      import time
+from types     import MappingProxyType
+from typing    import Callable
+from threading import Lock
+from threading import Event
+
+"""
+Mixnet parameters shared between the optimizer and the workers (clients and nodes). The optimizer
+publishes a new immutable version of the parameters, the workers pick it up on their next loop. A
+worker only reads a single attribute to check for a new version, so the reads take no lock, and no
+worker waits for another one to pass the parameters on.
+"""
+
+# Immutable version of the mixnet parameters.
+class Parameters:
+
+    # version   - integer, increases with every publication.
+    # lambdas   - the parameters of the Poisson processes, see constants.LAMBDAS.
+    # published - epoch time of the publication.
+    def __init__(self, version : int, lambdas : dict, published : float):
+        self.version   = version
+        self.lambdas   = MappingProxyType(dict(lambdas))
+        self.published = published
+
+class ParameterStore:
+
+    # lambdas - the initial parameters, version 0.
+    # workers - the number of workers expected to acknowledge every new version.
+    def __init__(self, lambdas : dict, workers : int):
+        self.current  = Parameters(0, lambdas, time())
+        self.shutdown = Event()
+
+        self.__lock        = Lock()
+        self.__workers     = workers
+        self.__pending     = dict()
+        self.__propagation = dict()
+        self.__subscribers = []
+        self.__watchers    = []
+
+    # Publish new parameters. Replacing the current version is a single reference assignment, so
+    # the workers see either the old or the new version, never a mix of both.
+    def publish(self, lambdas : dict) -> Parameters:
+        with self.__lock:
+            parameters   = Parameters(self.current.version + 1, lambdas, time())
+            subscribers  = list(self.__subscribers)
+            self.current = parameters
+
+            # The older versions are superseded, the workers that did not pick them up yet skip them,
+            # so they are never fully acknowledged.
+            self.__pending.clear()
+
+            self.__pending[parameters.version] = [self.__workers, parameters.published]
+
+        for callback in subscribers:
+            callback()
+
+        return parameters
+
+    # Gracefully terminate all the workers.
+    def stop(self,):
+        self.shutdown.set()
+
+        with self.__lock:
+            subscribers = list(self.__subscribers)
+
+        for callback in subscribers:
+            callback()
+
+    # Register a callback called after every publication and on the shutdown, e.g. to wake up a
+    # sleeping worker. It is called from the optimizer's thread.
+    def subscribe(self, callback : Callable):
+        with self.__lock:
+            self.__subscribers += [callback]
+
+    def unsubscribe(self, callback : Callable):
+        with self.__lock:
+            self.__subscribers.remove(callback)
+
+    # Register a callback called with a version once all the workers acknowledged it, e.g. to pass
+    # the acknowledgement on to the coordinator of a shard. It is called from the thread of the last
+    # worker acknowledging the version.
+    def watch(self, callback : Callable):
+        with self.__lock:
+            self.__watchers += [callback]
+
+    # A worker (or an event loop running count workers) started using the given version. Once all
+    # the workers acknowledge it, the time since its publication is recorded.
+    def acknowledge(self, version : int, count : int = 1):
+        with self.__lock:
+            if version not in self.__pending:
+                return
+
+            self.__pending[version][0] -= count
+
+            if self.__pending[version][0] > 0:
+                return
+
+            self.__propagation[version] = time() - self.__pending.pop(version)[1]
+            watchers                    = list(self.__watchers)
+
+        for callback in watchers:
+            callback(version)
+
+    # Maps each published version to the seconds it took until all the workers used it. Versions
+    # that some workers skipped, because a newer one was published meanwhile, are missing.
+    def propagation(self,) -> dict:
+        with self.__lock:
+            return dict(self.__propagation)
+
+    # Summary of the propagation times for the end of a run, the controller publishes a version on
+    # every step. Mean and max are None when no version was fully propagated.
+    def propagationStats(self,) -> dict:
+        with self.__lock:
+            times     = list(self.__propagation.values())
+            published = self.current.version
+
+        return { 'published'  : published,
+                 'propagated' : len(times),
+                 'mean'       : sum(times) / len(times) if times else None,
+                 'max'        : max(times) if times else None }
@@ -0,0 +1,92 @@
+from types                  import MappingProxyType
+from petlib.ec              import EcPt
+from randomness             import RandomStream
+from collections.abc        import Mapping
+from sphinxmix.SphinxParams import SphinxParams
+
+# Immutable, pre-compiled view of the mixnet PKI. The raw PKI (as exported by Node.toPKIView) keeps
+# public keys as hex strings, which are expensive to decode on every generated packet. The compiled
+# PKI decodes each key exactly once and indexes the nodes per layer, so path sampling, key lookup
+# and port lookup are all O(1). It should be rebuilt only when the PKI changes.
+# It still behaves as a read-only mapping from node ID to that node's raw PKI info, so code that
+# iterates over node IDs or reads pki[nodeId]['port'] keeps working.
+class CompiledPKI(Mapping):
+
+    # pki    - dictionary maps node ID (mix or provider) to its PKI info (listening port, optionally
+    #          host, public key, layer).
+    # params - an instance of SphinxParams object, its EC group is used to decode the public keys.
+    def __init__(self, pki : dict, params : SphinxParams):
+        perLayer = dict()
+        ports    = dict()
+        address  = dict()
+        layers   = dict()
+        keys     = dict()
+        views    = dict()
+
+        for nodeId, nodePKI in pki.items():
+            layer = nodePKI['layer']
+
+            if layer not in perLayer:
+                perLayer[layer] = []
+
+            perLayer[layer] += [nodeId]
+            ports[nodeId]    = nodePKI['port']
+            address[nodeId]  = (nodePKI.get('host', '127.0.0.1'), nodePKI['port'])
+            layers[nodeId]   = layer
+            keys[nodeId]     = EcPt.from_binary(bytes.fromhex(nodePKI['publicKey']), params.group.G)
+            views[nodeId]    = MappingProxyType(dict(nodePKI))
+
+        # Node IDs in each layer are kept in tuples so a random node of a layer is a single index.
+        self.__ports    = MappingProxyType(ports)
+        self.__address  = MappingProxyType(address)
+        self.__views    = MappingProxyType(views)
+        self.__layers   = MappingProxyType(layers)
+        self.__perLayer = MappingProxyType(dict([(l, tuple(ids)) for l, ids in perLayer.items()]))
+        self.__keys     = MappingProxyType(keys)
+
+    def __getitem__(self, nodeId : str):
+        return self.__views[nodeId]
+
+    def __iter__(self,):
+        return iter(self.__views)
+
+    def __len__(self,) -> int:
+        return len(self.__views)
+
+    # Plain, picklable copy of the raw PKI dictionary, e.g. for passing to worker processes.
+    def export(self,) -> dict:
+        return dict([(nodeId, dict(view)) for nodeId, view in self.__views.items()])
+
+    # Number of layers in the mixnet including the provider layer (layer 0).
+    @property
+    def numLayers(self,) -> int:
+        return len(self.__perLayer)
+
+    def port(self, nodeId : str) -> int:
+        return self.__ports[nodeId]
+
+    # Host and port at which the node listens. Nodes without a host in their PKI info listen on the
+    # local host.
+    def address(self, nodeId : str) -> tuple:
+        return self.__address[nodeId]
+
+    def layer(self, nodeId : str) -> int:
+        return self.__layers[nodeId]
+
+    def publicKey(self, nodeId : str) -> EcPt:
+        return self.__keys[nodeId]
+
+    # Decoded public keys of all the nodes on a path, in the path order.
+    def publicKeys(self, path : list) -> list:
+        return [self.__keys[nodeId] for nodeId in path]
+
+    # Tuple of node IDs in the given layer.
+    def layerNodes(self, layer : int) -> tuple:
+        return self.__perLayer[layer]
+
+    # Uniformly sample a single node ID from the given layer.
+    # random - RandomStream of the sender.
+    def sampleNode(self, layer : int, random : RandomStream) -> str:
+        nodes = self.__perLayer[layer]
+
+        return nodes[random.index(len(nodes))]
@@ -0,0 +1,64 @@
+from workers                import unwrap
+from workers                import initUnwrapWorker
+from typing                 import Callable
+from threading              import Lock
+from multiprocessing        import get_context
+from concurrent.futures     import Future
+from concurrent.futures     import ProcessPoolExecutor
+from sphinxmix.SphinxParams import SphinxParams
+
+# Pool of worker processes that unwrap the Sphinx packets received by the nodes (sphinx_process,
+# PFdecode and, at the last hop, receive_forward). It is shared by all the nodes of the process, so a
+# node's I/O thread only receives frames and hands them over, while the unwrapping runs on all the
+# cores. The node's state (replay tags, delay queue, entropy) is only updated by the callbacks with
+# the unwrapped results.
+class ProcessingPool:
+
+    # params  - an instance of SphinxParams object of the experiment.
+    # workers - the number of worker processes.
+    def __init__(self, params : SphinxParams, workers : int):
+        self.__lock      = Lock()
+        self.__failed    = 0
+        self.__submitted = 0
+        self.__executor  = ProcessPoolExecutor(max_workers=workers,
+                                               mp_context=get_context('spawn'),
+                                               initializer=initUnwrapWorker,
+                                               initargs=(params.m, params.max_len))
+
+    # Unwrap a packet in a worker process.
+    # secretKey - the secret key of the node as a hex string.
+    # data      - the packed Sphinx packet.
+    # callback  - called with the (tag, flag, routing) tuple of util.unwrapPacket once the packet is
+    #             unwrapped. Usually called from the pool's management thread.
+    def submit(self, secretKey : str, data : bytes, callback : Callable):
+        with self.__lock:
+            self.__submitted += 1
+
+        future = self.__executor.submit(unwrap, secretKey, data)
+
+        future.add_done_callback(lambda x : self.__onUnwrapped(x, callback))
+
+    # Unwrap a packet in a worker process, returns the future of the (tag, flag, routing) tuple.
+    def future(self, secretKey : str, data : bytes) -> Future:
+        with self.__lock:
+            self.__submitted += 1
+
+        return self.__executor.submit(unwrap, secretKey, data)
+
+    def stats(self,) -> dict:
+        with self.__lock:
+            return { 'submitted' : self.__submitted, 'failed' : self.__failed }
+
+    # wait - wait until the worker processes exit, see DecoyPool.close.
+    def close(self, wait : bool = False):
+        self.__executor.shutdown(wait=wait, cancel_futures=True)
+
+    # Malformed packets and packets cancelled on shutdown are dropped and counted.
+    def __onUnwrapped(self, future : Future, callback : Callable):
+        if future.cancelled() or future.exception() is not None:
+            with self.__lock:
+                self.__failed += 1
+
+            return
+
+        callback(*future.result())
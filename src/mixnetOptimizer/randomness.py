@@ -0,0 +1,128 @@
+from numpy           import uint8
+from numpy           import ndarray
+from numpy           import frombuffer
+from numpy.random    import SeedSequence
+from numpy.random    import default_rng
+from threading       import local
+from threading       import current_thread
+from constants       import RANDOM_BLOCK
+from constants       import ALL_CHARACTERS
+from constants       import PLAINTEXT_BLOCK
+
+"""
+Seeded random streams of the workers. Each client and node draws its timers, the per-hop delays, the
+path of its packets and their plaintext from its own stream, so the workers never share a generator
+across threads, and a run with a given seed draws the same values for each worker. The simulation is
+single-threaded and its events are ordered by the virtual clock, so a seed replays it exactly, as long
+as the decoy and encoder worker pools are disabled - which of their packets are used depends on the
+timing of the processes. The jobs of the pools carry their own keys, a job draws from the stream of
+its key in whichever worker process runs it.
+A stream draws the exponentials, the uniforms and the plaintext characters in vectorized blocks and
+refills them lazily, so a single draw costs a list index instead of a NumPy call.
+"""
+
+"""
+PRIVATE
+"""
+
+__state = dict()
+
+# The streams of the threads that do not have a stream of their own.
+__threads = local()
+
+# The plaintext characters as bytes, indexed by the sampled character indices.
+__alphabet = frombuffer(bytes(''.join(ALL_CHARACTERS), encoding='utf-8'), dtype=uint8)
+
+"""
+PUBLIC
+"""
+
+# Stream of random values drawn in blocks.
+class RandomStream:
+
+    # seed      - seed of the stream, an integer or a numpy SeedSequence, None draws a fresh one.
+    # alphabet  - numpy array of the characters of the plaintext, as bytes.
+    # block     - the number of exponentials and uniforms drawn at once.
+    # textBlock - the number of plaintext characters drawn at once.
+    def __init__(self, seed, alphabet, block : int = RANDOM_BLOCK, textBlock : int = PLAINTEXT_BLOCK):
+        self.__generator    = default_rng(seed)
+        self.__alphabet     = alphabet
+        self.__block        = block
+        self.__textBlock    = textBlock
+        self.__exponentials = []
+        self.__uniforms     = []
+        self.__text         = b''
+        self.__nextExp      = 0
+        self.__nextUniform  = 0
+        self.__nextText     = 0
+
+    # Sample from the exponential distribution with the given mean.
+    def exponential(self, mean : float) -> float:
+        if self.__nextExp == len(self.__exponentials):
+            self.__exponentials = self.__generator.standard_exponential(self.__block).tolist()
+            self.__nextExp      = 0
+
+        self.__nextExp += 1
+
+        return self.__exponentials[self.__nextExp - 1] * mean
+
+    # Uniformly sample an index in [0, n).
+    def index(self, n : int) -> int:
+        if self.__nextUniform == len(self.__uniforms):
+            self.__uniforms    = self.__generator.random(self.__block).tolist()
+            self.__nextUniform = 0
+
+        self.__nextUniform += 1
+
+        return int(self.__uniforms[self.__nextUniform - 1] * n)
+
+    # Random plaintext of the given size in bytes, out of the available characters.
+    def plaintext(self, size : int) -> bytes:
+        if self.__nextText + size > len(self.__text):
+            indices         = self.__generator.integers(0, len(self.__alphabet), size=max(size, self.__textBlock))
+            self.__text     = self.__alphabet[indices].tobytes()
+            self.__nextText = 0
+
+        self.__nextText += size
+
+        return self.__text[self.__nextText - size:self.__nextText]
+
+    # Draw integers in [0, high) at once, e.g. the assignment of the users to the providers.
+    def integers(self, high : int, size : int) -> ndarray:
+        return self.__generator.integers(0, high, size=size)
+
+# Set the seed of the run, the streams created from now on derive from it.
+# seed   - integer, None draws a fresh one.
+# return - the seed, so a run with a fresh one can be replayed.
+def seedStreams(seed : int = None) -> int:
+    if seed is None:
+        seed = SeedSequence().entropy % 2 ** 32
+
+    __state['seed'] = seed
+
+    return seed
+
+# The seed of the run, e.g. to seed the streams of the worker processes.
+def streamSeed() -> int:
+    if 'seed' not in __state:
+        seedStreams()
+
+    return __state['seed']
+
+# A new stream of a worker. The stream depends only on the seed of the run and the worker ID, so each
+# worker draws the same values in every run with the seed, whatever the order of the workers' start.
+# workerId - e.g. the user or node ID.
+def workerStream(workerId : str) -> RandomStream:
+    if 'seed' not in __state:
+        seedStreams()
+
+    return RandomStream(SeedSequence([__state['seed']] + list(bytes(workerId, encoding='utf-8'))), __alphabet)
+
+# The stream of the calling thread, for the code that is not given a stream of a worker. Keyed by the
+# thread's name, it is not unique across processes - the worker processes draw from the streams of
+# their jobs instead.
+def threadStream() -> RandomStream:
+    if not hasattr(__threads, 'stream'):
+        __threads.stream = workerStream(current_thread().name)
+
+    return __threads.stream
@@ -0,0 +1,89 @@
+"""
+Replay protection of the mixnet nodes. A node keeps the tags of the packets it processed, a packet
+with a tag seen before is a replay. Nodes never rotate their keys within an experiment, so the
+epochs below only bound the memory: a replayed packet is detected as long as it arrives within the
+epoch of the original, older tags are forgotten.
+"""
+
+# Tags are outputs of a hash, so their prefix is uniformly distributed. Keeping only the prefix as an
+# integer takes a fraction of the memory of the tag, with a false positive probability of about
+# (number of tags kept) / 2^64.
+TAG_PREFIX = 8
+
+# Bounded cache of replay tags, split into two generations. New tags go to the current generation,
+# lookups check both. When the epoch passes, or the current generation holds half of the capacity,
+# the previous generation is dropped and the current one becomes the previous. So every tag is kept
+# for at least one epoch, unless the traffic fills the capacity sooner (counted as forced rotations),
+# and never more than capacity tags are kept.
+class ReplayCache:
+
+    # capacity - the maximal number of tags kept.
+    # epoch    - minimal time in seconds for which a tag is kept.
+    # now      - the current time, seconds. The cache takes the time from the caller, so it runs on
+    #            the wall clock of the socket engines as well as on the virtual clock of the
+    #            simulation.
+    def __init__(self, capacity : int, epoch : float, now : float):
+        self.__epoch      = epoch
+        self.__current    = set()
+        self.__previous   = set()
+        self.__rotatedAt  = now
+        self.__generation = max(1, capacity // 2)
+
+        self.__hits            = 0
+        self.__lookups         = 0
+        self.__rotations       = 0
+        self.__forcedRotations = 0
+
+    # Check the tag of a processed packet and remember it.
+    # return - True when the tag was seen within the epoch, so the packet is a replay.
+    def seen(self, tag : bytes, now : float) -> bool:
+        key = int.from_bytes(tag[:TAG_PREFIX], 'big')
+
+        self.__lookups += 1
+
+        if key in self.__current or key in self.__previous:
+            self.__hits += 1
+
+            return True
+
+        if now - self.__rotatedAt >= self.__epoch:
+            self.__rotate(now)
+
+        elif len(self.__current) >= self.__generation:
+            self.__forcedRotations += 1
+
+            self.__rotate(now)
+
+        self.__current.add(key)
+
+        return False
+
+    def __len__(self,) -> int:
+        return len(self.__current) + len(self.__previous)
+
+    def stats(self,) -> dict:
+        stats                    = dict()
+        stats['size'           ] = len(self)
+        stats['hits'           ] = self.__hits
+        stats['lookups'        ] = self.__lookups
+        stats['rotations'      ] = self.__rotations
+        stats['forcedRotations'] = self.__forcedRotations
+
+        return stats
+
+    def __rotate(self, now : float):
+        self.__previous   = self.__current
+        self.__current    = set()
+        self.__rotatedAt  = now
+        self.__rotations += 1
+
+# Sum the counters of the caches of many nodes.
+# stats - a list of dictionaries returned by ReplayCache.stats.
+def mergeStats(stats : list) -> dict:
+    merged = dict()
+
+    for cacheStats in stats:
+        for key, value in cacheStats.items():
+            merged[key] = merged.get(key, 0) + value
+
+    return merged
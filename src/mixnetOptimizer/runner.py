@@ -1,5 +1,6 @@
 from argparse  import ArgumentParser
 from optimizer import createMixnet
+from optimizer import createShardedMixnet
 
 """
 Project entry point. Simulates the mixnet.
@@ -10,17 +11,89 @@ if __name__ == "__main__":
     # Get command line arguments.
     parser = ArgumentParser()
 
-    parser.add_argument('--layers',        type=int, default=2)
-    parser.add_argument('--bodySize',      type=int, default=1024)
-    parser.add_argument('--providers',     type=int, default=2)
-    parser.add_argument('--tracesFile',    type=str, default="../../data/sample.json")
-    parser.add_argument('--nodesPerLayer', type=int, default=2)
+    parser.add_argument('--layers',         type=int, default=2)
+    parser.add_argument('--bodySize',       type=int, default=1024)
+    parser.add_argument('--providers',      type=int, default=2)
+    parser.add_argument('--tracesFile',     type=str, default="../../data/sample.json")
+    parser.add_argument('--nodesPerLayer',  type=int, default=2)
+    parser.add_argument('--decoyWorkers',   type=int, default=2)
+    parser.add_argument('--encoderWorkers', type=int, default=2)
+    parser.add_argument('--engine',         type=str, default='threaded', choices=['threaded', 'asyncio', 'simulation'])
+    parser.add_argument('--asyncWorkers',   type=int, default=4)
+    parser.add_argument('--nodeWorkers',    type=int, default=0)
+    parser.add_argument('--eventLog',       type=str, default='text', choices=['text', 'binary'])
+    parser.add_argument('--targetLatency',  type=float, default=None)
+    parser.add_argument('--metricsPort',    type=int, default=None)
+    parser.add_argument('--queueLimit',     type=int, default=None)
+    parser.add_argument('--queuePolicy',    type=str, default='dropNewest', choices=['dropNewest', 'dropDecoys', 'pauseReads'])
+    parser.add_argument('--snapshot',       type=str, default=None)
+    parser.add_argument('--seed',           type=int, default=None)
+    parser.add_argument('--shards',         type=int, default=0)
+    parser.add_argument('--hosts',          type=str, default=None, nargs='+')
+    parser.add_argument('--topologyFile',   type=str, default="../../logs/topology.json")
+    parser.add_argument('--observerHost',   type=str, default='127.0.0.1')
 
-    args          = parser.parse_args()
-    layers        = args.layers
-    bodySize      = args.bodySize
-    providers     = args.providers
-    tracesFile    = args.tracesFile
-    nodesPerLayer = args.nodesPerLayer
+    args           = parser.parse_args()
+    layers         = args.layers
+    bodySize       = args.bodySize
+    providers      = args.providers
+    tracesFile     = args.tracesFile
+    nodesPerLayer  = args.nodesPerLayer
+    decoyWorkers   = args.decoyWorkers
+    encoderWorkers = args.encoderWorkers
+    engine         = args.engine
+    asyncWorkers   = args.asyncWorkers
+    nodeWorkers    = args.nodeWorkers
+    eventLog       = args.eventLog
+    targetLatency  = args.targetLatency
+    metricsPort    = args.metricsPort
+    queueLimit     = args.queueLimit
+    queuePolicy    = args.queuePolicy
+    snapshot       = args.snapshot
+    seed           = args.seed
+    shards         = args.shards
+    hosts          = args.hosts
+    topologyFile   = args.topologyFile
+    observerHost   = args.observerHost
 
-    createMixnet(layers, bodySize, providers, tracesFile, nodesPerLayer)
\ No newline at end of file
+    # The sharded mixnet runs the threaded engine in a process per shard, the arguments of the other
+    # engines and of the single-process mixnet do not apply to it.
+    if shards > 0 or hosts is not None:
+        for name in ['engine', 'asyncWorkers', 'nodeWorkers', 'metricsPort', 'snapshot']:
+            if getattr(args, name) != parser.get_default(name):
+                parser.error('--' + name + ' is not supported with --shards or --hosts')
+
+        createShardedMixnet(layers,
+                            bodySize,
+                            providers,
+                            tracesFile,
+                            nodesPerLayer,
+                            shards,
+                            hosts,
+                            topologyFile,
+                            observerHost,
+                            decoyWorkers,
+                            encoderWorkers,
+                            eventLog,
+                            targetLatency=targetLatency,
+                            queueLimit=queueLimit,
+                            queuePolicy=queuePolicy,
+                            seed=seed)
+    else:
+        createMixnet(layers, 
+                     bodySize, 
+                     providers, 
+                     tracesFile, 
+                     nodesPerLayer, 
+                     decoyWorkers, 
+                     encoderWorkers, 
+                     engine, 
+                     asyncWorkers, 
+                     nodeWorkers, 
+                     eventLog,
+                     targetLatency=targetLatency,
+                     metricsPort=metricsPort,
+                     queueLimit=queueLimit,
+                     queuePolicy=queuePolicy,
+                     snapshot=snapshot,
+                     seed=seed)
\ No newline at end of file
@@ -0,0 +1,86 @@
+from time      import time
+from threading import Lock
+from threading import Condition
+from constants import SCHEDULER_MAX_WAIT
+
+"""
+Timers of the threaded engine. Instead of probing their queues and timers every few milliseconds,
+the workers of the clients and nodes sleep until their next deadline and are woken up early when a
+packet is enqueued for them. The scheduler measures its own error - the lateness of every timer,
+that is, the time between the deadline and the moment the worker actually acted on it.
+"""
+
+# Upper bounds of the lateness histogram buckets in seconds. The last bucket is unbounded.
+LATENESS_BUCKETS = [0.0001, 0.001, 0.01, 0.1]
+
+# Wakes a single worker thread at its next deadline or when it is notified, whichever comes first.
+class Wakeup:
+
+    # maxWait - the longest time the worker sleeps, so it still polls its commands periodically.
+    def __init__(self, maxWait : float):
+        self.__maxWait   = maxWait
+        self.__notified  = False
+        self.__condition = Condition(Lock())
+
+    # Wake the worker up, e.g. a packet was enqueued for it. Called from other threads.
+    def notify(self,):
+        with self.__condition:
+            self.__notified = True
+
+            self.__condition.notify()
+
+    # Sleep until the deadline (epoch seconds) or a notification. Returns immediately when the
+    # deadline passed or the worker was notified since the last wait.
+    def wait(self, deadline : float):
+        with self.__condition:
+            if not self.__notified:
+                timeout = min(deadline - time(), self.__maxWait)
+
+                if timeout > 0:
+                    self.__condition.wait(timeout)
+
+            self.__notified = False
+
+# Shared by all the workers of the threaded engine. Creates their wakeups and collects the
+# scheduling error.
+class Scheduler:
+
+    # maxWait - see Wakeup.
+    def __init__(self, maxWait : float = SCHEDULER_MAX_WAIT):
+        self.__lock    = Lock()
+        self.__maxWait = maxWait
+        self.__count   = 0
+        self.__total   = 0.
+        self.__max     = 0.
+        self.__buckets = [0] * (len(LATENESS_BUCKETS) + 1)
+
+    def wakeup(self,) -> Wakeup:
+        return Wakeup(self.__maxWait)
+
+    # Record that a worker acted on a timer with the given deadline (epoch seconds) now.
+    def fired(self, deadline : float):
+        lateness = max(0., time() - deadline)
+        bucket   = 0
+
+        while bucket < len(LATENESS_BUCKETS) and LATENESS_BUCKETS[bucket] <= lateness:
+            bucket += 1
+
+        with self.__lock:
+            self.__count            += 1
+            self.__total            += lateness
+            self.__max               = max(self.__max, lateness)
+            self.__buckets[bucket]  += 1
+
+    # Scheduling error of all the timers so far: the number of timers, the mean and the maximal
+    # lateness in seconds and the number of timers per lateness bucket, keyed by its upper bound.
+    def stats(self,) -> dict:
+        with self.__lock:
+            stats          = dict()
+            stats['count'] = self.__count
+            stats['mean' ] = self.__total / self.__count if self.__count > 0 else 0.
+            stats['max'  ] = self.__max
+
+            for bound, count in zip(LATENESS_BUCKETS + [float('inf')], self.__buckets):
+                stats['<' + str(bound)] = count
+
+            return stats
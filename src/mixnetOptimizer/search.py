@@ -0,0 +1,249 @@
+from os                         import makedirs
+from time                       import time
+from os.path                    import join
+from math                       import inf
+from math                       import log
+from math                       import exp
+from math                       import ceil
+from random                     import Random
+from traces                     import scanTraces
+from optimizer                  import createMixnet
+from constants                  import SEARCH_SPACE
+from constants                  import SEARCH_TIMEOUT
+from constants                  import NODE_PORT_BASE
+from contextlib                 import redirect_stdout
+from multiprocessing            import get_context
+from multiprocessing.connection import wait
+from multiprocessing.connection import Connection
+
+"""
+Parallel search of the mixnet parameters (LAMBDAS) for the trade-off between the E2E latency of the
+LEGIT messages and the mean entropy of the mixes. Every configuration is an independent run of
+createMixnet in its own process, with its own port range and log file, so many of them run side by
+side. Successive halving stops the poor configurations early: all the configurations run on a short
+prefix of the traces, only the best of them continue on longer ones, up to the whole traces. The
+result is the Pareto front of the configurations that ran on the whole traces.
+"""
+
+"""
+PRIVATE
+"""
+
+# Sample a configuration, each of the LAMBDAS log-uniformly from its range.
+def __sample(random : Random, space : dict) -> dict:
+    return dict([(key, exp(random.uniform(log(low), log(high)))) for key, (low, high) in space.items()])
+
+# Whether the result a is at least as good as b in both objectives and better in one of them.
+def __dominates(a : dict, b : dict) -> bool:
+    return (a['latency'] <= b['latency'] and
+            a['entropy'] >= b['entropy'] and
+            (a['latency'] < b['latency'] or a['entropy'] > b['entropy']))
+
+# Split the results into successive non-dominated fronts, the first one is the Pareto front.
+def __fronts(results : list) -> list:
+    fronts    = []
+    remaining = list(results)
+
+    while remaining:
+        front     = [a for a in remaining if not any(__dominates(b, a) for b in remaining)]
+        remaining = [a for a in remaining if a not in front]
+        fronts   += [front]
+
+    return fronts
+
+# Crowding distance of the results of a single front, the results at the ends of the front and in its
+# sparse parts are preferred, so the front keeps its spread.
+def __crowding(front : list) -> dict:
+    distance = dict([(id(result), 0.) for result in front])
+
+    for key in ['latency', 'entropy']:
+        ordered = sorted(front, key=lambda result : result[key])
+        spread  = ordered[-1][key] - ordered[0][key]
+
+        distance[id(ordered[ 0])] = inf
+        distance[id(ordered[-1])] = inf
+
+        if spread == 0 or spread == inf:
+            continue
+
+        for idx in range(1, len(ordered) - 1):
+            distance[id(ordered[idx])] += (ordered[idx + 1][key] - ordered[idx - 1][key]) / spread
+
+    return distance
+
+# Order the results from the best one. The runs that delivered all their mails go first, then by
+# their non-dominated front and the crowding distance within it.
+def __rank(results : list) -> list:
+    ranked = []
+
+    for complete in [True, False]:
+        for front in __fronts([result for result in results if result['complete'] == complete]):
+            distance  = __crowding(front)
+            ranked   += sorted(front, key=lambda result : -distance[id(result)])
+
+    return ranked
+
+# Run the configurations of a rung, at most workers at once. Each run in a fresh spawned process - the
+# mixnet keeps process-wide state, such as its connections and the logging configuration. A run that
+# dies without a result, or does not finish within the timeout, fails the search.
+# timeout - the wall time of a single run in seconds.
+# return  - the results in the order of the batch.
+def __runBatch(batch : list, workers : int, timeout : float) -> list:
+    context = get_context('spawn')
+    results = [None] * len(batch)
+    pending = list(enumerate(batch))
+    running = dict()
+
+    while pending or running:
+        while pending and len(running) < workers:
+            idx, run       = pending.pop(0)
+            reader, writer = context.Pipe(duplex=False)
+            process        = context.Process(target=runEvaluation, args=(run, writer))
+
+            process.start()
+            writer.close()
+
+            running[reader] = (idx, process, time() + timeout)
+
+        deadline = min(entry[2] for entry in running.values())
+
+        # A stuck run is terminated together with the others.
+        for reader in wait(list(running), timeout=max(0., deadline - time())) or []:
+            idx, process, _ = running.pop(reader)
+
+            try:
+                results[idx] = reader.recv()
+            except EOFError:
+                process.join()
+
+                for _, other, _ in running.values():
+                    other.terminate()
+
+                raise RuntimeError('run ' + str(batch[idx]['id']) + ' failed with exit code ' + str(process.exitcode))
+
+            reader.close()
+            process.join()
+
+        for idx, process, runDeadline in list(running.values()):
+            if runDeadline <= time():
+                for _, other, _ in running.values():
+                    other.terminate()
+
+                raise RuntimeError('run ' + str(batch[idx]['id']) + ' did not finish within ' + str(timeout) + ' seconds')
+
+    return results
+
+"""
+PUBLIC
+"""
+
+# Run a single configuration of the search in a worker process. The output of the run is written next
+# to its log.
+# run    - dictionary with:
+#              - id, rung - the number of the configuration and of the rung it runs in.
+#              - mixnet - the keyword arguments of createMixnet.
+# return - the run and its objectives: the mean E2E latency of the LEGIT messages (infinite when none
+#          was delivered) and the mean entropy of the mixes.
+def evaluate(run : dict) -> dict:
+    with open(run['mixnet']['logFile'] + '.out', 'w', encoding='utf-8') as output:
+        with redirect_stdout(output):
+            statistics = createMixnet(**run['mixnet'])
+
+    result               = dict()
+    result['id'        ] = run['id']
+    result['rung'      ] = run['rung']
+    result['horizon'   ] = run['mixnet']['horizon']
+    result['lambdas'   ] = run['mixnet']['lambdas']
+    result['latency'   ] = statistics['mean'] if statistics['count'] > 0 else inf
+    result['entropy'   ] = statistics['entropy']
+    result['complete'  ] = statistics['count'] >= statistics['mails']
+    result['statistics'] = statistics
+
+    return result
+
+# Entry point of the process of a single run, sends the result of evaluate back to the search.
+# conn - the writing end of a pipe to the search's process.
+def runEvaluation(run : dict, conn : Connection):
+    conn.send(evaluate(run))
+    conn.close()
+
+# The results not dominated by any other one, ordered by latency. Only the runs that delivered all
+# their mails are considered, unless there are none.
+def paretoFront(results : list) -> list:
+    if not results:
+        return []
+
+    complete = [result for result in results if result['complete']]
+
+    return sorted(__fronts(complete if complete else results)[0], key=lambda result : result['latency'])
+
+# Search the LAMBDAS with successive halving. Rung r runs the configurations on the mails of the first
+# eta ** (r - rungs + 1) fraction of the traces' time, the best 1 / eta of them are promoted to the
+# next rung.
+# mixnet         - keyword arguments of createMixnet shared by all the runs, e.g. layers, bodySize,
+#                  providers, nodesPerLayer, engine.
+# configurations - the number of configurations sampled for the first rung.
+# eta            - the reduction factor between two rungs.
+# rungs          - the number of rungs, the last one runs on the whole traces.
+# workers        - the number of runs in parallel.
+# seed           - seed of the configuration sampling and of the runs. All the runs share it, so the
+#                  configurations are compared on the same random draws.
+# logDir         - directory of the runs' logs, metrics and outputs.
+# space          - dictionary, the range of each of the LAMBDAS.
+# timeout        - the wall time of a single run in seconds, a run that takes longer fails the search.
+# return         - dictionary with all the results, in the order of the rungs, and the Pareto front of
+#                  the last rung.
+def successiveHalving(tracesFile     : str,
+                      mixnet         : dict,
+                      configurations : int = 27,
+                      eta            : int = 3,
+                      rungs          : int = 3,
+                      workers        : int = 4,
+                      seed           : int = None,
+                      logDir         : str = '../../logs/search',
+                      space          : dict = SEARCH_SPACE,
+                      timeout        : float = SEARCH_TIMEOUT) -> dict:
+
+    makedirs(logDir, exist_ok=True)
+
+    random   = Random(seed)
+    lastTime = scanTraces(tracesFile).lastTime
+    results  = []
+    runs     = 0
+
+    # Every run gets its own port range, the ranges are reused only after all of them were used, so
+    # the runs in parallel never collide.
+    span   = mixnet['providers'] + mixnet['layers'] * mixnet['nodesPerLayer']
+    ranges = (65536 - NODE_PORT_BASE) // span
+
+    assert ranges >= workers
+
+    candidates = [(idx, __sample(random, space)) for idx in range(configurations)]
+
+    for rung in range(rungs):
+        horizon = lastTime * eta ** (rung - rungs + 1)
+        batch   = []
+
+        for idx, lambdas in candidates:
+            runMixnet                = dict(mixnet)
+            runMixnet['tracesFile' ] = tracesFile
+            runMixnet['lambdas'    ] = lambdas
+            runMixnet['static'     ] = True
+            runMixnet['horizon'    ] = horizon
+            runMixnet['portBase'   ] = NODE_PORT_BASE + runs % ranges * span
+            runMixnet['seed'       ] = seed
+            runMixnet['logFile'    ] = join(logDir, 'run{:04d}-rung{}.{}'.format(idx, rung, 'bin' if mixnet.get('eventLog') == 'binary' else 'log'))
+            runMixnet['metricsFile'] = join(logDir, 'run{:04d}-rung{}.metrics.json'.format(idx, rung))
+            batch                   += [{ 'id' : idx, 'rung' : rung, 'mixnet' : runMixnet }]
+            runs                    += 1
+
+        rungResults  = __runBatch(batch, workers, timeout)
+        results     += rungResults
+        ranked       = __rank(rungResults)
+
+        print('rung', rung, 'horizon', horizon, 'front', [(result['id'], result['latency'], result['entropy']) for result in paretoFront(rungResults)])
+
+        # Promote the best configurations to the next rung.
+        candidates = [(result['id'], result['lambdas']) for result in ranked[:max(1, ceil(len(ranked) / eta))]]
+
+    return { 'results' : results, 'front' : paretoFront([result for result in results if result['rung'] == rungs - 1]) }
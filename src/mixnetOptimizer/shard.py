@@ -0,0 +1,21 @@
+from argparse import ArgumentParser
+from sharding import runShard
+
+"""
+Runs a single shard of a sharded mixnet, on the host assigned to it in the topology file. The 
+coordinator has to be waiting for the shards, see optimizer.createShardedMixnet.
+"""
+
+if __name__ == "__main__":
+    
+    # Get command line arguments.
+    parser = ArgumentParser()
+
+    parser.add_argument('--topologyFile', type=str, default="../../logs/topology.json")
+    parser.add_argument('--shard',        type=int, default=0)
+
+    args         = parser.parse_args()
+    topologyFile = args.topologyFile
+    shard        = args.shard
+
+    runShard(topologyFile, shard)
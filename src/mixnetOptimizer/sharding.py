@@ -0,0 +1,460 @@
+from os                         import urandom
+from pki                        import CompiledPKI
+from json                       import dump
+from json                       import load
+from time                       import time
+from node                       import Node
+from util                       import sendStats
+from util                       import nodeIds
+from util                       import sphinxParams
+from util                       import closeConnections
+from queue                      import Empty
+from queue                      import SimpleQueue
+from numpy                      import array
+from client                     import Client
+from decoys                     import DecoyPool
+from users                      import ProviderMap
+from traces                     import TraceFeeder
+from encoder                    import Encoder
+from replay                     import mergeStats
+from eventlog                   import stopEventLog
+from eventlog                   import startEventLog
+from logging                    import INFO
+from logging                    import basicConfig
+from petlib.bn                  import Bn
+from scheduler                  import Scheduler
+from threading                  import Lock
+from threading                  import Thread
+from parameters                 import ParameterStore
+from randomness                 import seedStreams
+from constants                  import SHARD_BATCH
+from constants                  import SHARD_FLUSH
+from constants                  import NODE_PORT_BASE
+from metrics                    import overloadStats
+from multiprocessing.connection import Listener
+from multiprocessing.connection import Connection
+from multiprocessing.connection import Client as connect
+
+"""
+Sharding of the threaded mixnet over several processes, possibly on different hosts, so the mixnet
+is not limited by a single GIL. The coordinator assigns the nodes and the clients to the shards,
+generates the nodes' keys and writes the topology file - the PKI with the host and port of every node,
+the assignment and the experiment's configuration. Each shard gets its own keys file with the secret
+keys of its nodes. A shard process runs its nodes and clients with the threaded engine and reports
+their events to the coordinator's observer over a connection, which in turn carries the parameter
+updates and the shutdown back to the shard.
+
+The messages of the connection are tuples:
+    - shard to coordinator: ('ready', shard), ('events', list of events), ('ack', version),
+      ('done', stats).
+    - coordinator to shard: ('start', epoch), ('publish', version, lambdas), ('stop', ).
+The latencies are computed from the timestamps of different hosts, so their clocks should be
+synchronized.
+"""
+
+"""
+PRIVATE
+"""
+
+# Hosts on which the shards are launched as local processes.
+__LOCAL_HOSTS = ['127.0.0.1', 'localhost']
+
+"""
+PUBLIC
+"""
+
+# Path of the file with the secret keys of a shard's nodes.
+def keysFile(path : str, shard : int) -> str:
+    return path[:-len('.json')] + '.shard{}.keys.json'.format(shard)
+
+# A new random shared secret of the coordinator and the shards, hex-encoded for the topology file.
+def newAuthkey() -> str:
+    return urandom(16).hex()
+
+# Whether the shard on the given host is launched by the coordinator.
+def isLocalHost(host : str) -> bool:
+    return host in __LOCAL_HOSTS
+
+# Assign the nodes and the clients to the shards round-robin and generate the nodes' keys. The nodes
+# of each host listen at consecutive ports from portBase, so the ports do not depend on the node IDs.
+# senders  - the user IDs of the clients.
+# hosts    - the host of each shard.
+# portBase - the first port of the nodes on each host.
+# return   - the topology (a dictionary with the PKI and the shards, each with its host, node IDs and
+#            client IDs) and the secret keys of each shard's nodes (dictionaries, node ID to hex).
+def assignShards(layers        : int,
+                 bodySize      : int,
+                 providers     : int,
+                 nodesPerLayer : int,
+                 senders       : list,
+                 hosts         : list,
+                 portBase      : int = NODE_PORT_BASE) -> tuple:
+
+    params  = sphinxParams(layers, bodySize)
+    pki     = dict()
+    shards  = [{ 'host' : host, 'nodes' : [], 'clients' : [] } for host in hosts]
+    secrets = [dict() for _ in hosts]
+    ports   = dict([(host, portBase) for host in hosts])
+
+    # The same node IDs as in createMixnet, the mixes follow the providers' numeration.
+    for idx, (layer, nodeId) in enumerate(nodeIds(layers, providers, nodesPerLayer)):
+        shard     = idx % len(hosts)
+        host      = hosts[shard]
+        secretKey = params.group.gensecret()
+
+        view              = dict()
+        view['host'     ] = host
+        view['port'     ] = ports[host]
+        view['layer'    ] = layer
+        view['nodeId'   ] = nodeId
+        view['publicKey'] = params.group.expon(params.group.g, [ secretKey ]).export().hex()
+
+        pki[nodeId]             = view
+        ports[host]            += 1
+        secrets[shard][nodeId]  = secretKey.hex()
+        shards[shard]['nodes'] += [nodeId]
+
+    for idx, userId in enumerate(senders):
+        shards[idx % len(hosts)]['clients'] += [userId]
+
+    return { 'pki' : pki, 'shards' : shards }, secrets
+
+# Write the topology file and the keys file of every shard.
+def writeTopology(path : str, topology : dict, secrets : list):
+    with open(path, 'w', encoding='utf-8') as file:
+        dump(topology, file)
+
+    for shard, keys in enumerate(secrets):
+        with open(keysFile(path, shard), 'w', encoding='utf-8') as file:
+            dump(keys, file)
+
+# Read the topology file and the keys of a single shard.
+def readTopology(path : str, shard : int) -> tuple:
+    with open(path, 'r', encoding='utf-8') as file:
+        topology = load(file)
+
+    with open(keysFile(path, shard), 'r', encoding='utf-8') as file:
+        secrets = load(file)
+
+    return topology, secrets
+
+# The coordinator's end of the connections to the shards. The events of the shards are put on the
+# observer's eventQueue, the parameter updates and the shutdown published to the coordinator's
+# parameter store are broadcast to all the shards.
+class ObserverChannel:
+
+    # address    - (host, port) at which the coordinator listens for the shards.
+    # authkey    - shared secret, authenticates the shards.
+    # shards     - the number of shards.
+    # parameters - the coordinator's parameter store. Each shard acknowledges every version once all
+    #              its workers use it.
+    def __init__(self, address : tuple, authkey : bytes, shards : int, eventQueue : SimpleQueue, parameters : ParameterStore):
+        self.__listener    = Listener(address, authkey=authkey)
+        self.__shards      = shards
+        self.__eventQueue  = eventQueue
+        self.__parameters  = parameters
+        self.__lock        = Lock()
+        self.__connections = [None] * shards
+        self.__readers     = []
+        self.__version     = parameters.current.version
+        self.__stopped     = False
+        self.__stats       = [None] * shards
+        self.__events      = 0
+
+    # Wait until all the shards connected and started their nodes.
+    def accept(self,):
+        for _ in range(self.__shards):
+            conn     = self.__listener.accept()
+            _, shard = conn.recv()
+
+            self.__connections[shard] = conn
+
+    # Start all the shards at once and forward their events from now on.
+    # return - the epoch time of the start.
+    def start(self,) -> float:
+        start = time()
+
+        for shard, conn in enumerate(self.__connections):
+            conn.send(('start', start))
+
+            self.__readers += [Thread(target=self.__read, args=(shard, conn))]
+            self.__readers[-1].start()
+
+        self.__parameters.subscribe(self.__broadcast)
+
+        return start
+
+    # Wait until all the shards terminated.
+    # return - the final statistics of each shard.
+    def close(self,) -> list:
+        for reader in self.__readers:
+            reader.join()
+
+        self.__parameters.unsubscribe(self.__broadcast)
+        self.__listener.close()
+
+        for conn in self.__connections:
+            conn.close()
+
+        return list(self.__stats)
+
+    # The number of events received from the shards.
+    def stats(self,) -> dict:
+        return { 'events' : self.__events }
+
+    def __read(self, shard : int, conn : Connection):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+
+            if message[0] == 'events':
+                for event in message[1]:
+                    self.__eventQueue.put(event)
+
+                self.__events += len(message[1])
+
+            elif message[0] == 'ack':
+                self.__parameters.acknowledge(message[1])
+
+            elif message[0] == 'done':
+                self.__stats[shard] = message[1]
+                break
+
+    # Called on every publication and on the shutdown of the coordinator's parameter store.
+    def __broadcast(self,):
+        with self.__lock:
+            if self.__stopped:
+                return
+
+            if self.__parameters.shutdown.is_set():
+                message        = ('stop', )
+                self.__stopped = True
+            else:
+                current = self.__parameters.current
+
+                if current.version == self.__version:
+                    return
+
+                message        = ('publish', current.version, dict(current.lambdas))
+                self.__version = current.version
+
+            for conn in self.__connections:
+                try:
+                    conn.send(message)
+                except OSError:
+                    pass
+
+# The shard's end of the connection to the coordinator. The events of the shard's clients and nodes
+# are forwarded in batches, the parameter updates and the shutdown are published to the shard's
+# parameter store.
+class ShardChannel:
+
+    # address    - (host, port) of the coordinator.
+    # authkey    - shared secret, authenticates the shard.
+    # shard      - the number of the shard.
+    # parameters - the shard's parameter store.
+    # eventQueue - the queue on which the shard's clients and nodes report their events.
+    # decoyPool  - the shard's pool of pre-generated decoy packets or None. Informed about the mean
+    #              delay changes.
+    def __init__(self,
+                 address    : tuple,
+                 authkey    : bytes,
+                 shard      : int,
+                 parameters : ParameterStore,
+                 eventQueue : SimpleQueue,
+                 decoyPool  : DecoyPool = None):
+        self.__conn       = connect(address, authkey=authkey)
+        self.__lock       = Lock()
+        self.__shard      = shard
+        self.__parameters = parameters
+        self.__eventQueue = eventQueue
+        self.__decoyPool  = decoyPool
+
+        # Maps the versions of the shard's parameter store to the coordinator's ones. The coordinator
+        # may skip versions, so they are numbered differently.
+        self.__versions     = dict()
+        self.__versionsLock = Lock()
+
+        parameters.watch(self.__adopted)
+
+    # Report that the shard's nodes listen and wait for the coordinator to start all the shards.
+    # return - the epoch time of the start.
+    def ready(self,) -> float:
+        self.__conn.send(('ready', self.__shard))
+
+        return self.__conn.recv()[1]
+
+    # Worker receiving the coordinator's commands until the shutdown.
+    def commands(self,):
+        while True:
+            try:
+                message = self.__conn.recv()
+            except (EOFError, OSError):
+                message = ('stop', )
+
+            if message[0] == 'stop':
+                self.__parameters.stop()
+                break
+
+            with self.__versionsLock:
+                version = self.__parameters.publish(message[2]).version
+
+                self.__versions[version] = message[1]
+
+            # Pre-generated decoys embed the mean delay, refill them with the new one.
+            if self.__decoyPool is not None:
+                self.__decoyPool.setDelayMean(message[2]['DELAY'])
+
+    # Worker forwarding the events in batches until the shutdown.
+    def forward(self,):
+        while not self.__parameters.shutdown.is_set() or not self.__eventQueue.empty():
+            try:
+                batch = [self.__eventQueue.get(timeout=SHARD_FLUSH)]
+            except Empty:
+                continue
+
+            while len(batch) < SHARD_BATCH:
+                try:
+                    batch += [self.__eventQueue.get_nowait()]
+                except Empty:
+                    break
+
+            self.__send(('events', batch))
+
+    # Report the final statistics of the shard and close the connection.
+    def finish(self, stats : dict):
+        self.__send(('done', stats))
+        self.__conn.close()
+
+    # Acknowledge a version to the coordinator once all the shard's workers adopted it. The versions
+    # published before it are dropped, their workers skipped them.
+    # version - the version of the shard's parameter store.
+    def __adopted(self, version : int):
+        with self.__versionsLock:
+            published = self.__versions.get(version)
+
+            for skipped in [key for key in self.__versions if key <= version]:
+                del self.__versions[skipped]
+
+        if published is not None:
+            self.__send(('ack', published))
+
+    def __send(self, message : tuple):
+        with self.__lock:
+            try:
+                self.__conn.send(message)
+            except OSError:
+                pass
+
+# Run a single shard of a sharded mixnet with the threaded engine until the coordinator stops it.
+# path  - the topology file written by the coordinator.
+# shard - the number of the shard.
+def runShard(path : str, shard : int):
+    topology, secrets = readTopology(path, shard)
+
+    config     = topology['config']
+    assignment = topology['shards'][shard]
+    params     = sphinxParams(config['layers'], config['bodySize'])
+    users      = ProviderMap(topology['userIds'], array(topology['providers']))
+    eventQueue = SimpleQueue()
+    decoyPool  = None
+    nodes      = []
+    clients    = []
+    threads    = []
+
+    # Every shard logs to its own file.
+    logFile = config['logFile'].format(shard)
+
+    if config['eventLog'] == 'binary':
+        startEventLog(logFile)
+    else:
+        basicConfig(filename=logFile, level=INFO, encoding='utf-8', force=True)
+
+    # The workers draw the same values as they would in a single process with the seed.
+    seedStreams(config['seed'])
+
+    parameters = ParameterStore(config['lambdas'], len(assignment['nodes']) + len(assignment['clients']))
+    scheduler  = Scheduler()
+
+    # The nodes listen at the addresses of the topology, with the keys the coordinator generated.
+    for nodeId in assignment['nodes']:
+        view   = topology['pki'][nodeId]
+        nodes += [Node(view['layer'],
+                       nodeId,
+                       params,
+                       config['bodySize'],
+                       parameters,
+                       eventQueue,
+                       scheduler,
+                       address=(view['host'], view['port']),
+                       secretKey=Bn.from_hex(secrets[nodeId]),
+                       queueLimit=config['queueLimit'],
+                       queuePolicy=config['queuePolicy'])]
+
+    pki = CompiledPKI(topology['pki'], params)
+
+    # Decoys only for the shard's own senders and mixes.
+    if config['decoyWorkers'] > 0:
+        decoyPool = DecoyPool(pki, params, config['bodySize'], users, config['lambdas']['DELAY'], config['decoyWorkers'])
+
+        for userId in assignment['clients']:
+            decoyPool.register(userId, 'DROP')
+            decoyPool.register(userId, 'LOOP')
+
+        for nodeId in assignment['nodes']:
+            if pki.layer(nodeId) != 0:
+                decoyPool.register(nodeId, 'LOOP_MIX')
+
+        decoyPool.start()
+
+    for node in nodes:
+        node.setPKI(pki)
+        node.setDecoyPool(decoyPool)
+
+        threads += [Thread(target=node.start)]
+
+    encoder   = Encoder(pki, params, config['bodySize'], users, config['encoderWorkers'])
+    usrMsgGen = encoder.generate
+
+    for userId in assignment['clients']:
+        clients += [Client(userId, config['bodySize'], [], parameters, eventQueue, pki.address(users[userId]), usrMsgGen, decoyPool, scheduler)]
+        threads += [Thread(target=clients[-1].start)]
+
+    channel = ShardChannel(tuple(topology['observer']), bytes.fromhex(topology['authkey']), shard, parameters, eventQueue, decoyPool)
+    start   = channel.ready()
+    feeder  = TraceFeeder(config['tracesFile'], dict(zip(assignment['clients'], clients)), horizon=config['horizon'])
+
+    threads += [Thread(target=feeder.run, args=(start, parameters.shutdown))]
+    threads += [Thread(target=channel.commands)]
+    threads += [Thread(target=channel.forward)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    # The pools are shut down before the shard's process exits, or its workers may block forever.
+    encoder.close(wait=True)
+    closeConnections()
+
+    stats                = dict()
+    stats['connections'] = sendStats()
+    stats['scheduling' ] = scheduler.stats()
+    stats['replay'     ] = mergeStats([node.replayStats() for node in nodes])
+    stats['propagation'] = parameters.propagationStats()
+
+    if config['queueLimit'] is not None:
+        stats['overload'] = overloadStats([node.metrics() for node in nodes])
+
+    if config['eventLog'] == 'binary':
+        stats['eventLog'] = stopEventLog()
+
+    if decoyPool is not None:
+        decoyPool.close(wait=True)
+
+        stats['decoys'] = decoyPool.stats()
+
+    channel.finish(stats)
@@ -0,0 +1,339 @@
+from pki                    import CompiledPKI
+from util                   import unwrapPacket
+from util                   import updateEntropy
+from util                   import generateMessage
+from heapq                  import heappop
+from heapq                  import heappush
+from decoys                 import DecoyPool
+from typing                 import Callable
+from replay                 import ReplayCache
+from eventlog               import logEvent
+from observer               import Observer
+from constants              import LAMBDAS
+from constants              import REPLAY_EPOCH
+from constants              import REPLAY_CAPACITY
+from constants              import LEGIT_LAG
+from constants              import NODE_PORT_BASE
+from itertools              import count
+from collections            import deque
+from randomness             import workerStream
+from petlib.bn              import Bn
+from sphinxmix.SphinxParams import SphinxParams
+from sphinxmix.SphinxClient import Dest_flag
+from sphinxmix.SphinxClient import Relay_flag
+
+"""
+Discrete-event simulation engine. Clients and nodes keep the semantics of the socket engines (Poisson
+timers, per-hop exponential delays, replay tag checks, entropy updates and the logging format), but
+there are no sockets and no threads. A virtual clock advances through a global heap of events, so a
+simulation runs as fast as the CPU allows. Packets still go through the real Sphinx encoding and
+processing, transmission between the entities is instantaneous.
+"""
+
+# Virtual clock and the global event heap.
+class Simulation:
+
+    # start   - virtual time at the start of the simulation. Epoch seconds keep the log timestamps in
+    #           the same range as the socket engines' ones.
+    # lambdas - the initial mixnet parameters.
+    def __init__(self, start : float, lambdas : dict = LAMBDAS):
+        self.now     = start
+        self.start   = start
+        self.lambdas = lambdas
+
+        # Events are (time, sequence number, callback, arguments). The sequence number keeps events
+        # at the same virtual time in the scheduling order.
+        self.__events   = []
+        self.__sequence = count()
+        self.__nodes    = dict()
+        self.__observer = None
+
+    # Schedule a callback after a virtual delay in seconds.
+    def schedule(self, delay : float, callback : Callable, *args):
+        self.scheduleAt(self.now + delay, callback, *args)
+
+    # Schedule a callback at an absolute virtual time, not before the current one. The clock runs in
+    # epoch seconds, where a small delay added to it may round away, so the callbacks that must
+    # advance the clock schedule at the time they computed.
+    def scheduleAt(self, at : float, callback : Callable, *args):
+        heappush(self.__events, (max(at, self.now), next(self.__sequence), callback, args))
+
+    # Register a node, so packets can be delivered to it by its ID.
+    def register(self, nodeId : str, node):
+        self.__nodes[nodeId] = node
+
+    # Deliver a packet to a node, at the current virtual time.
+    def deliver(self, nodeId : str, packet : bytes):
+        self.schedule(0., self.__nodes[nodeId].receive, packet)
+
+    # Report an event to the observer, same events as in the eventQueue of the socket engines.
+    def report(self, event : tuple):
+        self.__observer.handle(event)
+
+    # Run the simulation until the observer terminates it.
+    # decoyPool - pool of pre-generated decoy packets or None. Informed about the mean delay changes.
+    # return    - the simulated time in seconds.
+    def run(self, observer : Observer, nodes : list, clients : list, decoyPool : DecoyPool = None) -> float:
+        start           = self.now
+        self.__observer = observer
+
+        for worker in nodes + clients:
+            worker.start()
+
+        while self.__events:
+            self.now, _, callback, args = heappop(self.__events)
+
+            callback(*args)
+
+            cmd = observer.poll(self.now)
+
+            # All messages were delivered or the simulation runs too long.
+            if cmd == []:
+                break
+
+            # Parameter change reaches all the workers at once.
+            elif cmd is not None:
+                self.lambdas = cmd
+
+                if decoyPool is not None:
+                    decoyPool.setDelayMean(cmd['DELAY'])
+
+        return self.now - start
+
+# Discrete-event counterpart of Node. Arguments are the same as in Node, except:
+# simulation - the Simulation that runs the node.
+class SimNode:
+
+    def __init__(self,
+                 layer      : int,
+                 nodeId     : str,
+                 params     : SphinxParams,
+                 bodySize   : int,
+                 simulation : Simulation,
+                 portBase   : int = NODE_PORT_BASE,
+                 secretKey  : Bn = None):
+
+        # For entropy computation.
+        self.__h = 0
+        self.__k = 0
+        self.__l = 0
+
+        self.__port       = portBase + int(nodeId[1:])
+        self.__layer      = layer
+        self.__params     = params
+        self.__nodeId     = nodeId
+        self.__queued     = 0
+        self.__bodySize   = bodySize
+        self.__tagCache   = ReplayCache(REPLAY_CAPACITY, REPLAY_EPOCH, simulation.now)
+        self.__decoyPool  = None
+        self.__simulation = simulation
+        self.__random     = workerStream(nodeId)
+
+        # Generate key pair.
+        self.__secretKey = params.group.gensecret() if secretKey is None else secretKey
+        self.__publicKey = params.group.expon(params.group.g, [ self.__secretKey ])
+
+        simulation.register(nodeId, self)
+
+    # Export minimal node PKI info in a dict.
+    def toPKIView(self,) -> dict:
+        node              = dict()
+        node['port'     ] = self.__port
+        node['layer'    ] = self.__layer
+        node['nodeId'   ] = self.__nodeId
+        node['publicKey'] = self.__publicKey.export().hex()
+
+        return node
+
+    # Counters of the replay tag cache.
+    def replayStats(self,) -> dict:
+        return self.__tagCache.stats()
+
+    def setPKI(self, pki : CompiledPKI):
+        self.__pki = pki
+
+    def setDecoyPool(self, decoyPool : DecoyPool):
+        self.__decoyPool = decoyPool
+
+    # Mixes emit LOOP_MIX decoy traffic, providers only relay packets.
+    def start(self,):
+        if self.__layer != 0:
+            self.__simulation.schedule(self.__random.exponential(self.__simulation.lambdas['LOOP_MIX']), self.__loopMix)
+
+    # Processes a single Sphinx packet.
+    def receive(self, data : bytes):
+        tag, flag, routing = unwrapPacket(self.__params, self.__secretKey, data)
+
+        # Check for tagging and replay attacks.
+        if self.__tagCache.seen(tag, self.__simulation.now):
+            print('REPLAY ATTACK')
+            return
+
+        if flag == Relay_flag:
+            delay      = routing[2]
+            queueTuple = (routing[0], routing[1], routing[3], routing[4], routing[5])
+
+            self.__simulation.schedule(delay, self.__relay, queueTuple)
+
+            self.__k      += 1
+            self.__queued += 1
+
+        elif flag == Dest_flag:
+            destination = routing[0]
+            msgId       = routing[1]
+            split       = routing[2]
+            ofType      = routing[3]
+            now         = self.__simulation.now
+
+            # Log packet delivery.
+            logEvent(now, self.__nodeId, destination, msgId, split, ofType)
+
+            # Inform the optimizer that a LEGIT packet is ready for the delivery to a user.
+            if ofType == 'LEGIT':
+                self.__simulation.report((msgId, "{:.7f}".format(now)))
+
+    # Send a relayed packet once its delay passed and update the entropy of the mix.
+    def __relay(self, data : tuple):
+        self.__queued -= 1
+
+        self.__send(data)
+
+        if self.__k != 0 or self.__l != 0:
+            h_t = updateEntropy(self.__h, self.__k, self.__l)
+
+            # Inform the optimizer about the current entropy level.
+            self.__simulation.report((self.__nodeId, h_t))
+
+            self.__h = h_t
+            self.__l = self.__queued
+            self.__k = 0
+
+    def __loopMix(self,):
+        data = None
+
+        if self.__decoyPool is not None:
+            data = self.__decoyPool.pop(self.__nodeId, 'LOOP_MIX')
+
+        # No pool or no pre-generated packet ready.
+        if data is None:
+            data = generateMessage(self.__pki,
+                                   self.__nodeId,
+                                   'LOOP_MIX',
+                                   self.__params,
+                                   self.__bodySize,
+                                   self.__bodySize,
+                                   self.__simulation.lambdas['DELAY'],
+                                   random=self.__random)[0]
+
+        self.__send(data)
+
+        # Sample the sending time of next LOOP_MIX decoy message.
+        self.__simulation.schedule(self.__random.exponential(self.__simulation.lambdas['LOOP_MIX']), self.__loopMix)
+
+    def __send(self, data : tuple):
+        packet   = data[0]
+        nextNode = data[1]
+        msgId    = data[2]
+        split    = data[3]
+        ofType   = data[4]
+
+        self.__simulation.deliver(nextNode, packet)
+
+        # Logging.
+        now = self.__simulation.now
+
+        logEvent(now, self.__nodeId, nextNode, msgId, split, ofType)
+
+# Discrete-event counterpart of Client. Arguments are the same as in Client, except:
+# providerId - ID of the user's provider.
+# simulation - the Simulation that runs the client.
+class SimClient:
+
+    def __init__(self,
+                 userId       : str,
+                 bodySize     : int,
+                 rawMails     : list,
+                 providerId   : str,
+                 msgGenerator : Callable,
+                 decoyPool    : DecoyPool,
+                 simulation   : Simulation):
+        self.__userId       = userId
+        self.__bodySize     = bodySize
+        self.__rawMails     = rawMails
+        self.__decoyPool    = decoyPool
+        self.__providerId   = providerId
+        self.__simulation   = simulation
+        self.__msgGenerator = msgGenerator
+        self.__messageQueue = deque()
+        self.__random       = workerStream(userId)
+
+    # Schedule the LEGIT emails after the initial LEGIT_LAG and the first packet of each type.
+    def start(self,):
+        for mail in self.__rawMails:
+            self.schedule(mail)
+
+        for ofType in ['DROP', 'LOOP', 'LEGIT']:
+            self.__simulation.schedule(self.__random.exponential(self.__simulation.lambdas[ofType]), self.__emit, ofType)
+
+    # Schedule a LEGIT email, relative to the start of the simulation.
+    def schedule(self, mail : dict):
+        delay = self.__simulation.start + mail['time'] + LEGIT_LAG - self.__simulation.now
+
+        self.__simulation.schedule(max(0., delay), self.__encode, mail)
+
+    # Convert the due LEGIT mail to Sphinx packets and put them on the sending queue.
+    def __encode(self, mail : dict):
+        splits = self.__msgGenerator(self.__userId,
+                                     'LEGIT',
+                                     mail['size'],
+                                     self.__simulation.lambdas['DELAY'],
+                                     mail['receiver'],
+                                     random=self.__random)
+
+        for split in splits:
+            self.__messageQueue.append(split + (len(splits), ))
+
+    # Timer of the given type fired, send a packet and reset the timer.
+    def __emit(self, updateType : str):
+        legitSend = updateType == 'LEGIT' and len(self.__messageQueue) > 0
+
+        # Send a LEGIT message if there is one, a DROP packet in its place otherwise.
+        if legitSend:
+            data = self.__messageQueue.popleft()
+        elif updateType == 'LEGIT':
+            data = self.__decoy('DROP')
+        else:
+            data = self.__decoy(updateType)
+
+        # Unpack the data for sending.
+        packet   = data[0]
+        nextNode = data[1]
+        msgId    = data[2]
+        split    = data[3]
+        ofType   = data[4]
+
+        self.__simulation.deliver(self.__providerId, packet)
+
+        # Logging.
+        now = self.__simulation.now
+
+        logEvent(now, self.__userId, nextNode, msgId, split, ofType)
+
+        # When LEGIT message was sent inform the optimizer about it.
+        if legitSend:
+            self.__simulation.report((msgId, "{:.7f}".format(now), data[5]))
+
+        # Reset the timer for a given message type.
+        self.__simulation.schedule(self.__random.exponential(self.__simulation.lambdas[updateType]), self.__emit, updateType)
+
+    # Take a pre-generated decoy packet from the pool, generate it on a miss.
+    def __decoy(self, ofType : str) -> tuple:
+        data = None
+
+        if self.__decoyPool is not None:
+            data = self.__decoyPool.pop(self.__userId, ofType)
+
+        if data is None:
+            data = self.__msgGenerator(self.__userId, ofType, self.__bodySize, self.__simulation.lambdas['DELAY'], None, random=self.__random)[0]
+
+        return data
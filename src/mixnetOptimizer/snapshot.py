@@ -0,0 +1,89 @@
+from os                     import stat
+from json                   import dump
+from json                   import load
+from numpy                  import array
+from numpy                  import ndarray
+from traces                 import TraceSummary
+from petlib.bn              import Bn
+from sphinxmix.SphinxParams import SphinxParams
+
+"""
+Snapshots of a mixnet's setup for warm starts. A snapshot holds what createMixnet draws at random or
+derives from a full pass over the traces before the mixnet starts: the nodes' secret keys and their
+PKI, the assignment of the users to the providers, the summary of the traces and the sizes of the
+Sphinx parameters. A run that loads a snapshot skips the key generation and the scan of the traces,
+and its nodes and users are set up exactly as in the run that saved it.
+A snapshot holds the nodes' secret keys, it should be kept with the experiment's data.
+"""
+
+"""
+PRIVATE
+"""
+
+# Size and modification time of the traces file, a changed file invalidates the snapshot.
+def __fingerprint(tracesFile : str) -> list:
+    info = stat(tracesFile)
+
+    return [info.st_size, info.st_mtime_ns]
+
+"""
+PUBLIC
+"""
+
+# Write a snapshot.
+# path      - the snapshot file, JSON.
+# config    - dictionary, the arguments of createMixnet the setup depends on: layers, bodySize,
+#             providers, nodesPerLayer, tracesFile and horizon.
+# params    - an instance of SphinxParams object of the experiment.
+# secrets   - dictionary, maps node ID to its secret key.
+# pki       - dictionary, maps node ID to its PKI info, as exported by the nodes.
+# traces    - the summary of the traces.
+# providers - integer array, the provider index of each user, in the order of traces.userIds.
+def saveSnapshot(path      : str,
+                 config    : dict,
+                 params    : SphinxParams,
+                 secrets   : dict,
+                 pki       : dict,
+                 traces    : TraceSummary,
+                 providers : ndarray):
+
+    snapshot                = dict()
+    snapshot['config'     ] = config
+    snapshot['fingerprint'] = __fingerprint(config['tracesFile'])
+    snapshot['sphinx'     ] = { 'bodyLen' : params.m, 'headerLen' : params.max_len }
+    snapshot['secrets'    ] = dict([(nodeId, secretKey.hex()) for nodeId, secretKey in secrets.items()])
+    snapshot['pki'        ] = pki
+    snapshot['providers'  ] = providers.tolist()
+    snapshot['traces'     ] = { 'mails'    : traces.mails,
+                                'senders'  : traces.senders,
+                                'userIds'  : traces.userIds,
+                                'lastTime' : traces.lastTime }
+
+    with open(path, 'w', encoding='utf-8') as file:
+        dump(snapshot, file)
+
+# Read a snapshot written by saveSnapshot. Raises ValueError when it was saved with another config or
+# the traces file changed since.
+# return - tuple of the SphinxParams, the secret keys (node ID to Bn), the summary of the traces and
+#          the provider index of each user. The PKI is rebuilt from the keys, the nodes' ports depend
+#          on the run, the saved one documents the topology.
+def loadSnapshot(path : str, config : dict) -> tuple:
+    with open(path, 'r', encoding='utf-8') as file:
+        snapshot = load(file)
+
+    if snapshot['config'] != config:
+        raise ValueError('snapshot ' + path + ' was saved with another config: ' + str(snapshot['config']))
+
+    if snapshot['fingerprint'] != __fingerprint(config['tracesFile']):
+        raise ValueError('traces file changed since snapshot ' + path + ' was saved')
+
+    params  = SphinxParams(body_len=snapshot['sphinx']['bodyLen'], header_len=snapshot['sphinx']['headerLen'])
+    secrets = dict([(nodeId, Bn.from_hex(secretKey)) for nodeId, secretKey in snapshot['secrets'].items()])
+
+    traces          = TraceSummary()
+    traces.mails    = snapshot['traces']['mails']
+    traces.senders  = snapshot['traces']['senders']
+    traces.userIds  = snapshot['traces']['userIds']
+    traces.lastTime = snapshot['traces']['lastTime']
+
+    return params, secrets, traces, array(snapshot['providers'])
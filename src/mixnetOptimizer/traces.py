@@ -0,0 +1,276 @@
+from re        import compile
+from json      import loads
+from numpy     import load
+from numpy     import save
+from numpy     import diff
+from numpy     import array
+from numpy     import dtype
+from numpy     import unique
+from numpy     import argsort
+from numpy     import searchsorted
+from json      import JSONDecoder
+from json      import JSONDecodeError
+from time      import time
+from typing    import Iterator
+from threading import Event
+from itertools import takewhile
+from constants import LEGIT_LAG
+from constants import TRACE_ROWS
+from constants import TRACE_CHUNK
+from constants import TRACE_LOOKAHEAD
+from numpy.lib.format import open_memmap
+
+"""
+Streaming ingestion of the traces files. A traces file is never loaded whole: a single streaming pass
+collects what the mixnet needs before it starts (the users and the number of mails), then the mails
+are read again lazily and handed to their senders' clients shortly before they are due. The memory
+grows with the number of users and the mails within the lookahead window, not with the file size.
+
+Supported formats:
+    - .json - a JSON array of email objects, parsed incrementally.
+    - .ndjson or .jsonl - one email object per line.
+    - .npy - compact binary format, see convertTraces. Memory-mapped, so there is nothing to parse.
+The email objects must be ordered by time.
+"""
+
+# Row of the binary format. The sender and the receiver are indices into the sorted user IDs, kept
+# in a separate file next to the mails, see usersFile.
+MAIL_DTYPE = dtype([('time', '<f8'), ('sender', '<u4'), ('receiver', '<u4'), ('size', '<u4')])
+
+"""
+PRIVATE
+"""
+
+__WHITESPACE = compile(r'[ \t\n\r]*')
+
+# Iterate over the elements of a JSON array read in chunks. The elements are objects, so an element
+# cut by the end of a chunk never decodes, it is decoded again once the next chunk arrives.
+def __readArray(path : str, chunkSize : int) -> Iterator[dict]:
+    decoder = JSONDecoder()
+    buffer  = ''
+    start   = 0
+    opened  = False
+
+    with open(path, 'r', encoding='utf-8') as file:
+        while True:
+            chunk  = file.read(chunkSize)
+            buffer = buffer[start:] + chunk
+            start  = 0
+
+            while True:
+                start = __WHITESPACE.match(buffer, start).end()
+
+                if start == len(buffer):
+                    break
+
+                if not opened:
+                    if buffer[start] != '[':
+                        raise ValueError('traces file is not a JSON array: ' + path)
+
+                    opened = True
+                    start += 1
+
+                elif buffer[start] == ',':
+                    start += 1
+
+                elif buffer[start] == ']':
+                    return
+
+                else:
+                    try:
+                        mail, start = decoder.raw_decode(buffer, start)
+                    except JSONDecodeError:
+                        if chunk == '':
+                            raise
+
+                        break
+
+                    yield mail
+
+            if chunk == '':
+                raise ValueError('unterminated JSON array: ' + path)
+
+def __readLines(path : str) -> Iterator[dict]:
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip():
+                yield loads(line)
+
+# Rebuild the email objects of the binary format. Rows are converted a block at a time, so the
+# memory-mapped pages are touched only once the feeder gets to them.
+def __readBinary(path : str, rows : int) -> Iterator[dict]:
+    mails, userIds = loadBinaryTraces(path)
+
+    for start in range(0, len(mails), rows):
+        block = mails[start:start + rows]
+
+        for sentAt, sender, receiver, size in zip(block['time'    ].tolist(), 
+                                                  block['sender'  ].tolist(), 
+                                                  block['receiver'].tolist(), 
+                                                  block['size'    ].tolist()):
+            yield { 'time' : sentAt, 'sender' : userIds[sender], 'receiver' : userIds[receiver], 'size' : size }
+
+# Vectorized summary of the binary format.
+def __scanBinary(path : str, summary : 'TraceSummary', horizon : float) -> 'TraceSummary':
+    mails, userIds = loadBinaryTraces(path)
+
+    if (diff(mails['time']) < 0).any():
+        raise ValueError('traces must be ordered by time: ' + path)
+
+    if horizon is not None:
+        mails = mails[:searchsorted(mails['time'], horizon, side='right')]
+
+    if len(mails) == 0:
+        return summary
+
+    senders, first, counts = unique(mails['sender'], return_index=True, return_counts=True)
+
+    summary.mails    = len(mails)
+    summary.lastTime = float(mails['time'][-1])
+    summary.userIds  = userIds
+
+    # Keep the senders in the order of their first mail, as for the text formats.
+    for idx in argsort(first, kind='stable'):
+        summary.senders[userIds[senders[idx]]] = int(counts[idx])
+
+    return summary
+
+"""
+PUBLIC
+"""
+
+# Check whether the traces file is in one of the supported formats.
+def isTracesFile(path : str) -> bool:
+    return path.endswith('.json') or path.endswith('.ndjson') or path.endswith('.jsonl') or path.endswith('.npy')
+
+# Path of the file with the sorted user IDs of a binary traces file.
+def usersFile(path : str) -> str:
+    return path[:-len('.npy')] + '.users.npy'
+
+# Memory-map the mails of a binary traces file.
+# return - the structured array of mails (MAIL_DTYPE) and the list of user IDs its indices refer to.
+def loadBinaryTraces(path : str) -> tuple:
+    return load(path, mmap_mode='r'), load(usersFile(path)).tolist()
+
+# Convert a text traces file (JSON or NDJSON) to the binary format in two streaming passes: the
+# first one interns the user IDs, the second one writes the mails straight to a memory-mapped file.
+# target - path of the binary traces file, ends with .npy.
+def convertTraces(source : str, target : str):
+    assert target.endswith('.npy')
+
+    summary = scanTraces(source)
+    index   = dict([(userId, idx) for idx, userId in enumerate(summary.userIds)])
+    mails   = open_memmap(target, mode='w+', dtype=MAIL_DTYPE, shape=(summary.mails, ))
+
+    for row, mail in enumerate(readTraces(source)):
+        mails[row] = (mail['time'], index[mail['sender']], index[mail['receiver']], mail['size'])
+
+    mails.flush()
+
+    save(usersFile(target), array(summary.userIds))
+
+# Iterate over the email objects of a traces file, see the module description for the formats.
+# chunkSize - the number of characters read at once from a JSON array.
+# horizon   - only the mails sent until this time are read, all of them when None.
+def readTraces(path : str, chunkSize : int = TRACE_CHUNK, horizon : float = None) -> Iterator[dict]:
+    if path.endswith('.npy'):
+        mails = __readBinary(path, TRACE_ROWS)
+    elif path.endswith('.json'):
+        mails = __readArray(path, chunkSize)
+    else:
+        mails = __readLines(path)
+
+    # The mails are ordered by time, the file is not read past the horizon.
+    if horizon is not None:
+        mails = takewhile(lambda mail : mail['time'] <= horizon, mails)
+
+    return mails
+
+# The information about the traces needed before the mixnet starts.
+class TraceSummary:
+
+    # mails    - the number of mails.
+    # senders  - dictionary, maps the user ID of each sender to the number of its mails, in the order
+    #            of the first mail.
+    # userIds  - sorted IDs of all the senders and receivers.
+    # lastTime - the time of the last mail.
+    def __init__(self,):
+        self.mails    = 0
+        self.senders  = dict()
+        self.userIds  = []
+        self.lastTime = 0.
+
+# Collect the summary of a traces file in a single streaming pass.
+# horizon - only the mails sent until this time are considered, all of them when None.
+def scanTraces(path : str, horizon : float = None) -> TraceSummary:
+    summary = TraceSummary()
+    userIds = set()
+
+    if path.endswith('.npy'):
+        return __scanBinary(path, summary, horizon)
+
+    for mail in readTraces(path, horizon=horizon):
+        if mail['time'] < summary.lastTime:
+            raise ValueError('traces must be ordered by time: ' + path)
+
+        summary.mails    += 1
+        summary.lastTime  = mail['time']
+
+        summary.senders[mail['sender']] = summary.senders.get(mail['sender'], 0) + 1
+
+        userIds.add(mail['sender'])
+        userIds.add(mail['receiver'])
+
+    summary.userIds = sorted(userIds)
+
+    return summary
+
+# Hands the mails of a traces file to the clients of their senders lookahead seconds before they are
+# due. A client takes the mail with its schedule method.
+class TraceFeeder:
+
+    # clients   - dictionary, maps user ID to its client. The mails of the senders without a client are
+    #             skipped, they are fed by the shards running them.
+    # lookahead - seconds before the sending time at which a mail is handed to its client.
+    # horizon   - only the mails sent until this time are handed over, all of them when None.
+    def __init__(self, path : str, clients : dict, lookahead : float = TRACE_LOOKAHEAD, horizon : float = None):
+        self.__mails     = readTraces(path, horizon=horizon)
+        self.__next      = next(self.__mails, None)
+        self.__clients   = clients
+        self.__lookahead = lookahead
+
+    # Hand over all the mails due until the given time, in seconds since the clients started.
+    # return - the due time of the next mail, None when all the mails were handed over.
+    def feed(self, until : float) -> float:
+        while self.__next is not None and self.__next['time'] + LEGIT_LAG <= until:
+            client = self.__clients.get(self.__next['sender'])
+
+            # The sender runs in another shard.
+            if client is not None:
+                client.schedule(self.__next)
+
+            self.__next = next(self.__mails, None)
+
+        return None if self.__next is None else self.__next['time'] + LEGIT_LAG
+
+    # Worker of the socket engines. Feeds the mails on the wall clock until all of them are handed
+    # over or the mixnet shuts down.
+    # start - epoch time at which the clients started.
+    def run(self, start : float, shutdown : Event):
+        while not shutdown.is_set():
+            due = self.feed(time() - start + self.__lookahead)
+
+            if due is None:
+                break
+
+            shutdown.wait(start + due - self.__lookahead - time())
+
+    # Feed the mails on the virtual clock of the discrete-event simulation. The feeder wakes up at the
+    # virtual time of the next mail and feeds up to its due time, not to the time read back from the
+    # clock, which may round below it.
+    # until - the due time the feeder was scheduled for, in seconds since the start.
+    def simulate(self, simulation, until : float = 0.):
+        due = self.feed(max(until, simulation.now - simulation.start + self.__lookahead))
+
+        if due is not None:
+            simulation.scheduleAt(simulation.start + due - self.__lookahead, self.simulate, simulation, due)
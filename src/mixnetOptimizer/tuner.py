@@ -0,0 +1,55 @@
+from json      import dump
+from search    import successiveHalving
+from argparse  import ArgumentParser
+
+"""
+Searches the mixnet parameters. Writes all the results and the Pareto front of latency against mean
+entropy to a JSON file.
+"""
+
+if __name__ == "__main__":
+    
+    # Get command line arguments.
+    parser = ArgumentParser()
+
+    parser.add_argument('--layers',         type=int, default=2)
+    parser.add_argument('--bodySize',       type=int, default=1024)
+    parser.add_argument('--providers',      type=int, default=2)
+    parser.add_argument('--tracesFile',     type=str, default="../../data/sample.json")
+    parser.add_argument('--nodesPerLayer',  type=int, default=2)
+    parser.add_argument('--decoyWorkers',   type=int, default=0)
+    parser.add_argument('--encoderWorkers', type=int, default=0)
+    parser.add_argument('--engine',         type=str, default='simulation', choices=['threaded', 'asyncio', 'simulation'])
+    parser.add_argument('--configurations', type=int, default=27)
+    parser.add_argument('--eta',            type=int, default=3)
+    parser.add_argument('--rungs',          type=int, default=3)
+    parser.add_argument('--workers',        type=int, default=4)
+    parser.add_argument('--seed',           type=int, default=None)
+    parser.add_argument('--logDir',         type=str, default="../../logs/search")
+    parser.add_argument('--timeout',        type=float, default=3600.)
+    parser.add_argument('--output',         type=str, default="../../logs/search.json")
+
+    args   = parser.parse_args()
+    mixnet = { 'layers'         : args.layers,
+               'bodySize'       : args.bodySize,
+               'providers'      : args.providers,
+               'nodesPerLayer'  : args.nodesPerLayer,
+               'decoyWorkers'   : args.decoyWorkers,
+               'encoderWorkers' : args.encoderWorkers,
+               'engine'         : args.engine }
+
+    search = successiveHalving(args.tracesFile, 
+                               mixnet, 
+                               args.configurations, 
+                               args.eta, 
+                               args.rungs, 
+                               args.workers, 
+                               args.seed, 
+                               args.logDir,
+                               timeout=args.timeout)
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        dump(search, file, indent=4)
+
+    for result in search['front']:
+        print('latency:', result['latency'], 'entropy:', result['entropy'], 'lambdas:', result['lambdas'])
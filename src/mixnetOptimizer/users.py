@@ -0,0 +1,32 @@
+from numpy           import ndarray
+from collections.abc import Mapping
+
+# Assignment of the users to their providers. The user IDs are interned: each user is an index into
+# the sorted user IDs and the provider of every user is kept in a single integer array, instead of a
+# provider ID string per user. It behaves as a read-only mapping from user ID to its provider ID, so
+# it replaces the users dictionary everywhere. It is picklable, so it can be passed to the worker
+# processes.
+class ProviderMap(Mapping):
+
+    # userIds   - sorted IDs of all the users, 'u' followed by 6 digit ID string.
+    # providers - integer array, the provider index of each user, in the order of userIds.
+    def __init__(self, userIds : list, providers : ndarray):
+        self.__index     = dict([(userId, idx) for idx, userId in enumerate(userIds)])
+        self.__providers = providers
+
+        # Provider ID - 'p' followed by 6 digit ID string. There are only a few providers, their IDs
+        # are formatted once.
+        self.__providerIds = ["p{:06d}".format(idx) for idx in range(int(providers.max(initial=0)) + 1)]
+
+    def __getitem__(self, userId : str) -> str:
+        return self.__providerIds[self.__providers[self.__index[userId]]]
+
+    def __iter__(self,):
+        return iter(self.__index)
+
+    def __len__(self,) -> int:
+        return len(self.__index)
+
+    # Interned index of the user.
+    def index(self, userId : str) -> int:
+        return self.__index[userId]
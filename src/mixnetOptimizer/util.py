@@ -1,46 +1,33 @@
+from pki                    import CompiledPKI
 from bson                   import ObjectId
 from numpy                  import ceil
-from socket                 import socket
-from socket                 import AF_INET
-from socket                 import SOCK_STREAM
-from petlib.bn              import Bn
-from petlib.ec              import EcPt
-from petlib.ec              import EcGroup
+from numpy                  import log2
+from randomness             import RandomStream
+from randomness             import threadStream
 from constants              import TYPE_TO_ID
-from constants              import ALL_CHARACTERS
-from numpy.random           import choice
-from numpy.random           import exponential
+from constants              import ID_TO_TYPE
+from petlib.pack            import encode
+from petlib.pack            import decode
+from connections            import ConnectionPool
+from sphinxmix.SphinxNode   import sphinx_process
 from sphinxmix.SphinxParams import SphinxParams
 from sphinxmix.SphinxClient import Nenc
-from sphinxmix.SphinxClient import rand_subset
+from sphinxmix.SphinxClient import PFdecode
+from sphinxmix.SphinxClient import Dest_flag
+from sphinxmix.SphinxClient import Relay_flag
 from sphinxmix.SphinxClient import pack_message
+from sphinxmix.SphinxClient import unpack_message
+from sphinxmix.SphinxClient import receive_forward
 from sphinxmix.SphinxClient import create_forward_message
 
 """
 PRIVATE
 """
 
-# Construct random plaintext out of the available characters of required size.
-def __randomPlaintext(size : int) -> bytes:
-    return bytes(''.join(list(choice(ALL_CHARACTERS, size))), encoding='utf-8')
+__state = dict()
 
-# Convert a hex saved public key in the PKI into petlib public key object.
-def __publicKeyFromPKI(publicKey : str) -> EcPt:
-    return EcPt(EcGroup()).from_binary(Bn.from_hex(publicKey).binary(), EcGroup())
-
-# Convert a PKI dictionary into a dictionary of dictionaries in which each mixnet layer 
-# is a separate dictionary of mixes' PKI information. Used for sampling a path - selecting one mix 
-# per layer.
-def __pkiToPerLayerPKI(pki : dict) -> dict:
-    perLayerPKI = dict()
-
-    for nodeId, nodePKI in pki.items():
-        if nodePKI['layer'] not in perLayerPKI:
-            perLayerPKI[nodePKI['layer']] = dict()
-
-        perLayerPKI[nodePKI['layer']][nodeId] = nodePKI
-
-    return perLayerPKI
+# Persistent connections to the next hops shared by all the senders in the process.
+__connections = ConnectionPool()
 
 # Generates a single Sphinx packet of a given type and size.
 # split       - ordinal number for reordering purposes in string format (5 digit string <#####>).
@@ -52,12 +39,11 @@ def __pkiToPerLayerPKI(pki : dict) -> dict:
 # size        - number of plaintext bytes, should be different than default only if the message 
 #               is of LEGIT type.
 # delayMean   - Mean packet delay, mixnet parameter.
-# pki         - dictionary maps node ID (mix or provider) to its PKI info (listening port, public 
-#               key, layer).
+# pki         - CompiledPKI, holds decoded public keys, per-layer node IDs and listening ports.
 # users       - dictionary, maps user ID to its provider ID.
-# perLayerPKI - pki dictionary converted via __pkiToPerLayerPKI method.
 # params      - an instance of SphinxParams object that defines the sphinx packet size, its header 
 #               and plaintext
+# random      - RandomStream of the sender, it samples the path, the delays and the plaintext.
 # return      - Tuple of Sphinx packet with information for logging:
 #                   - packet.
 #                   - next Node to which packet should be forwarded.
@@ -72,22 +58,22 @@ def __genPckt(split       : str,
               messageId   : str,
               size        : int,
               delayMean   : float,
-              pki         : dict,
+              pki         : CompiledPKI,
               users       : dict,
-              perLayerPKI : dict,
-              params      : SphinxParams) -> tuple :
+              params      : SphinxParams,
+              random      : RandomStream) -> tuple :
 
     if ofType == 'LOOP_MIX':
-        layer = pki[sender]['layer']
+        layer = pki.layer(sender)
         path  = []
 
         # Randomly sample one mix per each layer supersisiding mix layer.
-        for nextLayer in range(layer + 1, len(perLayerPKI)):
-            path += rand_subset(perLayerPKI[nextLayer], 1)
+        for nextLayer in range(layer + 1, pki.numLayers):
+            path += [pki.sampleNode(nextLayer, random)]
 
         # Randomly sample a provider and one mix per each layer preceding mix layer.
         for nextLayer in range(layer):
-            path += rand_subset(perLayerPKI[nextLayer], 1)
+            path += [pki.sampleNode(nextLayer, random)]
 
         # Message should return back to sending mix.
         path        += [sender]
@@ -97,8 +83,8 @@ def __genPckt(split       : str,
         path           = []
 
         # Sample random path through mix (one mix per each layer).
-        for layer in range(1, len(perLayerPKI)):
-            path += rand_subset(perLayerPKI[layer], 1)
+        for layer in range(1, pki.numLayers):
+            path += [pki.sampleNode(layer, random)]
 
         if ofType == 'LEGIT':
             destination      = bytes(receiver, encoding='utf-8')
@@ -106,7 +92,7 @@ def __genPckt(split       : str,
         elif ofType == 'DROP':
 
             # Sample a random provider and direct the DROP message to it.
-            receiverProvider = rand_subset(perLayerPKI[0], 1)[0]
+            receiverProvider = pki.sampleNode(0, random)
             destination      = bytes(receiverProvider, encoding='utf-8')
         elif ofType == 'LOOP':
 
@@ -116,15 +102,15 @@ def __genPckt(split       : str,
 
         path = [senderProvider] + path + [receiverProvider]
 
-    keys        = [__publicKeyFromPKI(pki[nodeId]['publicKey']) for nodeId in path]
+    keys        = pki.publicKeys(path)
     destination = (destination, messageId, split, TYPE_TO_ID[ofType])
     nencWrapper = lambda dest, delay: Nenc((dest, delay, messageId, split, TYPE_TO_ID[ofType]))
 
     # Add routing information for each mix, sample delays.
-    routing = [nencWrapper(dest, exponential(delayMean)) for dest in path]
+    routing = [nencWrapper(dest, random.exponential(delayMean)) for dest in path]
 
-    # Instantiate random message.
-    message = __randomPlaintext(size) 
+    # Instantiate random message out of the available characters.
+    message = random.plaintext(size)
     
     header, delta = create_forward_message(params, routing, keys, destination, message)
     packed        = pack_message(params, (header, delta))
@@ -135,12 +121,31 @@ def __genPckt(split       : str,
 PUBLIC
 """
 
+# Sphinx parameters of an experiment - the size of the packet header grows with the number of layers,
+# the body holds bodySize bytes of plaintext.
+def sphinxParams(layers : int, bodySize : int) -> SphinxParams:
+    if bodySize < 65536:
+        addBody = 63
+    else:
+        addBody = 65
+
+    return SphinxParams(body_len=bodySize + addBody, header_len=71 * layers + 108)
+
+# The layer and the ID of every node of a mixnet. Provider IDs are 'p' and mix IDs 'm', followed by 6 
+# digit ID string. Mix IDs do not start at 0, they follow provider numeration. Node IDs define 
+# listening ports, so overall node ID configuration avoids port collisions.
+def nodeIds(layers : int, providers : int, nodesPerLayer : int) -> list:
+    nodes  = [(0, "p{:06d}".format(provider)) for provider in range(providers)]
+    nodes += [(layer, "m{:06d}".format((layer - 1) * nodesPerLayer + node + providers)) for layer in range(1, layers + 1) for node in range(nodesPerLayer)]
+
+    return nodes
+
 # Instantiates random message of a given type and converts it to a set of Sphinx packets ready for 
 # sending through a mix network. Responsible for splitting a message into chunks. All chunks/splits 
 # of the same message have the same message ID, message ID together with split number must be used 
 # to identify a packet uniquely sole message ID is not enough.
-# pki       - dictionary maps node ID (mix or provider) to its PKI info (listening port, public key, 
-#             layer).
+# pki       - CompiledPKI, compiled once from the PKI dictionary that maps node ID (mix or provider)
+#             to its PKI info (listening port, public key, layer).
 # sender    - ID of sending entity either a user (u<######>) or mix (m<######>). mix accepted only 
 #             when a packet is of LOOP_MIX type.
 # ofType    - enum, 'LEGIT', 'DROP', 'LOOP' or 'LOOP_MIX'.
@@ -153,6 +158,7 @@ PUBLIC
 # users     - dictionary, maps user ID to its provider ID.
 # receiver  - ID of receiving entity, only valid for LEGIT traffic, a user (u<######>). For other 
 #             types of the receiver is implicitly defined.
+# random    - RandomStream of the sender, None uses the stream of the calling thread.
 # return    - a list of packets with logging data. If the size of the message is larger than 
 #             MAX_BODY then it is split. Each split is encapsulated in a separate Sphinx packet. 
 #             Thus, return a message as a set of packets. When the type of the message is different 
@@ -164,7 +170,7 @@ PUBLIC
 #                 - split - ordinal number for reordering the purpose in string format (5 digit 
 #                   string <#####>).
 #                 - type of message.
-def generateMessage(pki       : dict,
+def generateMessage(pki       : CompiledPKI,
                     sender    : str, 
                     ofType    : str,
                     params    : SphinxParams,
@@ -172,7 +178,8 @@ def generateMessage(pki       : dict,
                     maxSize   : int,
                     delayMean : float,
                     users     : dict = None,
-                    receiver  : str  = None) -> list:
+                    receiver  : str  = None,
+                    random    : RandomStream = None) -> list:
 
     # Ensure constraints are satisfied.
     assert  ofType in ['LEGIT', 'DROP', 'LOOP', 'LOOP_MIX']
@@ -181,33 +188,128 @@ def generateMessage(pki       : dict,
     assert (ofType != 'LOOP_MIX' and users     is not None   ) or (ofType == 'LOOP_MIX' and users     is None)
     assert (ofType != 'LOOP_MIX' and sender[0] ==     'u'    ) or (ofType == 'LOOP_MIX' and sender[0] == 'm' )
     
-    msgId      = str(ObjectId())
-    splits     = []
-    layers     = __pkiToPerLayerPKI(pki)
-    numSplits  = int(ceil(size / maxSize))
-
-    # x - split     - ordinal number for reordering purposes in string format (5 digit string 
-    #                 <#####>).
-    # y - splitSize - integer, the byte size of the packet to generate.
-    wrapper = lambda x, y : __genPckt(x, sender, ofType, receiver, msgId, y, delayMean, pki, users, layers, params)
-    
-    for split in range(numSplits):
-        splitSize = maxSize
-        
-        # Only the last packet in a too big message can have a non-default size.
-        if split == numSplits-1:
-            splitSize = size - maxSize * (numSplits-1)
+    msgId  = str(ObjectId())
+    splits = []
 
-        splits += [wrapper("{:05d}".format(split), splitSize)]
+    for split, splitSize in enumerate(splitSizes(size, maxSize)):
+        splits += [generateSplit(pki, sender, ofType, params, split, splitSize, delayMean, msgId, users, receiver, random)]
         
     return splits
 
-def sendPacket(packet : bytes, nextAddress : int):
-    try:
-        with socket(AF_INET, SOCK_STREAM) as client:
-            client.connect(('127.0.0.1', nextAddress))
-            client.sendall(packet)
-            client.close()
-    except:
-        print('ERROR')
-        pass
\ No newline at end of file
+# Sizes of the splits of a message in bytes. Only the last packet in a too big message can have 
+# a non-default size.
+# size    - number of plaintext bytes of the whole message.
+# maxSize - The maximum size of sphinx packet plaintext in bytes. Static for the experiment.
+def splitSizes(size : int, maxSize : int) -> list:
+    numSplits = int(ceil(size / maxSize))
+    sizes     = [maxSize] * numSplits
+
+    if numSplits > 0:
+        sizes[-1] = size - maxSize * (numSplits-1)
+
+    return sizes
+
+# Generates a single split of a message as a Sphinx packet. Used to encode the splits of one message 
+# independently, e.g. in parallel. Arguments are the same as in generateMessage, except:
+# split     - integer, ordinal number of the split in the message.
+# size      - number of plaintext bytes of the split.
+# msgId     - message ID shared by all the splits of a message, string in the pymongo bson 
+#             ObjectId format.
+# return    - a single packet tuple as in generateMessage.
+def generateSplit(pki       : CompiledPKI,
+                  sender    : str,
+                  ofType    : str,
+                  params    : SphinxParams,
+                  split     : int,
+                  size      : int,
+                  delayMean : float,
+                  msgId     : str,
+                  users     : dict = None,
+                  receiver  : str  = None,
+                  random    : RandomStream = None) -> tuple:
+
+    if random is None:
+        random = threadStream()
+
+    return __genPckt("{:05d}".format(split), sender, ofType, receiver, msgId, size, delayMean, pki, users, params, random)
+
+# Unwraps a single layer of a received Sphinx packet. CPU heavy, it does not touch any node state, so 
+# it can run off the I/O thread.
+# params    - an instance of SphinxParams object of the experiment.
+# secretKey - the secret key of the processing node.
+# data      - the packed Sphinx packet.
+# return    - tuple of the packet's replay tag, routing flag and routing information. For Relay_flag,
+#             the routing information is a tuple of:
+#                 - packet packed for the relay.
+#                 - next Node to which packet should be forwarded.
+#                 - delay of the packet in the node in seconds.
+#                 - message ID - string in the pymongo bson ObjectId format.
+#                 - split - ordinal number in string format (5 digit string <#####>).
+#                 - type of message.
+#             For Dest_flag, it is a tuple of the destination ID, message ID, split and type.
+def unwrapPacket(params : SphinxParams, secretKey, data : bytes) -> tuple:
+    unpacked = unpack_message({ (params.max_len, params.m) : params }, data)
+    header   = unpacked[1][0]
+    delta    = unpacked[1][1]
+
+    processed = sphinx_process(params, secretKey, header, delta)
+    tag       = processed[0]
+    routing   = PFdecode(params, processed[1])
+    flag      = routing[0]
+
+    if flag == Relay_flag:
+        packed = pack_message(params, processed[2])
+        info   = (packed, routing[1][0], routing[1][1], routing[1][2], routing[1][3], ID_TO_TYPE[routing[1][4]])
+
+    elif flag == Dest_flag:
+        dest, _ = receive_forward(params, processed[3], processed[2][1])
+        info    = (dest[0].decode('utf-8'), dest[1], dest[2], ID_TO_TYPE[dest[3]])
+
+    return tag, flag, info
+
+# Whether a packet can be unwrapped straight from a memoryview into a receive buffer. Sphinx unpacks
+# the packet with msgpack, through petlib, which reads any buffer and copies the fields it decodes, so
+# nothing refers to the buffer once it is reused. Probed once per process with a round trip of a
+# view, a msgpack without buffer support makes the nodes copy the frames into bytes instead.
+def unpacksViews() -> bool:
+    if 'unpacksViews' not in __state:
+        probe = [b'probe', 'probe']
+
+        try:
+            __state['unpacksViews'] = decode(memoryview(encode(probe))) == probe
+        except (TypeError, ValueError, BufferError):
+            __state['unpacksViews'] = False
+
+    return __state['unpacksViews']
+
+# One step of the incremental entropy computation of a mix, done on sending a relayed packet.
+# h      - entropy computed at the previous send.
+# k      - the number of packets received since the previous send.
+# l      - the number of packets in the mix queue at the previous send.
+# return - the current entropy of the mix.
+def updateEntropy(h : float, k : int, l : int) -> float:
+    denominator = (k + l)
+    h_t         = l * h / denominator
+
+    if k != 0:
+        h_t += k * log2(k) / denominator
+        h_t -= k / denominator * log2(k / denominator)
+
+    if l != 0:
+        h_t -= l / denominator * log2(l / denominator)
+
+    return float(h_t)
+
+# Send a Sphinx packet as a single frame over a pooled, persistent connection to the next hop. 
+# Returns False when the packet could not be sent and was dropped.
+# nextAddress - the port of the next hop on the local host, or its (host, port) address.
+def sendPacket(packet : bytes, nextAddress) -> bool:
+    return __connections.send(packet, nextAddress)
+
+# Counters of the sent, dropped packets and connection failures of sendPacket.
+def sendStats() -> dict:
+    return __connections.stats()
+
+# Close all the pooled connections.
+def closeConnections():
+    __connections.close()
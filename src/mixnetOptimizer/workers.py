@@ -0,0 +1,103 @@
+from pki                    import CompiledPKI
+from util                   import unwrapPacket
+from util                   import generateSplit
+from util                   import generateMessage
+from randomness             import seedStreams
+from randomness             import workerStream
+from petlib.bn              import Bn
+from sphinxmix.SphinxParams import SphinxParams
+
+"""
+Tasks executed in worker processes. Sphinx parameters and the compiled PKI hold petlib objects that
+can not be pickled, so each worker process rebuilds them once from plain values in initWorker and
+keeps them in the module state.
+"""
+
+"""
+PRIVATE
+"""
+
+__state = dict()
+
+"""
+PUBLIC
+"""
+
+# Initializer of a worker process.
+# pki       - dictionary maps node ID (mix or provider) to its PKI info (listening port, public key,
+#             layer).
+# bodyLen   - body_len of the SphinxParams of the experiment.
+# headerLen - header_len of the SphinxParams of the experiment.
+# bodySize  - the size of plaintext in a mixnet packet in bytes.
+# users     - dictionary, maps user ID to its provider ID.
+# seed      - the seed of the run, the streams of the jobs derive from it.
+def initWorker(pki : dict, bodyLen : int, headerLen : int, bodySize : int, users : dict, seed : int):
+    params = SphinxParams(body_len=bodyLen, header_len=headerLen)
+
+    seedStreams(seed)
+
+    __state['pki'     ] = CompiledPKI(pki, params)
+    __state['users'   ] = users
+    __state['params'  ] = params
+    __state['bodySize'] = bodySize
+
+# Initializer of a worker process that only unwraps packets received by the nodes.
+# bodyLen   - body_len of the SphinxParams of the experiment.
+# headerLen - header_len of the SphinxParams of the experiment.
+def initUnwrapWorker(bodyLen : int, headerLen : int):
+    __state['params'    ] = SphinxParams(body_len=bodyLen, header_len=headerLen)
+    __state['secretKeys'] = dict()
+
+# Unwrap a single layer of a packet received by a node, see util.unwrapPacket.
+# secretKey - the secret key of the node as a hex string. Decoded once per worker process.
+# data      - the packed Sphinx packet.
+def unwrap(secretKey : str, data : bytes) -> tuple:
+    secretKeys = __state['secretKeys']
+
+    if secretKey not in secretKeys:
+        secretKeys[secretKey] = Bn.from_hex(secretKey)
+
+    return unwrapPacket(__state['params'], secretKeys[secretKey], data)
+
+# Generate a batch of decoy packets (DROP, LOOP or LOOP_MIX) of a single sender.
+# count     - the number of packets to generate.
+# delayMean - Mean packet delay, mixnet parameter.
+# job       - key of the job, unique in the run, the packets are drawn from its stream.
+# return    - a list of packets in the format of a single generateMessage split.
+def generateDecoys(sender : str, ofType : str, count : int, delayMean : float, job : str) -> list:
+    pki      = __state['pki']
+    params   = __state['params']
+    random   = workerStream(job)
+    bodySize = __state['bodySize']
+    users    = None if ofType == 'LOOP_MIX' else __state['users']
+    decoys   = []
+
+    for _ in range(count):
+        decoys += generateMessage(pki, sender, ofType, params, bodySize, bodySize, delayMean, users, None, random)
+
+    return decoys
+
+# Encode a single split of a LEGIT message.
+# split     - integer, ordinal number of the split in the message.
+# size      - number of plaintext bytes of the split.
+# msgId     - message ID shared by all the splits of the message.
+# job       - key of the message's job, unique in the run, the split is drawn from its own stream.
+# return    - a single packet in the format of a generateMessage split.
+def encodeSplit(sender    : str,
+                receiver  : str,
+                msgId     : str,
+                split     : int,
+                size      : int,
+                delayMean : float,
+                job       : str) -> tuple:
+    return generateSplit(__state['pki'], 
+                         sender, 
+                         'LEGIT', 
+                         __state['params'], 
+                         split, 
+                         size, 
+                         delayMean, 
+                         msgId, 
+                         __state['users'], 
+                         receiver,
+                         workerStream(job + '/' + str(split)))